@@ -0,0 +1,393 @@
+## @file benchmark.py
+#
+# @brief Benchmark of the engine (core.py) on synthetic fleets, without any display.
+# @brief For each size of the sweep, a fleet of size bikes docked to size / 10 stations (placed on a grid around the warehouse)
+# @brief is generated, then rented size times at random. The operations behind the windows of the application are then timed on
+# @brief it: adding, moving and removing bikes, removing stations, renting, passing a day, the summary, the rentable bikes of a
+# @brief station, the import and export of the JSON files and of the snapshots, the import of a CSV file of new bikes, the
+# @brief flush of the journal and its replay on startup (store in memory only), the maintenance route (tsp.c solver) and the routes
+# @brief of several vans (process pool), and the scrolling and patching of the bike table (only if a display is available).
+# @brief The results (seconds per operation, by operation and size) can be saved as JSON and compared to a saved baseline: the
+# @brief comparison fails if an operation got slower than its threshold allows.
+# @brief     python benchmark.py --output baseline.json
+# @brief     python benchmark.py --baseline baseline.json --sizes 100 10000
+#
+# @section libraries_benchmark Libraries/Modules
+# - argparse
+# - json
+# - math
+# - os
+# - platform
+# - random
+# - shutil
+# - sys
+# - tempfile
+# - time
+# - tkinter (only to time the bike table)
+# - core
+# - fleet
+# - journal
+# - route
+# - widgets (only to time the bike table)
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import core
+from fleet import FleetStore
+import journal
+import route
+
+## @brief Numbers of bikes of the swept fleets
+SIZES = (100, 1000, 10000, 100000, 1000000)
+
+## @brief Number of bikes per station of the generated fleets
+BIKES_PER_STATION = 10
+
+## @brief Number of random rents per bike of the generated fleets
+RENTS_PER_BIKE = 1
+
+## @brief Number of calls timed for the operations on a single record
+REPEAT = 1000
+
+## @brief Largest number of stations given to the route solver (the heuristic stops at its time limit beyond)
+ROUTE_MAX_STATIONS = 2000
+
+## @brief Number of vans sharing the stations of the timed van routes
+VANS = 4
+
+## @brief Number of bikes of the imported CSV file per bike of the fleet
+CSV_BIKES_PER_BIKE = 0.1
+
+## @brief Number of rows of the timed bike table
+TABLE_ROWS = 11
+
+## @brief Largest ratio between a result and its baseline before it is a regression
+THRESHOLD = 1.5
+
+## @brief Thresholds of the operations whose time varies more from a run to another
+THRESHOLDS = {
+    "route": 2.0, # worker threads of the solver
+    "van_routes": 2.0, # worker processes
+    "export_json": 2.0, # file system
+    "export_snapshot": 2.0,
+    "journal_flush": 2.0 # disk syncs
+}
+
+## @brief Time (in seconds) below which the differences are measurement noise
+NOISE_FLOOR = 2e-6
+
+
+## @brief coordinates of stations placed on a square grid centered on the warehouse (which keeps (0, 0))
+def grid_coordinates(count):
+    side = math.ceil(math.sqrt(count + 1))
+    coordinates = []
+    for index in range(side * side):
+        x, y = index % side - side // 2, index // side - side // 2
+        if (x, y) != (0, 0):
+            coordinates.append((x, y))
+            if len(coordinates) == count:
+                break
+    return coordinates
+
+
+## @brief fill a store with a synthetic fleet
+# @param fleet The store (empty)
+# @param nb_stations Number of stations, placed on a grid
+# @param nb_bikes Number of bikes, docked to random stations with a random battery level
+# @param nb_rents Number of rents of random bikes to random stations
+# @param seed Seed of the random generator, the same fleet is generated for the same arguments
+def generate_fleet(fleet, nb_stations, nb_bikes, nb_rents, seed=0):
+    generator = random.Random(seed)
+    fleet.add_stations([(f"station-{index}", f"Station {index}", x, y) for index, (x, y) in enumerate(grid_coordinates(nb_stations))])
+    fleet.add_bikes([(f"bike-{index}", None, generator.randint(0, 100), f"station-{generator.randrange(nb_stations)}") for index in range(nb_bikes)])
+    for rent in range(nb_rents):
+        bike = fleet.get_bike(f"bike-{generator.randrange(nb_bikes)}")
+        battery_used = min(bike["battery_level"], core.BATTERY_PER_MINUTE * generator.randint(1, core.MAX_RENT_TIME // 5))
+        fleet.rent_bike(bike["id"], f"station-{generator.randrange(nb_stations)}", battery_used)
+
+
+## @brief time the calls of a function
+# @param function Function called with each argument
+# @param arguments Arguments of the calls
+# @return Seconds per call
+def time_calls(function, arguments):
+    arguments = list(arguments)
+    start = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return (time.perf_counter() - start) / max(1, len(arguments))
+
+
+## @brief time a function, keeping the best of several runs (for the operations on the whole fleet)
+# @return Seconds per run
+def time_best(function, rounds):
+    best = float("inf")
+    for run in range(rounds):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+## @brief time the journal of a generated fleet: the flush of the lines of single mutations, and the replay of the whole journal
+# as on startup (snapshot then journal)
+# @param nb_stations Number of stations of the fleet
+# @param size Number of bikes of the fleet
+# @param repeat Number of mutations written by the timed flush (at most what a flush writes at once)
+# @param rounds Number of replays, the best is kept
+# @param seed Seed of the random generator
+# @param directory Directory of the journal (removed afterwards)
+# @return Dictionary of the seconds per operation
+def time_journal(nb_stations, size, repeat, rounds, seed, directory):
+    path = os.path.join(directory, f"journal-{size}")
+    results = {}
+    saving = journal.Journal(path)
+    fleet = FleetStore()
+    saving.open(fleet)
+    try:
+        generate_fleet(fleet, nb_stations, size, size * RENTS_PER_BIKE, seed)
+        saving.flush()
+
+        generator = random.Random(seed + 2)
+        lines = min(repeat, journal.BATCH_SIZE - 1) # written by the timed flush only
+        for call in range(lines):
+            fleet.move_bike(f"bike-{generator.randrange(size)}", f"station-{generator.randrange(nb_stations)}")
+        start = time.perf_counter()
+        saving.flush()
+        results["journal_flush"] = (time.perf_counter() - start) / lines
+        saving.close()
+
+        def replay():
+            restored = journal.Journal(path)
+            try:
+                restored.open(FleetStore())
+            finally:
+                restored.close()
+        results["journal_replay"] = time_best(replay, rounds)
+    finally:
+        saving.close()
+        shutil.rmtree(path, ignore_errors=True)
+    return results
+
+
+## @brief time the bike table of the administrator window: scrolling by one row, and patching a changed record
+# @param fleet The store
+# @param repeat Number of scrolls and patches timed
+# @param seed Seed of the random generator
+# @return Dictionary of the seconds per operation, empty if tkinter can't open a window
+def time_table(fleet, repeat, seed):
+    import tkinter as tk # only loaded to time the table
+    from widgets import VirtualTable
+    try:
+        root = tk.Tk()
+    except tk.TclError: # no display
+        return {}
+    results = {}
+    try:
+        root.withdraw()
+        table = VirtualTable(root, headers=["Bike n°", "Battery", "Station"], visible_rows=TABLE_ROWS, widths=[7, 7, 12],
+                             format_row=lambda bike: (bike["number"], bike["battery_level"], fleet.station_name(bike["station_id"])))
+        table.grid(row=0, column=0)
+        table.set_rows(fleet.bikes())
+        root.update_idletasks()
+
+        def scroll(call):
+            table.scroll("scroll", 1 if call % 200 < 100 else -1, "units")
+            root.update_idletasks()
+        results["table_scroll"] = time_calls(scroll, range(repeat))
+
+        # changed records, half of them in the viewport
+        generator = random.Random(seed + 3)
+        bikes = [table.records[table.offset + generator.randrange(min(TABLE_ROWS, len(table.records)))] if call % 2 == 0 else
+                 table.records[generator.randrange(len(table.records))] for call in range(repeat)]
+
+        def patch(bike):
+            table.update_record(bike)
+            root.update_idletasks()
+        results["table_patch"] = time_calls(patch, bikes)
+    finally:
+        root.destroy()
+    return results
+
+
+## @brief time the operations on a fleet of a given size
+# @param size Number of bikes
+# @param database Optional path of a SQLite database (the store is in memory otherwise)
+# @param repeat Number of calls timed for the operations on a single record
+# @param rounds Number of runs of the operations on the whole fleet, the best is kept
+# @param seed Seed of the random generator
+# @param directory Directory of the exported files
+# @return Dictionary of the seconds per operation
+def run_size(size, database=None, repeat=REPEAT, rounds=3, seed=0, directory="."):
+    manager = core.FleetManager(database, directory=None)
+    fleet = manager.fleet
+    nb_stations = max(2, size // BIKES_PER_STATION)
+    generator = random.Random(seed + 1)
+    station_names = [f"Station {generator.randrange(nb_stations)}" for call in range(repeat)]
+    station_ids = [f"station-{generator.randrange(nb_stations)}" for call in range(repeat)]
+    results = {}
+
+    try:
+        start = time.perf_counter()
+        generate_fleet(fleet, nb_stations, size, size * RENTS_PER_BIKE, seed)
+        results["generate"] = time.perf_counter() - start
+
+        # operations on a single record, done by the windows
+        rented = [bike["id"] for bike in (fleet.get_bike(f"bike-{index}") for index in generator.sample(range(size), min(repeat, size))) if bike["battery_level"] >= core.BATTERY_PER_MINUTE]
+        results["rent_bike"] = time_calls(lambda rent: manager.rent_bike(rent[0], rent[1], 1), zip(rented, station_names))
+        added = []
+        results["add_bike"] = time_calls(lambda station_name: added.append(manager.add_bike(generator.randint(0, 100), station_name)["id"]), station_names)
+        results["move_bike"] = time_calls(lambda move: manager.move_bike(move[0], move[1]), zip(added, reversed(station_names)))
+        results["remove_bike"] = time_calls(manager.remove_bike, added)
+        empty = [(f"empty-{call}", f"Empty {call}", call, -1 - nb_stations) for call in range(repeat)] # below the grid
+        fleet.add_stations(empty)
+        results["remove_station"] = time_calls(manager.remove_station, [station[0] for station in empty])
+
+        # reads of the summary and of the user screen (first page of the lists, as displayed)
+        def summary(sort):
+            content = manager.summary(core.BIKE_SORTS[sort % 2], core.STATION_SORTS[sort % 2])
+            for bike in content["bikes"][:13]:
+                fleet.station_name(bike["station_id"])
+            for station in content["stations"][:13]:
+                fleet.docked_count(station["id"])
+                fleet.average_battery(station["id"])
+        results["summary"] = time_calls(summary, range(repeat))
+        results["user_bike_list"] = time_calls(lambda station_id: manager.rentable_bikes(station_id)[:10], station_ids)
+        results["pass_day"] = time_calls(lambda day: manager.pass_day(), range(min(repeat, 100)))
+
+        # tables of the administrator window
+        results.update(time_table(fleet, repeat, seed))
+
+        # files
+        for name, extension in (("json", ".json"), ("snapshot", ".snap")):
+            path = os.path.join(directory, f"fleet-{size}{extension}")
+            results["export_" + name] = time_best(lambda: manager.export_file(path), rounds)
+            results["import_" + name] = time_best(lambda: core.read_file(path), rounds)
+            os.remove(path)
+
+        # CSV file of new bikes, read then added in a single batch (each round adds its bikes)
+        path = os.path.join(directory, f"bikes-{size}.csv")
+        with open(path, "w") as file:
+            file.write("battery_level,station\n")
+            for row in range(max(1, int(size * CSV_BIKES_PER_BIKE))):
+                file.write(f"{generator.randint(0, 100)},Station {generator.randrange(nb_stations)}\n")
+        results["import_csv"] = time_best(lambda: manager.import_file(path), rounds)
+        os.remove(path)
+
+        # journal of the store in memory (the SQLite store saves its mutations itself)
+        if database is None:
+            results.update(time_journal(nb_stations, size, repeat, rounds, seed, directory))
+
+        # maintenance route of the first stations, and the routes of several vans picking up their low battery bikes
+        stations = fleet.stations()[:ROUTE_MAX_STATIONS]
+        coordinates = [(station["x"], station["y"]) for station in stations]
+        results["route"] = time_best(lambda: route.plan_route(coordinates, route.HEURISTIC), rounds)
+        demands = [sum(1 for bike in fleet.docked_bikes(station["id"]) if bike["battery_level"] <= core.LOW_BATTERY) for station in stations]
+        results["van_routes"] = time_best(lambda: route.plan_van_routes(coordinates, demands, VANS, max(1, sum(demands)), route.HEURISTIC), rounds)
+    finally:
+        manager.close()
+    return results
+
+
+## @brief run the benchmark on every size
+# @param sizes Numbers of bikes of the fleets
+# @param database True to use a SQLite database (in a temporary file) instead of the store in memory
+# @param log Optional function called with a line of text once a size is done
+# @return Dictionary of the machine, the settings and the results (seconds per operation, by operation then by size)
+def run(sizes=SIZES, database=False, repeat=REPEAT, rounds=3, seed=0, log=None):
+    results = {}
+    directory = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        for size in sizes:
+            database_path = os.path.join(directory, f"fleet-{size}.db") if database else None
+            for operation, seconds in run_size(size, database_path, repeat, rounds, seed, directory).items():
+                results.setdefault(operation, {})[str(size)] = seconds
+            if log is not None:
+                log(f"{size} bikes done")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()},
+        "settings": {"store": "sqlite" if database else "memory", "sizes": list(sizes), "repeat": repeat, "rounds": rounds, "seed": seed,
+                     "bikes_per_station": BIKES_PER_STATION, "rents_per_bike": RENTS_PER_BIKE, "route_max_stations": ROUTE_MAX_STATIONS,
+                     "vans": VANS, "csv_bikes_per_bike": CSV_BIKES_PER_BIKE, "table_rows": TABLE_ROWS},
+        "results": results
+    }
+
+
+## @brief compare results to a baseline (only the operations and sizes measured by both)
+# @param report Results of run
+# @param baseline Results of a previous run
+# @param threshold Default largest ratio between a result and its baseline
+# @return List of the regressions, as (operation, size, baseline seconds, seconds, ratio)
+def compare(report, baseline, threshold=THRESHOLD):
+    regressions = []
+    for operation, by_size in report["results"].items():
+        for size, seconds in by_size.items():
+            base = baseline["results"].get(operation, {}).get(size)
+            if base is None or seconds < NOISE_FLOOR:
+                continue
+            ratio = seconds / max(base, NOISE_FLOOR)
+            if ratio > THRESHOLDS.get(operation, threshold):
+                regressions.append((operation, size, base, seconds, ratio))
+    return regressions
+
+
+## @brief text table of the results, in ms per operation
+def format_results(report):
+    sizes = [str(size) for size in report["settings"]["sizes"]]
+    lines = [f"{'operation (ms)':<16}" + "".join(f"{size:>12}" for size in sizes)]
+    for operation, by_size in report["results"].items():
+        lines.append(f"{operation:<16}" + "".join(f"{by_size[size] * 1000:>12.4f}" if size in by_size else f"{'-':>12}" for size in sizes))
+    return "\n".join(lines)
+
+
+## @brief run the benchmark from the command line
+# @param argv Arguments of the command line (sys.argv[1:] if None)
+# @return Exit status (1 if there are regressions)
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Benchmark of the engine on synthetic fleets.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="numbers of bikes (default: %(default)s)")
+    parser.add_argument("--sqlite", action="store_true", help="benchmark the SQLite store instead of the store in memory")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="calls timed for the operations on a record (default: %(default)s)")
+    parser.add_argument("--rounds", type=int, default=3, help="runs of the operations on the whole fleet (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results to a JSON file")
+    parser.add_argument("--baseline", help="compare the results to a JSON file saved by --output")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="largest ratio to the baseline (default: %(default)s)")
+    arguments = parser.parse_args(argv)
+
+    report = run(arguments.sizes, arguments.sqlite, arguments.repeat, arguments.rounds, arguments.seed, log=lambda line: print(line, file=sys.stderr))
+    print(format_results(report))
+
+    if arguments.output is not None:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, arguments.threshold)
+        for operation, size, base, seconds, ratio in regressions:
+            print(f"Regression: {operation} with {size} bikes takes {seconds * 1000:.4f} ms instead of {base * 1000:.4f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print("No regression against " + arguments.baseline)
+    return 0
+
+
+if __name__ == "__main__": # the route workers import this module, they must not run the benchmark again
+    sys.exit(main())
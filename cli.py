@@ -0,0 +1,205 @@
+## @file cli.py
+#
+# @brief Command line of the application, running the engine (core.py) without any display, for batch jobs on servers.
+# @brief Every command works on the saved data of the application (the journal, or a SQLite database given by --database) and
+# @brief saves its mutations, so that several commands can follow each other:
+# @brief     python cli.py import data/data.json
+# @brief     python cli.py pass-day --days 7
+# @brief     python cli.py summary --limit 10
+# @brief     python cli.py route --vans 3 --capacity 20 --plot route.png
+# @brief     python cli.py export data/week.snap
+# @brief     python cli.py simulate --trips-per-day 100000 --days 7 --runs 8
+# @brief The latencies of the operations can be dumped to a JSON file (--metrics), and an operation profiled (--profile):
+# @brief     python cli.py --metrics metrics.json --profile query.summary summary
+#
+# @section libraries_cli Libraries/Modules
+# - argparse
+# - sqlite3
+# - sys
+# - core
+# - fleet
+# - fleet_io
+# - journal
+# - metrics
+# - route
+# - route_plot (only to draw a route)
+# - simulate (only to simulate the rents)
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import argparse
+import sqlite3
+import sys
+import core
+from fleet import FILE_CHECK
+import fleet_io
+import journal
+from metrics import METRICS
+import route
+
+
+## @brief print the progress of a long command on the error output
+def report(progress):
+    print(f"\r{round(progress * 100):3d}%", end="", file=sys.stderr, flush=True)
+    if progress >= 1:
+        print(file=sys.stderr)
+
+
+## @brief import command: replace the data by a database, or add the bikes or stations of a CSV file
+def import_command(manager, arguments):
+    manager.import_file(arguments.path, arguments.file_check, report if arguments.progress else None)
+    print(f"{manager.fleet.bike_count()} bikes and {manager.fleet.station_count()} stations")
+
+
+## @brief export command: write the data to a JSON file or a snapshot (given by the extension)
+def export_command(manager, arguments):
+    manager.export_file(arguments.path, report if arguments.progress else None)
+
+
+## @brief pass-day command: pass one or several days
+def pass_day_command(manager, arguments):
+    manager.pass_day(arguments.days)
+    print(f"{arguments.days} day(s) passed")
+
+
+## @brief summary command: print the counts, the average battery level, and the first bikes and stations of the sorted lists
+def summary_command(manager, arguments):
+    summary = manager.summary(arguments.bikes_sort, arguments.stations_sort)
+    print(f"Number of bikes : {summary['bike_count']}")
+    print(f"Number of stations : {summary['station_count']}")
+    print(f"Average overall battery level : {summary['average_battery']}")
+    print(f"Rents : {summary['total_rents']}, returns : {summary['total_returns']}")
+
+    print()
+    print(f"{'Bike n°':>8} {'Battery':>8} {'Station':>16} {'Days in use':>12} {'Times rented':>13}")
+    for bike in summary["bikes"][:arguments.limit]:
+        print(f"{bike['number']:>8} {bike['battery_level']:>8} {manager.fleet.station_name(bike['station_id']):>16} {bike['nb_days']:>12} {bike['nb_rents']:>13}")
+
+    print()
+    print(f"{'Station name':>16} {'Docked bikes':>13} {'Rents':>6} {'Returns':>8} {'Av. battery':>12}")
+    for station in summary["stations"][:arguments.limit]:
+        average_battery = manager.fleet.average_battery(station["id"])
+        print(f"{station['name']:>16} {manager.fleet.docked_count(station['id']):>13} {station['nb_rents']:>6} {station['nb_returns']:>8} {average_battery if average_battery is not None else '-':>12}")
+
+
+## @brief route command: compute the maintenance route(s), print the stations in visiting order, and optionally draw them
+def route_command(manager, arguments):
+    plan = manager.route_plan(arguments.vans, arguments.capacity)
+    routes = plan.compute(arguments.mode)
+    print(plan.title(routes))
+    for index, van_route in enumerate(routes):
+        print(f"Van {index + 1} : Warehouse -> " + " -> ".join(plan.names[station] for station in van_route.order))
+
+    if arguments.plot is not None:
+        from route_plot import RoutePlot # matplotlib is only needed to draw the route
+        RoutePlot(routes, plan.coordinates, plan.names, plan.title(routes)).export(arguments.plot)
+
+
+## @brief simulate command: simulate the rents of the fleet (the saved data isn't changed) and print the statistics of the runs
+def simulate_command(manager, arguments):
+    import simulate # the simulator is only needed by this command
+    data = simulate.FleetData.from_store(manager.fleet)
+    report = simulate.run(data, arguments.trips_per_day, arguments.days, arguments.runs, arguments.workers, arguments.seed)
+    print(simulate.format_results(report))
+
+
+## @brief parser of the command line
+def make_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Le Marcel Manager without display.")
+    parser.add_argument("--database", help="SQLite database holding the data (the journal of the application is used otherwise)")
+    parser.add_argument("--journal", default=journal.DEFAULT_DIRECTORY, help="directory of the journal (default: %(default)s)")
+    parser.add_argument("--progress", action="store_true", help="print the progress of the import and the export")
+    parser.add_argument("--metrics", help="dump the latencies of the operations to a JSON file")
+    parser.add_argument("--profile", metavar="OPERATION", help="profile the first operation of this name (e.g. query.summary, or any)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="replace the data by a database (.json, .snap), or add bikes or stations (.csv)")
+    command.add_argument("path")
+    command.add_argument("--file-check", default=FILE_CHECK, help="expected database (default: %(default)s)")
+    command.set_defaults(run=import_command)
+
+    command = commands.add_parser("export", help="write the data to a JSON file or a snapshot (.snap)")
+    command.add_argument("path")
+    command.set_defaults(run=export_command)
+
+    command = commands.add_parser("pass-day", help="pass one or several days")
+    command.add_argument("--days", type=int, default=1)
+    command.set_defaults(run=pass_day_command)
+
+    command = commands.add_parser("summary", help="print the summary of the fleet")
+    command.add_argument("--bikes-sort", choices=core.BIKE_SORTS, default=core.BIKE_SORTS[0])
+    command.add_argument("--stations-sort", choices=core.STATION_SORTS, default=core.STATION_SORTS[0])
+    command.add_argument("--limit", type=int, default=10, help="number of bikes and stations printed (default: %(default)s)")
+    command.set_defaults(run=summary_command)
+
+    command = commands.add_parser("route", help="compute the maintenance route(s)")
+    command.add_argument("--mode", choices=route.MODES, default=route.AUTO)
+    command.add_argument("--vans", type=int, default=1, help="number of vans (default: %(default)s)")
+    command.add_argument("--capacity", type=int, help="number of bikes a van can carry (no limit by default)")
+    command.add_argument("--plot", help="draw the route(s) to a .png or .svg file")
+    command.set_defaults(run=route_command)
+
+    command = commands.add_parser("simulate", help="simulate the rents of the fleet, without changing it")
+    command.add_argument("--trips-per-day", type=int, default=100000, help="mean number of trips asked per day (default: %(default)s)")
+    command.add_argument("--days", type=int, default=1)
+    command.add_argument("--runs", type=int, default=1, help="independent simulations (default: %(default)s)")
+    command.add_argument("--workers", type=int, help="processes running the simulations (one per processor by default)")
+    command.add_argument("--seed", type=int, default=0)
+    command.set_defaults(run=simulate_command)
+    return parser
+
+
+## @brief write the metrics and the path of the profile requested on the command line
+def dump_metrics(arguments):
+    if arguments.profile is not None:
+        if METRICS.last_profile is None:
+            print(f"No operation {arguments.profile} has been profiled", file=sys.stderr)
+        else:
+            name, path, text = METRICS.last_profile
+            print(text if path is None else f"Profile of {name} saved to {path}", file=sys.stderr)
+    if arguments.metrics is not None:
+        try:
+            METRICS.dump(arguments.metrics)
+        except OSError as error:
+            print("The metrics can't be written: " + str(error), file=sys.stderr)
+
+
+## @brief run a command
+# @param argv Arguments of the command line (sys.argv[1:] if None)
+# @return Exit status
+def main(argv=None):
+    arguments = make_parser().parse_args(argv)
+    manager = core.FleetManager(arguments.database, arguments.journal)
+    if manager.restore_error is not None:
+        print("The saved data can't be restored: " + str(manager.restore_error), file=sys.stderr)
+        manager.close()
+        return 1
+    if manager.restore_warning is not None:
+        print(manager.restore_warning, file=sys.stderr)
+
+    if arguments.profile is not None:
+        METRICS.profile_next("" if arguments.profile == "any" else arguments.profile)
+
+    try:
+        arguments.run(manager, arguments)
+        if manager.flush():
+            manager.compact()
+    except fleet_io.WrongDatabaseError:
+        print("This file holds incompatible data with the database you selected.", file=sys.stderr)
+        return 1
+    except KeyError as error: # missing station or field, its message is quoted by str()
+        print("Error: " + str(error.args[0] if error.args else error), file=sys.stderr)
+        return 1
+    except (ValueError, TypeError, OSError, MemoryError, sqlite3.Error) as error: # refused operation, damaged file, impossible route, database error
+        print("Error: " + str(error), file=sys.stderr)
+        return 1
+    finally:
+        manager.close()
+        dump_metrics(arguments)
+    return 0
+
+
+if __name__ == "__main__": # the route workers import this module, they must not run the command again
+    sys.exit(main())
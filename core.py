@@ -0,0 +1,477 @@
+## @file core.py
+#
+# @brief Engine of the application, without any display: used by the tkinter front end (main.py) and by the command line (cli.py).
+# @brief FleetManager holds the data (in memory and journaled, or in a SQLite database) and checks every operation of the user
+# @brief (adding, moving, removing and renting bikes, passing a day) before applying it, raising a FleetError whose message can be
+# @brief shown as is. It also gives the summary of the fleet and the stations of the maintenance routes.
+# @brief read_file and write_file import and export the data, they only use their arguments so they can run on a worker thread.
+# @brief A SQLite database is imported and exported by a connection of the worker thread, instead of a copy of the data in memory.
+# @brief The operations, the files and the routes are timed in the metrics (metrics.py), and the changes of the data are counted.
+#
+# @section libraries_core Libraries/Modules
+# - os
+# - uuid
+# - fleet
+# - fleet_io
+# - fleet_snapshot
+# - fleet_csv
+# - fleet_sqlite
+# - journal
+# - metrics
+# - route
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import os
+from uuid import uuid4
+from fleet import FleetStore, FILE_CHECK
+import fleet_io
+import fleet_snapshot
+import fleet_csv
+from fleet_sqlite import SQLiteStore
+import journal
+from metrics import METRICS, timed
+import route
+
+## @brief Battery level at or below which a bike is low on battery (picked up by the maintenance vans)
+LOW_BATTERY = 20
+
+## @brief Battery level at or below which a bike can't be rented
+MIN_RENT_BATTERY = 2
+
+## @brief Longest rent (in minutes)
+MAX_RENT_TIME = 50
+
+## @brief Battery used by a minute of rent
+BATTERY_PER_MINUTE = 2
+
+## @brief Fields by which the bikes and the stations of the summary can be sorted
+BIKE_SORTS = ("nb_days", "nb_rents")
+STATION_SORTS = ("nb_rents", "nb_returns")
+
+
+## @brief Error raised when an operation of the user is refused, its message can be shown to the user
+class FleetError(ValueError):
+    pass
+
+
+## @brief true if a file holds bikes or stations to add to the data, rather than a whole database
+def is_csv_path(path):
+    return path.lower().endswith(".csv")
+
+
+## @brief read a database (JSON file or snapshot) in a new store, or the bikes or stations of a CSV file in a batch
+# @param path Path of the file
+# @param file_check Expected value of the "file_check" key of a database
+# @param report Optional function called with the progress (0 to 1)
+# @param database Optional path of a SQLite database the read database replaces, in a single transaction of a connection of the
+# calling thread (nothing is changed if the reading fails)
+# @return The FleetStore, the fleet_csv.CSVBatch, or the closed SQLiteStore the database has been loaded into
+# @exception fleet_io.WrongDatabaseError the file holds another database
+# @exception ValueError, KeyError, TypeError the file is damaged or a row of the CSV file is invalid
+# @exception OSError the file can't be read
+# @exception sqlite3.Error the database can't be written
+@timed("io.read_file")
+def read_file(path, file_check=FILE_CHECK, report=None, database=None):
+    if is_csv_path(path):
+        loaded = fleet_csv.CSVBatch()
+    else:
+        loaded = FleetStore() if database is None else SQLiteStore(database)
+    try:
+        with open(path, "rb") as file:
+            if is_csv_path(path): # rows of bikes or stations
+                steps = fleet_csv.read_csv(file, loaded)
+            elif fleet_snapshot.is_snapshot(file): # binary snapshot, memory-mapped
+                steps = fleet_snapshot.read_snapshot(file, loaded, file_check)
+            else:
+                steps = fleet_io.read_database(file, loaded, file_check)
+            for progress in steps:
+                if report is not None:
+                    report(progress)
+    finally:
+        if isinstance(loaded, SQLiteStore):
+            loaded.close() # an unfinished load is rolled back
+    return loaded
+
+
+## @brief write a store as a JSON file or a snapshot (given by the extension), the file only replaces the previous one once complete
+# @param path Path of the file
+# @param store The store to write, a snapshot if the data may change meanwhile
+# @param report Optional function called with the progress (0 to 1)
+# @exception ValueError a record doesn't fit in a snapshot
+# @exception OSError the file can't be written
+@timed("io.write_file")
+def write_file(path, store, report=None):
+    temporary_path = path + ".part"
+    try:
+        if path.endswith(".snap"): # binary snapshot
+            with open(temporary_path, "wb") as file:
+                for progress in fleet_snapshot.write_snapshot(file, store):
+                    if report is not None:
+                        report(progress)
+        else:
+            with open(temporary_path, "w") as file:
+                for progress in fleet_io.write_database(file, store):
+                    if report is not None:
+                        report(progress)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+## @brief write a SQLite database as a JSON file or a snapshot (see write_file), read by a connection of the calling thread in a
+# single read transaction, so that the file holds the data as it was when the writing started. The records of a JSON file are
+# streamed from the queries, a snapshot is built in memory first.
+# @param path Path of the file
+# @param database Path of the SQLite database
+# @param report Optional function called with the progress (0 to 1)
+# @exception ValueError a record doesn't fit in a snapshot
+# @exception OSError the file can't be written
+# @exception sqlite3.Error the database can't be read
+def write_database_file(path, database, report=None):
+    store = SQLiteStore(database)
+    try:
+        with store.reading():
+            write_file(path, store.snapshot() if path.endswith(".snap") else store, report)
+    finally:
+        store.close()
+
+
+class RoutePlan:
+
+    ## @brief read the stations of the maintenance route(s) from the store, so that the routes can be computed on another thread
+    # @param fleet The store
+    # @param nb_vans Number of vans sharing the stations
+    # @param capacity Number of bikes a van can carry (None for no limit)
+    # @param route_cache Optional route.RouteCache, reused or repaired for a single van without capacity
+    # @exception FleetError there are less than two stations, or the number of vans or the capacity isn't positive
+    def __init__(self, fleet, nb_vans=1, capacity=None, route_cache=None):
+        if fleet.station_count() < 2:
+            raise FleetError("You need at least two stations in the database to use this feature.")
+        if nb_vans < 1:
+            raise FleetError("The number of vans must be a positive integer.")
+        if capacity is not None and capacity < 1:
+            raise FleetError("The van capacity must be empty (no limit) or a positive integer.")
+        self.nb_vans = nb_vans
+        self.capacity = capacity
+        self.route_cache = route_cache
+
+        stations = fleet.stations()
+        ## @brief List of the stations' (x, y) coordinates
+        self.coordinates = [(station["x"], station["y"]) for station in stations]
+        ## @brief List of the stations' names
+        self.names = [station["name"] for station in stations]
+        ## @brief Number of bikes picked up at each station (None for a single van without capacity)
+        self.demands = None
+        if nb_vans > 1 or capacity is not None:
+            # each van picks up the low battery bikes of the stations it visits
+            self.demands = [sum(1 for bike in fleet.docked_bikes(station["id"]) if bike["battery_level"] <= LOW_BATTERY) for station in stations]
+
+    ## @brief compute the route(s), only using the lists read from the store (can run on another thread)
+    # @param mode Solving mode of the route (exact, heuristic or auto)
+    # @return List of routes (route.Route), one per van
+    # @exception ValueError the vans can't carry every bike
+    @timed("route.compute")
+    def compute(self, mode=route.AUTO):
+        if self.demands is None:
+            if self.route_cache is not None:
+                return [self.route_cache.plan(self.coordinates, mode)] # call the solver (or reuse the cached route)
+            return [route.plan_route(self.coordinates, mode)]
+        return route.plan_van_routes(self.coordinates, self.demands, self.nb_vans, self.capacity if self.capacity is not None else sum(self.demands), mode)
+
+    ## @brief title describing computed routes (total distance, and optimality gap of a single route when its lower bound gives it)
+    @staticmethod
+    def title(routes):
+        total_cost = sum(van_route.cost for van_route in routes)
+        if len(routes) == 1:
+            the_route = routes[0]
+            if the_route.optimal:
+                quality = ", optimal"
+            elif the_route.gap() is not None:
+                quality = ", at most " + str(round(the_route.gap() * 100, 1)) + "% above optimal"
+            else: # the lower bound is too weak to tell how far the route is from the optimal one
+                quality = ""
+            return "Total distance : " + str(round(total_cost, 2)) + " (" + the_route.mode + quality + ")"
+        return "Total distance : " + str(round(total_cost, 2)) + " (" + str(len(routes)) + " vans)"
+
+
+class FleetManager:
+
+    ## @brief open the data
+    # @param database Optional path of a SQLite database holding the data, the data is kept in memory and journaled otherwise
+    # @param directory Directory of the journal (None to keep the data in memory without saving it)
+    def __init__(self, database=None, directory=journal.DEFAULT_DIRECTORY):
+        ## @brief Journal saving every mutation of the data, restored on opening (None if the data isn't saved this way)
+        self.journal = None
+        ## @brief Error raised while restoring the saved data (None if it has been restored), the data is then empty and not saved
+        self.restore_error = None
+        ## @brief Message telling that the last import couldn't be restored (None if everything has been restored), the data is then
+        # restored as it was before the import and still saved
+        self.restore_warning = None
+        ## @brief True while a database is loaded into the SQLite database by a worker thread, the data can't be changed meanwhile
+        self.importing = False
+        if database is not None:
+            ## @brief Indexed store that holds all the data
+            self.fleet = SQLiteStore(database) # every mutation is committed to the database
+        else:
+            self.fleet = FleetStore()
+            if directory is None:
+                self.fleet.load({"file_check": FILE_CHECK})
+            else:
+                self.journal = journal.Journal(directory)
+                try:
+                    self.journal.open(self.fleet)
+                except (ValueError, OSError) as error: # damaged saved data
+                    self.journal = None
+                    self.restore_error = error
+                    self.fleet.load({"file_check": FILE_CHECK})
+                else:
+                    if self.journal.unrestored: # stopped after an import, before its snapshot was written
+                        self.restore_warning = ("The data imported just before the application stopped can't be restored, the data is restored as it was before the import. "
+                                                "The changes that aren't restored are kept in " + ", ".join(self.journal.unrestored))
+        ## @brief Last maintenance route, reused or repaired while the stations don't change much
+        self.route_cache = route.RouteCache()
+        self.fleet.subscribe(METRICS.count_change) # counts the changes of the data
+
+    ## @brief save the last mutations and close the data
+    # @exception OSError the last snapshot can't be written (the data is still closed)
+    def close(self):
+        try:
+            if self.journal is not None:
+                self.journal.finish_compaction() # a cancelled snapshot, or an import not compacted yet, would lose the data
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+            self.fleet.close()
+
+    ## @brief write the last mutations to the journal
+    # @return True if the journal should be compacted into a new snapshot
+    # @exception OSError the data can't be saved anymore (saving is then stopped)
+    def flush(self):
+        if self.journal is None:
+            return False
+        try:
+            with timed("io.journal_flush"):
+                self.journal.flush()
+        except OSError:
+            self.stop_saving()
+            raise
+        return self.journal.should_compact()
+
+    ## @brief stop saving the data (it can still be exported)
+    def stop_saving(self):
+        self.fleet.journal = None
+        self.journal = None
+
+    ## @brief compact the journal into a new snapshot, without waiting for a background task
+    def compact(self):
+        if self.journal is None:
+            return
+        self.journal.start_compaction()
+        self.journal.finish_compaction()
+
+    ## @brief path of the SQLite database that the connections of the worker threads can open (None if the data is in memory)
+    def shared_database(self):
+        if isinstance(self.fleet, SQLiteStore) and self.fleet.is_file():
+            return self.fleet.path
+        return None
+
+    ## @brief refuse to change the data while a database is loaded into the SQLite database by a worker thread
+    # @exception FleetError a database is being imported
+    def check_not_importing(self):
+        if self.importing:
+            raise FleetError("A database is being imported, please wait until the import is over.")
+
+    ## @brief start importing a file: the returned function reads it (see read_file) and can run on a worker thread, its result is
+    # then given to import_data, or cancel_import is called if the reading failed or was cancelled. A database imported in a SQLite
+    # database is loaded by a connection of the worker thread, in a single transaction: the data can't be changed until then.
+    # @param path Path of the file
+    # @param file_check Expected value of the "file_check" key of a database
+    # @return Function of an optional progress report function, returning the result of read_file
+    # @exception FleetError a database is already being imported
+    def start_import(self, path, file_check=FILE_CHECK):
+        self.check_not_importing()
+        database = None if is_csv_path(path) else self.shared_database()
+        if database is not None:
+            self.importing = True
+        return lambda report=None: read_file(path, file_check, report, database)
+
+    ## @brief the import started by start_import failed or was cancelled
+    def cancel_import(self):
+        if self.importing:
+            self.importing = False
+            self.fleet.reload() # the database may have been loaded before the task was cancelled
+
+    ## @brief replace the data by a read database, or add the bikes or stations of a read CSV file
+    # @param loaded Result of read_file
+    # @exception KeyError, ValueError the batch can't be added (nothing is added)
+    # @exception FleetError a database is being imported
+    @timed("mutation.import")
+    def import_data(self, loaded):
+        if isinstance(loaded, SQLiteStore): # already loaded into the database by the worker thread
+            self.importing = False
+            self.fleet.reload()
+            return
+        self.check_not_importing()
+        if isinstance(loaded, fleet_csv.CSVBatch):
+            loaded.apply(self.fleet)
+        else:
+            self.fleet.replace(loaded)
+
+    ## @brief read a file and import it (see start_import and import_data)
+    def import_file(self, path, file_check=FILE_CHECK, report=None):
+        read = self.start_import(path, file_check)
+        try:
+            loaded = read(report)
+        except BaseException:
+            self.cancel_import()
+            raise
+        self.import_data(loaded)
+
+    ## @brief start exporting the data: the returned function writes it to a file (see write_file) and can run on a worker thread.
+    # A SQLite database is read by a connection of the worker thread (see write_database_file), the in-memory data is copied.
+    # @param path Path of the file
+    # @return Function of an optional progress report function
+    def start_export(self, path):
+        database = self.shared_database()
+        if database is not None:
+            return lambda report=None: write_database_file(path, database, report)
+        copy = self.fleet.snapshot() # the data may change while the file is written
+        return lambda report=None: write_file(path, copy, report)
+
+    ## @brief write the data to a file (see start_export)
+    def export_file(self, path, report=None):
+        self.start_export(path)(report)
+
+    ## @brief add a new bike, docked to a station
+    # @param battery_level Battery level, from 0 to 100
+    # @param station_name Name of the station
+    # @param bike_id Id of the bike (generated if None)
+    # @param bike_number Number of the bike (the next number if None)
+    # @exception FleetError the battery level is out of range or the station doesn't exist, or a database is being imported
+    @timed("mutation.add_bike")
+    def add_bike(self, battery_level, station_name, bike_id=None, bike_number=None):
+        self.check_not_importing()
+        if self.fleet.station_count() == 0:
+            raise FleetError("You need to add a station before adding a bike.")
+        if not 0 <= battery_level <= 100:
+            raise FleetError("The battery level must be between 0 and 100.")
+        station = self.fleet.get_station_by_name(station_name)
+        if station is None:
+            raise FleetError("Something bad has happened, seems like the station doesn't exist anymore.")
+        if bike_number is None:
+            bike_number = self.fleet.next_bike_number()
+        return self.fleet.add_bike(bike_id if bike_id is not None else str(uuid4()), bike_number, battery_level, station["id"])
+
+    ## @brief add a new station
+    # @param station_name Name of the station
+    # @param station_x X coordinate
+    # @param station_y Y coordinate
+    # @param station_id Id of the station (generated if None)
+    # @exception FleetError the name is empty or used, or the coordinates are out of range or used, or a database is being imported
+    @timed("mutation.add_station")
+    def add_station(self, station_name, station_x, station_y, station_id=None):
+        self.check_not_importing()
+        if station_name == "":
+            raise FleetError("Please enter a name for the station")
+        if station_x == 0 and station_y == 0:
+            raise FleetError("There is already the main warehouse at these coordinates.")
+        if not -fleet_csv.MAX_COORDINATE <= station_x <= fleet_csv.MAX_COORDINATE or not -fleet_csv.MAX_COORDINATE <= station_y <= fleet_csv.MAX_COORDINATE:
+            raise FleetError(f"The coordinates must be between {-fleet_csv.MAX_COORDINATE} and {fleet_csv.MAX_COORDINATE}.")
+        if self.fleet.get_station_at(station_x, station_y) is not None:
+            raise FleetError("There is already a station at these coordinates.")
+        if self.fleet.get_station_by_name(station_name) is not None:
+            raise FleetError("There is already a station with this name.")
+        return self.fleet.add_station(station_id if station_id is not None else str(uuid4()), station_name, station_x, station_y)
+
+    ## @brief move a bike to another station
+    # @exception FleetError the bike or the station doesn't exist, or a database is being imported
+    @timed("mutation.move_bike")
+    def move_bike(self, bike_id, station_name):
+        self.check_not_importing()
+        station = self.fleet.get_station_by_name(station_name)
+        if station is None or self.fleet.get_bike(bike_id) is None:
+            raise FleetError("The bike or the station isn't in the data anymore.")
+        return self.fleet.move_bike(bike_id, station["id"])
+
+    ## @brief remove a bike (nothing happens if it has already been removed)
+    # @exception FleetError a database is being imported
+    @timed("mutation.remove_bike")
+    def remove_bike(self, bike_id):
+        self.check_not_importing()
+        if self.fleet.get_bike(bike_id) is not None:
+            self.fleet.remove_bike(bike_id) # remove the bike from the database and from its station
+
+    ## @brief remove an empty station (nothing happens if it has already been removed)
+    # @exception FleetError bikes are docked to the station, or a database is being imported
+    @timed("mutation.remove_station")
+    def remove_station(self, station_id):
+        self.check_not_importing()
+        if self.fleet.get_station(station_id) is None:
+            return
+        if self.fleet.docked_count(station_id) != 0:
+            raise FleetError("The station is not empty, please move all the bikes before removing the station.")
+        self.fleet.remove_station(station_id)
+
+    ## @brief rent a bike, moving it to the return station and using its battery
+    # @param bike_id Id of the bike
+    # @param station_name Name of the return station
+    # @param rent_time Rent time (in minutes)
+    # @exception FleetError the rent time is out of range, the battery is too low, or the bike or a station doesn't exist, or a database is being imported
+    @timed("mutation.rent_bike")
+    def rent_bike(self, bike_id, station_name, rent_time):
+        self.check_not_importing()
+        target_station = self.fleet.get_station_by_name(station_name)
+        bike = self.fleet.get_bike(bike_id)
+        if target_station is None or bike is None or self.fleet.get_station(bike["station_id"]) is None:
+            raise FleetError("The station isn't in the data anymore. If this problem persist, please reload the application.")
+        if not 0 < rent_time <= MAX_RENT_TIME:
+            raise FleetError(f"The rent time must be between 1 and {MAX_RENT_TIME} minutes.")
+        if BATTERY_PER_MINUTE * rent_time > bike["battery_level"]:
+            raise FleetError("This bike doesn't have enough battery to be rented for that long.")
+
+        # update the bike's battery and rents, the stations' rents and returns, and move the bike
+        return self.fleet.rent_bike(bike_id, target_station["id"], BATTERY_PER_MINUTE * rent_time)
+
+    ## @brief pass one or several days
+    # @exception FleetError a database is being imported
+    @timed("mutation.pass_day")
+    def pass_day(self, days=1):
+        self.check_not_importing()
+        for day in range(days):
+            self.fleet.pass_day()
+
+    ## @brief bikes of a station that can be rented, the most charged first
+    @timed("query.rentable_bikes")
+    def rentable_bikes(self, station_id):
+        return self.fleet.available_bikes(station_id, MIN_RENT_BATTERY)
+
+    ## @brief summary of the fleet
+    # @param bikes_sort Field by which the bikes are sorted (decreasing order)
+    # @param stations_sort Field by which the stations are sorted (decreasing order)
+    # @return Dictionary of the counts, the average battery level, the total rents and returns, and the sorted bikes and stations
+    # (lazy lists, kept in order by the store)
+    # @exception FleetError unknown sorting field
+    @timed("query.summary")
+    def summary(self, bikes_sort=BIKE_SORTS[0], stations_sort=STATION_SORTS[0]):
+        if bikes_sort not in BIKE_SORTS or stations_sort not in STATION_SORTS:
+            raise FleetError("Unknown sorting field.")
+        average_battery = self.fleet.average_battery()
+        return {
+            "bike_count": self.fleet.bike_count(),
+            "station_count": self.fleet.station_count(),
+            "average_battery": average_battery if average_battery is not None else 0, # no bike
+            "total_rents": self.fleet.total_rents(),
+            "total_returns": self.fleet.total_returns(),
+            "bikes": self.fleet.sorted_bikes(bikes_sort, reverse=True),
+            "stations": self.fleet.sorted_stations(stations_sort, reverse=True)
+        }
+
+    ## @brief read the stations of the maintenance route(s) (see RoutePlan)
+    @timed("route.plan")
+    def route_plan(self, nb_vans=1, capacity=None):
+        return RoutePlan(self.fleet, nb_vans, capacity, self.route_cache)
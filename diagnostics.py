@@ -0,0 +1,182 @@
+## @file diagnostics.py
+#
+# @brief Diagnostics window of the administrator: latencies of the timed operations (metrics.py), refreshed every second.
+# @brief Each operation shows its count, mean and longest duration since the start, and the percentiles of its last durations;
+# @brief its rolling histogram is drawn on demand. The window also shows the counters, resets the metrics, dumps them to a
+# @brief JSON file, and arms cProfile for the next operation (of a chosen name, or any) then shows the saved profile.
+#
+# @section libraries_diagnostics Libraries/Modules
+# - tkinter
+# - metrics
+# - widgets
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from tkinter import ttk
+from tkinter import filedialog
+from tkinter.messagebox import showinfo
+import tkinter as tk
+import metrics
+from widgets import VirtualTable
+
+## @brief Interval (in ms) between two refreshes of the window
+REFRESH_INTERVAL = 1000
+
+## @brief Width (in characters) of the longest bar of a histogram
+BAR_WIDTH = 40
+
+## @brief Choice of the profiled operation meaning any operation
+ANY_OPERATION = "(next operation)"
+
+
+## @brief text of a duration given in seconds, in ms
+def format_duration(seconds):
+    return f"{seconds * 1000:.3f}"
+
+
+## @brief texts of the buckets of the histograms
+def bucket_labels():
+    labels = []
+    for bound in metrics.BUCKETS:
+        if bound == float("inf"):
+            labels.append(f"> {metrics.BUCKETS[-2] * 1000:g} ms")
+        else:
+            labels.append(f"<= {bound * 1000:g} ms")
+    return labels
+
+
+class DiagnosticsWindow(tk.Toplevel):
+
+    ## @brief open the diagnostics window (the window doesn't block the application)
+    # @param parent The parent window
+    # @param registry The Metrics displayed
+    def __init__(self, parent, registry=metrics.METRICS):
+        tk.Toplevel.__init__(self, parent)
+        self.title("Diagnostics")
+        self.resizable(False, False)
+        self.registry = registry
+        ## @brief Name of the operation whose histogram is drawn (None before one is chosen)
+        self.histogram_name = None
+        ## @brief Names of the operations in the profile menu
+        self.menu_names = []
+        ## @brief Id of the scheduled refresh
+        self.refresh_id = None
+
+        # latencies of the operations
+        self.table = VirtualTable(
+            self,
+            headers = ["Operation", "Count", "Mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)"],
+            format_row = lambda row: (row[0], row[1]["count"], format_duration(row[1]["mean"]), format_duration(row[1]["p50"]), format_duration(row[1]["p95"]), format_duration(row[1]["p99"]), format_duration(row[1]["max"])),
+            actions = [("Histogram", self.show_histogram)],
+            visible_rows = 12,
+            widths = [24, 7, 10, 10, 10, 10, 10],
+            key = lambda row: row[0]
+        )
+        self.table.grid(row=0, column=0, columnspan=2, padx=10, pady=5, sticky="nsew")
+
+        # rolling histogram of the chosen operation, and counters
+        self.histogram_text = tk.Text(self, height=len(metrics.BUCKETS) + 1, width=70, state="disabled")
+        self.histogram_text.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
+        self.counters_text = tk.Text(self, height=len(metrics.BUCKETS) + 1, width=30, state="disabled")
+        self.counters_text.grid(row=1, column=1, padx=10, pady=5, sticky="nsew")
+
+        # controls
+        controls = ttk.Frame(self)
+        controls.grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+        ttk.Button(controls, text="Reset", command=self.reset).grid(row=0, column=0, padx=3)
+        ttk.Button(controls, text="Dump to file", command=self.dump).grid(row=0, column=1, padx=3)
+        self.profile_name = tk.StringVar(self, ANY_OPERATION)
+        self.profile_menu = ttk.OptionMenu(controls, self.profile_name, ANY_OPERATION, ANY_OPERATION)
+        self.profile_menu.grid(row=0, column=2, padx=3)
+        ttk.Button(controls, text="Profile next", command=self.profile_next).grid(row=0, column=3, padx=3)
+        ttk.Button(controls, text="Last profile", command=self.show_profile).grid(row=0, column=4, padx=3)
+        ## @brief State of the profile
+        self.profile_label = ttk.Label(controls, text="")
+        self.profile_label.grid(row=0, column=5, padx=3)
+
+        self.bind("<Destroy>", lambda event: self.after_cancel(self.refresh_id) if event.widget is self and self.refresh_id is not None else None)
+        self.refresh()
+
+    ## @brief read the metrics again and redraw the window, then schedule the next refresh
+    def refresh(self):
+        report = self.registry.report()
+        operations = list(report["operations"].items())
+        self.table.set_rows(operations)
+
+        if self.histogram_name in report["operations"]:
+            self.draw_histogram(self.histogram_name, report["operations"][self.histogram_name])
+        self.set_text(self.counters_text, "\n".join(f"{name} : {value}" for name, value in report["counters"].items()) or "No counter")
+
+        names = [name for name, summary in operations]
+        if names != self.menu_names: # new operations to profile
+            self.menu_names = names
+            menu = self.profile_menu["menu"]
+            menu.delete(0, "end")
+            for name in [ANY_OPERATION] + names:
+                menu.add_command(label=name, command=lambda name=name: self.profile_name.set(name))
+
+        if self.registry.profile_name is not None:
+            self.profile_label.configure(text="Waiting for " + (self.registry.profile_name or "the next operation"))
+        elif self.registry.last_profile is not None:
+            self.profile_label.configure(text="Profiled: " + self.registry.last_profile[0])
+        self.refresh_id = self.after(REFRESH_INTERVAL, self.refresh)
+
+    ## @brief replace the text of a text widget
+    @staticmethod
+    def set_text(widget, text):
+        widget.configure(state="normal")
+        widget.delete("1.0", "end")
+        widget.insert("1.0", text)
+        widget.configure(state="disabled")
+
+    ## @brief draw the rolling histogram of an operation (Histogram button of a row)
+    def show_histogram(self, row):
+        self.histogram_name = row[0]
+        self.draw_histogram(row[0], row[1])
+
+    ## @brief draw a histogram as text bars
+    def draw_histogram(self, name, summary):
+        counts = summary["buckets"]
+        largest = max(counts) if max(counts) > 0 else 1
+        lines = [f"{name} (last {sum(counts)} durations)"]
+        for label, count in zip(bucket_labels(), counts):
+            lines.append(f"{label:>14} {'#' * round(count * BAR_WIDTH / largest):<{BAR_WIDTH}} {count}")
+        self.set_text(self.histogram_text, "\n".join(lines))
+
+    ## @brief forget the recorded metrics
+    def reset(self):
+        self.registry.reset()
+        self.histogram_name = None
+        self.set_text(self.histogram_text, "")
+
+    ## @brief write the metrics to a JSON file
+    def dump(self):
+        path = filedialog.asksaveasfilename(parent=self, filetypes=(('JSON files', '*.json'),), defaultextension=".json", initialfile="metrics", initialdir="./data/")
+        if not path: # no file selected
+            return
+        try:
+            self.registry.dump(path)
+        except OSError as error:
+            showinfo("Dump failed", "The file can't be written: " + str(error), parent=self)
+
+    ## @brief profile the next operation (of the chosen name)
+    def profile_next(self):
+        name = self.profile_name.get()
+        self.registry.profile_next("" if name == ANY_OPERATION else name)
+        self.profile_label.configure(text="Waiting for " + ("the next operation" if name == ANY_OPERATION else name))
+
+    ## @brief display the text summary of the last profile
+    def show_profile(self):
+        if self.registry.last_profile is None:
+            showinfo("No profile", "No operation has been profiled yet. Choose an operation, click on Profile next, then do it.", parent=self)
+            return
+        name, path, text = self.registry.last_profile
+        window = tk.Toplevel(self)
+        window.title("Profile of " + name)
+        header = "Saved to " + path if path is not None else "The profile couldn't be saved"
+        ttk.Label(window, text=header).grid(row=0, column=0, padx=10, pady=5, sticky="w")
+        profile_text = tk.Text(window, width=120, height=35)
+        profile_text.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
+        self.set_text(profile_text, text)
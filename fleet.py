@@ -0,0 +1,979 @@
+## @file fleet.py
+#
+# @brief Indexed in-memory store for the bikes and the stations.
+# @brief Keeps id, name and docking indexes consistent so that every lookup done by the application is O(1).
+# @brief The bikes and the stations are numbered by integer handles. The bike attributes are stored by columns (one array per
+# @brief field, indexed by the handle) and read through light Bike views, so that the fleet-wide updates and sums are done on
+# @brief whole arrays. The bikes docked to a station are chained by their handles, the string ids are only used at the boundary
+# @brief (lookups by id, files, journal).
+# @brief The battery totals, docked counts, rents and returns of the fleet and of every station are kept up to date by each
+# @brief mutation, so that the averages and totals shown by the summary are read in O(1), and so are the sorted indexes of the
+# @brief summary lists (built when first used), so that sorting a list only reads the rows shown. Each station selected by the
+# @brief user screen gets an index of its docked bikes by battery level, so that its rentable bikes are read without a scan.
+# @brief Every mutation is notified to the subscribed listeners, so that the views only patch the affected rows, and given to the
+# @brief journal (if any) as the name of the method and its arguments, so that it can be replayed.
+#
+# @section libraries_fleet Libraries/Modules
+# - array
+# - fleet_index
+# - numpy (optional, faster sums of the large columns, imported on first use)
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from array import array
+from fleet_index import SortedIndex, SortedView
+
+## @brief numpy module, imported by the first sum of a large column (False before, None if it isn't installed)
+numpy = False
+
+## @brief Length from which a column is summed by numpy, shorter ones don't pay for its import
+NUMPY_MIN_LENGTH = 100000
+
+## @brief Value of the "file_check" key of the databases generated by the application
+FILE_CHECK = "data_marcel_manager"
+
+## @brief Kinds of records notified to the listeners
+BIKE = "bike"
+STATION = "station"
+
+## @brief Actions notified to the listeners. A record of None means every record of the kind.
+ADDED = "added"
+UPDATED = "updated"
+REMOVED = "removed"
+RESET = "reset" # every record of the kind has been replaced (database loaded)
+BATCH = "batch" # records of the kind have been added by a batch, the views read the records again
+
+## @brief Fields of a bike record, in the order of the database files
+BIKE_FIELDS = ("id", "number", "battery_level", "station_id", "nb_days", "nb_rents")
+
+## @brief Fields of a station record, in the order of the database files (without the docked bikes)
+STATION_FIELDS = ("id", "name", "x", "y", "nb_rents", "nb_returns")
+
+## @brief Handle of no bike / no station in the columns
+NONE = -1
+
+## @brief Fields of the bikes and of the stations whose sorted lists are read through maintained indexes
+INDEXED_BIKE_FIELDS = ("nb_days", "nb_rents")
+INDEXED_STATION_FIELDS = ("nb_rents", "nb_returns")
+
+
+class Record:
+    __slots__ = ()
+
+    ## @brief Fields of the record, in the order of the database files
+    FIELDS = ()
+
+    def keys(self):
+        return self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def get(self, field, default=None):
+        if field not in self.FIELDS:
+            return default
+        return self[field]
+
+    def items(self):
+        return [(field, self[field]) for field in self.FIELDS]
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Bike(Record):
+    __slots__ = ("store", "handle", "values")
+
+    FIELDS = BIKE_FIELDS
+
+    ## @brief view of the bike stored at some handle of the columns of a store
+    def __init__(self, store, handle):
+        self.store = store
+        ## @brief Position of the bike in the columns of the store
+        self.handle = handle
+        ## @brief Values of the fields once the bike has been removed from the store (None while it is stored)
+        self.values = None
+
+    ## @brief value of a field
+    def __getitem__(self, field):
+        if self.values is not None:
+            return self.values[field]
+        return self.store._bike_field(self.handle, field)
+
+    ## @brief change the value of a field (without notification, the mutations of the fleet go through the store)
+    def __setitem__(self, field, value):
+        if self.values is not None:
+            raise KeyError("the bike has been removed from the store")
+        self.store._set_bike_field(self.handle, field, value)
+
+    ## @brief values of the fields, as a dict
+    def copy(self):
+        if self.values is not None:
+            return dict(self.values)
+        return self.store._bike_dict(self.handle)
+
+    ## @brief keep the values of the fields, the handle is going to be reused
+    def detach(self):
+        self.values = self.copy()
+        self.store = None
+
+
+class Station(Record):
+    __slots__ = ("handle",) + STATION_FIELDS
+
+    FIELDS = STATION_FIELDS
+
+    ## @brief initialize a station record
+    # @param handle Position of the station in the columns of the store
+    def __init__(self, handle, station_id, name, x, y, nb_rents=0, nb_returns=0):
+        self.handle = handle
+        self.id = station_id
+        self.name = name
+        self.x = x
+        self.y = y
+        self.nb_rents = nb_rents
+        self.nb_returns = nb_returns
+
+    ## @brief value of a field
+    def __getitem__(self, field):
+        if field not in STATION_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    ## @brief change the value of a field (without notification, the mutations of the fleet go through the store)
+    def __setitem__(self, field, value):
+        if field not in STATION_FIELDS:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+
+class FleetStore:
+
+    ## @brief initialize the store, optionally loading a database dict (JSON format)
+    def __init__(self, data=None):
+        ## @brief bike id -> Bike (insertion ordered, used as the master bike list)
+        self.bikes_by_id = {}
+        ## @brief station id -> Station (insertion ordered, used as the master station list)
+        self.stations_by_id = {}
+        ## @brief station name -> Station
+        self.stations_by_name = {}
+        ## @brief (x, y) -> Station, used to refuse two stations at the same coordinates
+        self.stations_by_coords = {}
+        ## @brief Number given to the last bike added to the database
+        self.last_bike_number = 0
+        ## @brief Value of the "file_check" key, kept for the export
+        self.file_check = FILE_CHECK
+        ## @brief Functions called with (kind, action, record) after every mutation
+        self.listeners = []
+        ## @brief Docking order found in the loaded file, per station (only used while loading)
+        self.file_docking = {}
+        ## @brief Journal receiving every mutation as (operation, args), None if the mutations aren't saved
+        self.journal = None
+        self._clear_columns()
+
+        if data is not None:
+            self.load(data)
+
+    ## @brief empty the bike and station columns
+    def _clear_columns(self):
+        ## @brief Bike columns, indexed by the handle of the bike: id (None once the bike is removed) and number.
+        # The handles aren't reused, so that their order is the insertion order.
+        self.bike_ids = []
+        self.bike_numbers = []
+        ## @brief Battery levels (the removed bikes hold 0, so that the column can be summed as a whole)
+        self.battery_levels = array("d")
+        ## @brief 1 if the battery level is an int, so that the files are written back unchanged
+        self.battery_ints = bytearray()
+        ## @brief Value of day when the bike had 0 days: nb_days is day - day_origins, passing a day only increments day
+        self.day_origins = array("q")
+        self.day = 0
+        self.nb_rents = array("q")
+        ## @brief Handle of the station of the bike, NONE if the station doesn't exist
+        self.bike_stations = array("q")
+        ## @brief Previous and next bikes docked to the same station (NONE at the ends)
+        self.docked_previous = array("q")
+        self.docked_next = array("q")
+        ## @brief Sum of the battery levels of every bike, total number of rents and returns of the stations
+        self.battery_total = 0
+        self.rents_total = 0
+        self.returns_total = 0
+        ## @brief handle -> station id of the bikes whose station doesn't exist (or isn't loaded yet)
+        self.unknown_stations = {}
+        ## @brief field -> SortedIndex of the bikes (or of the stations), built when first used and then kept up to date
+        self.bike_indexes = {}
+        self.station_indexes = {}
+        ## @brief station handle -> SortedIndex of the docked bikes by battery level, built when first used and then kept up to date
+        self.battery_indexes = {}
+
+        ## @brief Station columns, indexed by the handle of the station: id (None once the station is removed)
+        self.station_ids = []
+        ## @brief First and last bikes docked to the station (NONE if there is none), number of docked bikes
+        self.docked_first = array("q")
+        self.docked_last = array("q")
+        self.docked_counts = array("q")
+        ## @brief Sum of the battery levels of the docked bikes (exact as long as the levels are integers)
+        self.docked_batteries = array("d")
+
+    ## @brief value of a field of the bike stored at a handle
+    def _bike_field(self, handle, field):
+        if field == "battery_level":
+            battery_level = self.battery_levels[handle]
+            return int(battery_level) if self.battery_ints[handle] else battery_level
+        if field == "nb_days":
+            return self.day - self.day_origins[handle]
+        if field == "nb_rents":
+            return self.nb_rents[handle]
+        if field == "station_id":
+            station = self.bike_stations[handle]
+            return self.station_ids[station] if station != NONE else self.unknown_stations.get(handle)
+        if field == "id":
+            return self.bike_ids[handle]
+        if field == "number":
+            return self.bike_numbers[handle]
+        raise KeyError(field)
+
+    ## @brief values of the fields of the bike stored at a handle, as a dict
+    def _bike_dict(self, handle):
+        battery_level = self.battery_levels[handle]
+        station = self.bike_stations[handle]
+        return {
+            "id": self.bike_ids[handle],
+            "number": self.bike_numbers[handle],
+            "battery_level": int(battery_level) if self.battery_ints[handle] else battery_level,
+            "station_id": self.station_ids[station] if station != NONE else self.unknown_stations.get(handle),
+            "nb_days": self.day - self.day_origins[handle],
+            "nb_rents": self.nb_rents[handle]
+        }
+
+    ## @brief change a field of the bike stored at a handle
+    # @exception KeyError the field doesn't exist or can't be written (id, station_id)
+    def _set_bike_field(self, handle, field, value):
+        if field == "battery_level":
+            previous = self.battery_levels[handle]
+            change = value - previous
+            self.battery_levels[handle] = value
+            self.battery_ints[handle] = isinstance(value, int)
+            self.battery_total += change
+            station = self.bike_stations[handle]
+            if station != NONE:
+                self.docked_batteries[station] += change
+                index = self.battery_indexes.get(station)
+                if index is not None:
+                    index.remove(previous, handle)
+                    index.insert(self.battery_levels[handle], handle)
+        elif field in ("nb_days", "nb_rents"):
+            index = self.bike_indexes.get(field)
+            if index is not None:
+                index.remove(self._bike_key(handle, field), handle)
+            if field == "nb_days":
+                self.day_origins[handle] = self.day - value
+            else:
+                self.nb_rents[handle] = value
+            if index is not None:
+                index.insert(self._bike_key(handle, field), handle)
+        elif field == "number":
+            self.bike_numbers[handle] = value
+        else:
+            raise KeyError(f"{field} can't be written")
+
+    ## @brief value of a bike in the index of a field (the days are indexed by their opposite origin, which passing a day doesn't change)
+    def _bike_key(self, handle, field):
+        if field == "nb_days":
+            return -self.day_origins[handle]
+        return self.nb_rents[handle]
+
+    ## @brief sorted index of the bikes by a field of INDEXED_BIKE_FIELDS, built if it doesn't exist yet
+    def _bike_index(self, field):
+        index = self.bike_indexes.get(field)
+        if index is None:
+            handles = [bike.handle for bike in self.bikes_by_id.values()]
+            handles.sort()
+            if field == "nb_days":
+                index = SortedIndex.from_column("q", self.day_origins, handles, negate=True)
+            else:
+                index = SortedIndex.from_column("q", self.nb_rents, handles)
+            self.bike_indexes[field] = index
+        return index
+
+    ## @brief sorted index of the stations by a field of INDEXED_STATION_FIELDS, built if it doesn't exist yet
+    def _station_index(self, field):
+        index = self.station_indexes.get(field)
+        if index is None:
+            stations = sorted(self.stations_by_id.values(), key=lambda station: (station[field], station.handle))
+            index = SortedIndex("d", [station[field] for station in stations], [station.handle for station in stations])
+            self.station_indexes[field] = index
+        return index
+
+    ## @brief sorted index of the bikes docked to a station by battery level, built if it doesn't exist yet
+    def _battery_index(self, station):
+        index = self.battery_indexes.get(station)
+        if index is None:
+            handles = self._docked_handles(station)
+            handles.sort()
+            index = SortedIndex.from_column("d", self.battery_levels, handles)
+            self.battery_indexes[station] = index
+        return index
+
+    ## @brief add a number to a counter of a station (nb_rents or nb_returns), keeping the totals and the indexes up to date
+    def _count_station(self, station, field, count):
+        index = self.station_indexes.get(field)
+        if index is not None:
+            index.remove(station[field], station.handle)
+        station[field] += count
+        if index is not None:
+            index.insert(station[field], station.handle)
+        if field == "nb_rents":
+            self.rents_total += count
+        else:
+            self.returns_total += count
+
+    ## @brief bike stored at a handle
+    def _bike_at(self, handle):
+        return self.bikes_by_id[self.bike_ids[handle]]
+
+    ## @brief station stored at a handle
+    def _station_at(self, handle):
+        return self.stations_by_id[self.station_ids[handle]]
+
+    ## @brief handle of a station from its id (NONE if it doesn't exist)
+    def _station_handle(self, station_id):
+        station = self.stations_by_id.get(station_id)
+        return NONE if station is None else station.handle
+
+    ## @brief set the station of the bike stored at a handle, docking it after the bikes already docked there
+    def _set_bike_station(self, handle, station_id):
+        if self.bike_stations[handle] != NONE:
+            self._undock(handle)
+        station = self._station_handle(station_id)
+        self.bike_stations[handle] = station
+        if station == NONE:
+            self.unknown_stations[handle] = station_id
+        else:
+            self.unknown_stations.pop(handle, None)
+            self._dock_last(handle, station)
+
+    ## @brief chain a bike after the bikes docked to a station
+    def _dock_last(self, handle, station):
+        last = self.docked_last[station]
+        self.docked_previous[handle] = last
+        self.docked_next[handle] = NONE
+        if last == NONE:
+            self.docked_first[station] = handle
+        else:
+            self.docked_next[last] = handle
+        self.docked_last[station] = handle
+        self.docked_counts[station] += 1
+        self.docked_batteries[station] += self.battery_levels[handle]
+        index = self.battery_indexes.get(station)
+        if index is not None:
+            index.insert(self.battery_levels[handle], handle)
+
+    ## @brief unchain a bike from the bikes docked to its station
+    def _undock(self, handle):
+        station = self.bike_stations[handle]
+        previous, following = self.docked_previous[handle], self.docked_next[handle]
+        if previous == NONE:
+            self.docked_first[station] = following
+        else:
+            self.docked_next[previous] = following
+        if following == NONE:
+            self.docked_last[station] = previous
+        else:
+            self.docked_previous[following] = previous
+        self.docked_counts[station] -= 1
+        self.docked_batteries[station] -= self.battery_levels[handle]
+        index = self.battery_indexes.get(station)
+        if index is not None:
+            index.remove(self.battery_levels[handle], handle)
+
+    ## @brief handles of the bikes docked to a station, in docking order
+    def _docked_handles(self, station):
+        handles = []
+        handle = self.docked_first[station]
+        while handle != NONE:
+            handles.append(handle)
+            handle = self.docked_next[handle]
+        return handles
+
+    ## @brief store a new bike in the columns
+    # @param dock False to leave the bike undocked until end_load (while loading)
+    # @return The Bike view of the bike
+    def _store_bike(self, bike_id, number, battery_level, station_id, nb_days, nb_rents, dock=True):
+        handle = len(self.bike_ids)
+        self.battery_levels.append(battery_level)
+        self.battery_ints.append(isinstance(battery_level, int))
+        self.day_origins.append(self.day - nb_days)
+        self.nb_rents.append(nb_rents)
+        self.bike_stations.append(NONE)
+        self.docked_previous.append(NONE)
+        self.docked_next.append(NONE)
+        self.bike_ids.append(bike_id)
+        self.bike_numbers.append(number)
+        self.battery_total += battery_level
+        for field, index in self.bike_indexes.items():
+            index.insert(self._bike_key(handle, field), handle)
+        if dock:
+            self._set_bike_station(handle, station_id)
+        else:
+            self.unknown_stations[handle] = station_id
+
+        bike = Bike(self, handle)
+        self.bikes_by_id[bike_id] = bike
+        return bike
+
+    ## @brief remove a bike from the columns (its handle stays unused), its Bike view keeps the values of its fields
+    def _free_bike(self, bike):
+        del self.bikes_by_id[bike["id"]]
+        handle = bike.handle
+        bike.detach()
+        for field, index in self.bike_indexes.items():
+            index.remove(self._bike_key(handle, field), handle)
+        if self.bike_stations[handle] != NONE:
+            self._undock(handle)
+        self.bike_ids[handle] = None
+        self.bike_numbers[handle] = None
+        self.battery_total -= self.battery_levels[handle]
+        self.battery_levels[handle] = 0
+        self.battery_ints[handle] = 1
+        self.unknown_stations.pop(handle, None)
+        self.bike_stations[handle] = NONE
+
+    ## @brief sum of a column of floats
+    @staticmethod
+    def _column_sum(column):
+        global numpy
+        if len(column) < NUMPY_MIN_LENGTH:
+            return sum(column)
+        if numpy is False:
+            try:
+                import numpy
+            except ImportError: # the sums are done by python
+                numpy = None
+        if numpy is None:
+            return sum(column)
+        return float(numpy.frombuffer(column, dtype=numpy.float64).sum())
+
+    ## @brief replace the content of the store with a database dict (JSON format)
+    def load(self, data):
+        self.begin_load(data.get("file_check", FILE_CHECK), data.get("last_bike_number", 0))
+        for station in data.get("stations", []):
+            self.load_station(station)
+        for bike in data.get("bikes", []):
+            self.load_bike(bike)
+        self.end_load()
+
+    ## @brief empty the store before loading records one by one (no notification until end_load)
+    def begin_load(self, file_check=FILE_CHECK, last_bike_number=0):
+        for bike in self.bikes_by_id.values(): # the records still held by the views keep their values
+            bike.detach()
+        self.bikes_by_id = {}
+        self.stations_by_id = {}
+        self.stations_by_name = {}
+        self.stations_by_coords = {}
+        self._clear_columns()
+
+        self.file_check = file_check
+        self.last_bike_number = last_bike_number
+        self.file_docking = {}
+
+    ## @brief load a station record of a database (JSON format), in any order with the bikes
+    def load_station(self, station):
+        self.file_docking[station["id"]] = station.get("docked_bikes", [])
+        self._index_station(Station(len(self.station_ids), *[station[field] for field in STATION_FIELDS]))
+
+    ## @brief load a bike record of a database (JSON format), in any order with the stations
+    def load_bike(self, bike):
+        previous = self.bikes_by_id.get(bike["id"])
+        if previous is not None: # the last record of an id wins
+            self._free_bike(previous)
+        self._store_bike(bike["id"], bike["number"], bike["battery_level"], bike["station_id"], bike["nb_days"], bike["nb_rents"], False)
+
+    ## @brief load the bikes of a database given by columns (one sequence per field of BIKE_FIELDS), like load_bike for each bike
+    def load_bikes(self, ids, numbers, battery_levels, station_ids, nb_days, nb_rents):
+        start = len(self.bike_ids)
+        if self.bikes_by_id or len(set(ids)) != len(ids): # the ids must be checked one by one
+            for values in zip(ids, numbers, battery_levels, station_ids, nb_days, nb_rents):
+                self.load_bike(dict(zip(BIKE_FIELDS, values)))
+            return
+
+        # the columns are extended at once
+        self.battery_levels.extend(battery_levels)
+        self.battery_ints.extend([isinstance(battery_level, int) for battery_level in battery_levels])
+        self.day_origins.extend([self.day - days for days in nb_days])
+        self.nb_rents.extend(nb_rents)
+        self.bike_ids.extend(ids)
+        self.bike_numbers.extend(numbers)
+        self.bike_stations.extend([NONE] * len(ids))
+        self.docked_previous.extend([NONE] * len(ids))
+        self.docked_next.extend([NONE] * len(ids))
+        self.unknown_stations.update(zip(range(start, start + len(ids)), station_ids))
+        self.bikes_by_id = {bike_id: Bike(self, handle) for handle, bike_id in enumerate(ids, start)}
+
+    ## @brief dock the loaded bikes once every record is loaded and notify the listeners
+    def end_load(self):
+        # the bike's station id is the reference, the docked lists of the file only give the order
+        waiting = self.unknown_stations
+        self.unknown_stations = {}
+        for station_id, bike_ids in self.file_docking.items():
+            for bike_id in bike_ids:
+                bike = self.bikes_by_id.get(bike_id)
+                if bike is not None and waiting.get(bike.handle) == station_id:
+                    del waiting[bike.handle]
+                    self._set_bike_station(bike.handle, station_id)
+        for handle, station_id in waiting.items():
+            self._set_bike_station(handle, station_id)
+        self.file_docking = {}
+
+        # the totals start again from the loaded values
+        self.battery_total = self._column_sum(self.battery_levels)
+        self.rents_total = sum(station.nb_rents for station in self.stations_by_id.values())
+        self.returns_total = sum(station.nb_returns for station in self.stations_by_id.values())
+
+        self._notify(STATION, RESET)
+        self._notify(BIKE, RESET)
+
+    ## @brief replace the content of the store with the content of another store (loaded in the background, it must not be used anymore)
+    def replace(self, other):
+        for bike in self.bikes_by_id.values():
+            bike.detach()
+        for bike in other.bikes_by_id.values():
+            bike.store = self
+        self.bikes_by_id = other.bikes_by_id
+        self.stations_by_id = other.stations_by_id
+        self.stations_by_name = other.stations_by_name
+        self.stations_by_coords = other.stations_by_coords
+        self.last_bike_number = other.last_bike_number
+        self.file_check = other.file_check
+        for name in COLUMNS + COUNTERS:
+            setattr(self, name, getattr(other, name))
+        self.unknown_stations = other.unknown_stations
+        self.bike_indexes = other.bike_indexes
+        self.station_indexes = other.station_indexes
+        self.battery_indexes = other.battery_indexes
+
+        self._notify(STATION, RESET)
+        self._notify(BIKE, RESET)
+
+    ## @brief export the content of the store as a database dict (JSON format)
+    def to_dict(self):
+        return {
+            "file_check": self.file_check,
+            "bikes": [bike.copy() for bike in self.bikes_by_id.values()],
+            "stations": [self.station_data(station) for station in self.stations_by_id.values()],
+            "last_bike_number": self.last_bike_number
+        }
+
+    ## @brief dict of a station as written in the database files, its docked bikes in the key order of the application's files
+    def station_data(self, station):
+        return {
+            "id": station["id"],
+            "name": station["name"],
+            "x": station["x"],
+            "y": station["y"],
+            "docked_bikes": self.docked_bike_ids(station["id"]),
+            "nb_rents": station["nb_rents"],
+            "nb_returns": station["nb_returns"]
+        }
+
+    ## @brief copy of the store, with copies of the records (the copy can be read from another thread while the store changes).
+    # The sorted indexes aren't copied, the copy builds them if it needs them.
+    def snapshot(self):
+        copy = FleetStore()
+        for name in COLUMNS:
+            setattr(copy, name, getattr(self, name)[:])
+        copy.unknown_stations = dict(self.unknown_stations)
+        for name in COUNTERS:
+            setattr(copy, name, getattr(self, name))
+        for station in self.stations_by_id.values():
+            copy._index_station(Station(station.handle, *[station[field] for field in STATION_FIELDS]))
+        copy.bikes_by_id = {bike_id: Bike(copy, bike.handle) for bike_id, bike in self.bikes_by_id.items()}
+        copy.last_bike_number = self.last_bike_number
+        copy.file_check = self.file_check
+        return copy
+
+    ## @brief register a function called with (kind, action, record) after every mutation
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    ## @brief unregister a listener
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    ## @brief notify a mutation to every listener
+    def _notify(self, kind, action, record=None):
+        for listener in list(self.listeners): # a listener may unsubscribe itself
+            listener(kind, action, record)
+
+    ## @brief give a mutation to the journal, as the name of the method and its arguments
+    def _record(self, operation, *args):
+        if self.journal is not None:
+            self.journal.record(operation, *args)
+
+    ## @brief add a station to every index, with new column entries if its handle is new
+    def _index_station(self, station):
+        self.stations_by_id[station.id] = station
+        self.stations_by_name[station.name] = station
+        self.stations_by_coords[(station.x, station.y)] = station
+        if station.handle == len(self.station_ids):
+            self.station_ids.append(station.id)
+            self.docked_first.append(NONE)
+            self.docked_last.append(NONE)
+            self.docked_counts.append(0)
+            self.docked_batteries.append(0)
+
+    ## @brief list of the bikes, in insertion order
+    def bikes(self):
+        return list(self.bikes_by_id.values())
+
+    ## @brief list of the stations, in insertion order
+    def stations(self):
+        return list(self.stations_by_id.values())
+
+    ## @brief bikes sorted by a field (insertion order if None), the ties in insertion order (reversed too if the order is reversed).
+    # The fields of INDEXED_BIKE_FIELDS give a lazy list kept sorted by the store, the other fields a sorted copy.
+    def sorted_bikes(self, field=None, reverse=False):
+        if field in INDEXED_BIKE_FIELDS:
+            return SortedView(lambda: self._bike_index(field), self._bike_at, reverse)
+        bikes = self.bikes()
+        if field is not None:
+            bikes.sort(key=lambda bike: bike[field])
+        if reverse:
+            bikes.reverse()
+        return bikes
+
+    ## @brief stations sorted by a field (insertion order if None), the ties in insertion order (reversed too if the order is reversed).
+    # The fields of INDEXED_STATION_FIELDS give a lazy list kept sorted by the store, the other fields a sorted copy.
+    def sorted_stations(self, field=None, reverse=False):
+        if field in INDEXED_STATION_FIELDS:
+            return SortedView(lambda: self._station_index(field), self._station_at, reverse)
+        stations = self.stations()
+        if field is not None:
+            stations.sort(key=lambda station: station[field])
+        if reverse:
+            stations.reverse()
+        return stations
+
+    ## @brief bikes docked to a station with more battery than a minimum, the most charged first (ties in reverse insertion order)
+    def available_bikes(self, station_id, min_battery):
+        station = self._station_handle(station_id)
+        if station == NONE:
+            return []
+        index = self._battery_index(station)
+        handles = index.handles(index.count_up_to(min_battery), len(index))
+        handles.reverse()
+        return [self._bike_at(handle) for handle in handles]
+
+    ## @brief average battery level of every bike, or of the bikes docked to a station (None if there is no bike)
+    def average_battery(self, station_id=None):
+        if station_id is None:
+            if not self.bikes_by_id:
+                return None
+            return self.battery_total / len(self.bikes_by_id)
+        station = self._station_handle(station_id)
+        if station == NONE or self.docked_counts[station] == 0:
+            return None
+        return self.docked_batteries[station] / self.docked_counts[station]
+
+    ## @brief total number of rents from the stations
+    def total_rents(self):
+        return self.rents_total
+
+    ## @brief total number of returns to the stations
+    def total_returns(self):
+        return self.returns_total
+
+    ## @brief number of bikes in the store
+    def bike_count(self):
+        return len(self.bikes_by_id)
+
+    ## @brief number of stations in the store
+    def station_count(self):
+        return len(self.stations_by_id)
+
+    ## @brief get a bike from its id (None if it doesn't exist)
+    def get_bike(self, bike_id):
+        return self.bikes_by_id.get(bike_id)
+
+    ## @brief get a station from its id (None if it doesn't exist)
+    def get_station(self, station_id):
+        return self.stations_by_id.get(station_id)
+
+    ## @brief get a station from its name (None if it doesn't exist)
+    def get_station_by_name(self, station_name):
+        return self.stations_by_name.get(station_name)
+
+    ## @brief get the station placed at some coordinates (None if there is none)
+    def get_station_at(self, x, y):
+        return self.stations_by_coords.get((x, y))
+
+    ## @brief name of a station from its id, or a default value if the station doesn't exist
+    def station_name(self, station_id, default="Unknown"):
+        station = self.stations_by_id.get(station_id)
+        if station is None:
+            return default
+        return station.name
+
+    ## @brief ids of the bikes docked to a station
+    def docked_bike_ids(self, station_id):
+        station = self._station_handle(station_id)
+        if station == NONE:
+            return []
+        return [self.bike_ids[handle] for handle in self._docked_handles(station)]
+
+    ## @brief bikes docked to a station
+    def docked_bikes(self, station_id):
+        return [self.bikes_by_id[bike_id] for bike_id in self.docked_bike_ids(station_id)]
+
+    ## @brief number of bikes docked to a station
+    def docked_count(self, station_id):
+        station = self._station_handle(station_id)
+        return 0 if station == NONE else self.docked_counts[station]
+
+    ## @brief give the next free bike number, updating the last bike number
+    def next_bike_number(self):
+        self.last_bike_number += 1
+        self._record("next_bike_number")
+        return str(self.last_bike_number)
+
+    ## @brief add a new bike, docked to an existing station
+    def add_bike(self, bike_id, bike_number, battery_level, station_id):
+        if station_id not in self.stations_by_id:
+            raise KeyError(f"station with id {station_id} doesn't exist")
+        if bike_id in self.bikes_by_id:
+            raise ValueError(f"bike with id {bike_id} already exists")
+
+        bike = self._store_bike(bike_id, bike_number, battery_level, station_id, 0, 0)
+        self._record("add_bike", bike_id, bike_number, battery_level, station_id)
+
+        self._notify(BIKE, ADDED, bike)
+        self._notify(STATION, UPDATED, self.stations_by_id[station_id])
+        return bike
+
+    ## @brief add a batch of bikes, checked as a whole before any is added, with a single notification
+    # @param bikes List of (bike_id, bike_number, battery_level, station_id), a bike number of None takes the next free number
+    # @return The added bikes
+    # @exception KeyError a station doesn't exist
+    # @exception ValueError an id or a number is already used (by the store or by the batch)
+    # @exception TypeError a battery level isn't a number
+    def add_bikes(self, bikes):
+        bikes = [tuple(bike) for bike in bikes]
+        bike_ids = set()
+        for bike_id, bike_number, battery_level, station_id in bikes:
+            if station_id not in self.stations_by_id:
+                raise KeyError(f"station with id {station_id} doesn't exist")
+            if bike_id in self.bikes_by_id or bike_id in bike_ids:
+                raise ValueError(f"bike with id {bike_id} already exists")
+            if not isinstance(battery_level, (int, float)):
+                raise TypeError(f"the battery level of the bike {bike_id} must be a number")
+            bike_ids.add(bike_id)
+
+        numbers, self.last_bike_number = self.number_bikes(bikes, lambda: set(self.bike_numbers), self.last_bike_number)
+        added = []
+        for (bike_id, bike_number, battery_level, station_id), number in zip(bikes, numbers):
+            added.append(self._store_bike(bike_id, number, battery_level, station_id, 0, 0))
+        self._record("add_bikes", bikes)
+
+        self._notify(BIKE, BATCH)
+        self._notify(STATION, UPDATED)
+        return added
+
+    ## @brief numbers of a batch of bikes: the given numbers are checked, the missing ones take the next free numbers
+    # @param bikes List of (bike_id, bike_number, battery_level, station_id), a bike number of None takes the next free number
+    # @param used_numbers Function giving the numbers used by the store (only called if the batch gives numbers)
+    # @param last_bike_number Last bike number given by the store
+    # @return (list of the numbers of the bikes, new last bike number), the last number is raised above the given numbers
+    # @exception ValueError a number is repeated in the batch or already used by the store
+    @staticmethod
+    def number_bikes(bikes, used_numbers, last_bike_number):
+        given = [str(bike[1]) for bike in bikes if bike[1] is not None]
+        if given:
+            used = {str(number) for number in used_numbers()}
+            for number in given:
+                if number in used:
+                    raise ValueError(f"bike number {number} is already used")
+                used.add(number)
+            last_bike_number = max([last_bike_number] + [int(number) for number in given if number.isdigit()])
+
+        numbers = []
+        for bike in bikes:
+            if bike[1] is None:
+                last_bike_number += 1
+                numbers.append(str(last_bike_number))
+            else:
+                numbers.append(bike[1])
+        return numbers, last_bike_number
+
+    ## @brief add a batch of stations, checked as a whole before any is added, with a single notification
+    # @param stations List of (station_id, station_name, station_x, station_y)
+    # @return The added stations
+    # @exception ValueError an id, a name or coordinates are already used (by the store or by the batch)
+    def add_stations(self, stations):
+        stations = [tuple(station) for station in stations]
+        station_ids, names, coordinates = set(), set(), set()
+        for station_id, station_name, station_x, station_y in stations:
+            if station_id in self.stations_by_id or station_id in station_ids:
+                raise ValueError(f"station with id {station_id} already exists")
+            if station_name in self.stations_by_name or station_name in names:
+                raise ValueError(f"there is already a station named {station_name}")
+            if (station_x, station_y) in self.stations_by_coords or (station_x, station_y) in coordinates:
+                raise ValueError(f"there is already a station at the coordinates ({station_x}, {station_y})")
+            station_ids.add(station_id)
+            names.add(station_name)
+            coordinates.add((station_x, station_y))
+
+        added = []
+        for station_id, station_name, station_x, station_y in stations:
+            station = Station(len(self.station_ids), station_id, station_name, station_x, station_y)
+            self._index_station(station)
+            for field, index in self.station_indexes.items():
+                index.insert(station[field], station.handle)
+            added.append(station)
+        self._record("add_stations", stations)
+
+        self._notify(STATION, BATCH)
+        return added
+
+    ## @brief add a new station
+    def add_station(self, station_id, station_name, station_x, station_y):
+        if station_id in self.stations_by_id:
+            raise ValueError(f"station with id {station_id} already exists")
+        if station_name in self.stations_by_name:
+            raise ValueError(f"there is already a station named {station_name}")
+        if (station_x, station_y) in self.stations_by_coords:
+            raise ValueError("there is already a station at these coordinates")
+
+        station = Station(len(self.station_ids), station_id, station_name, station_x, station_y)
+        self._index_station(station)
+        for field, index in self.station_indexes.items():
+            index.insert(station[field], station.handle)
+        self._record("add_station", station_id, station_name, station_x, station_y)
+
+        self._notify(STATION, ADDED, station)
+        return station
+
+    ## @brief move a bike to another station
+    def move_bike(self, bike_id, station_id):
+        bike = self.bikes_by_id[bike_id]
+        if station_id not in self.stations_by_id:
+            raise KeyError(f"station with id {station_id} doesn't exist")
+
+        previous_station = self._dock(bike, station_id)
+        self._record("move_bike", bike_id, station_id)
+
+        self._notify(BIKE, UPDATED, bike)
+        if previous_station is not None and previous_station.id != station_id:
+            self._notify(STATION, UPDATED, previous_station)
+        self._notify(STATION, UPDATED, self.stations_by_id[station_id])
+        return bike
+
+    ## @brief dock a bike to a station without notifying, returns the previous station (None if it doesn't exist)
+    def _dock(self, bike, station_id):
+        previous_station = self.stations_by_id.get(bike["station_id"])
+        self._set_bike_station(bike.handle, station_id)
+        return previous_station
+
+    ## @brief move a batch of bikes, checked as a whole before any is moved, with a single notification
+    # @param moves List of (bike_id, station_id)
+    # @exception KeyError a bike or a station doesn't exist
+    def move_bikes(self, moves):
+        moves = [tuple(move) for move in moves]
+        for bike_id, station_id in moves:
+            if bike_id not in self.bikes_by_id:
+                raise KeyError(bike_id)
+            if station_id not in self.stations_by_id:
+                raise KeyError(f"station with id {station_id} doesn't exist")
+
+        for bike_id, station_id in moves:
+            self._dock(self.bikes_by_id[bike_id], station_id)
+        self._record("move_bikes", moves)
+
+        self._notify(BIKE, UPDATED)
+        self._notify(STATION, UPDATED)
+
+    ## @brief remove a bike from the store
+    def remove_bike(self, bike_id):
+        bike = self.bikes_by_id[bike_id]
+        station = self.stations_by_id.get(bike["station_id"])
+        self._free_bike(bike)
+        self._record("remove_bike", bike_id)
+
+        self._notify(BIKE, REMOVED, bike)
+        if station is not None:
+            self._notify(STATION, UPDATED, station)
+        return bike
+
+    ## @brief remove an empty station from the store
+    def remove_station(self, station_id):
+        station = self.stations_by_id[station_id]
+        if self.docked_counts[station.handle] > 0:
+            raise ValueError("the station is not empty")
+
+        del self.stations_by_id[station_id]
+        self.station_ids[station.handle] = None # the handle isn't reused
+        self.rents_total -= station.nb_rents
+        self.returns_total -= station.nb_returns
+        for field, index in self.station_indexes.items():
+            index.remove(station[field], station.handle)
+        self.battery_indexes.pop(station.handle, None)
+        if self.stations_by_name.get(station.name) is station:
+            del self.stations_by_name[station.name]
+        if self.stations_by_coords.get((station.x, station.y)) is station:
+            del self.stations_by_coords[(station.x, station.y)]
+        self._record("remove_station", station_id)
+
+        self._notify(STATION, REMOVED, station)
+        return station
+
+    ## @brief rent a bike: use some battery, update the counters and dock the bike to the return station
+    def rent_bike(self, bike_id, station_id, battery_used):
+        bike = self.bikes_by_id[bike_id]
+        if station_id not in self.stations_by_id:
+            raise KeyError(f"station with id {station_id} doesn't exist")
+
+        bike["battery_level"] -= battery_used
+        bike["nb_rents"] += 1
+
+        current_station = self.stations_by_id.get(bike["station_id"])
+        if current_station is not None:
+            self._count_station(current_station, "nb_rents", 1)
+        target_station = self.stations_by_id[station_id]
+        self._count_station(target_station, "nb_returns", 1)
+
+        self._dock(bike, station_id)
+        self._record("rent_bike", bike_id, station_id, battery_used)
+
+        self._notify(BIKE, UPDATED, bike)
+        if current_station is not None:
+            self._notify(STATION, UPDATED, current_station)
+        if target_station is not current_station:
+            self._notify(STATION, UPDATED, target_station)
+        return bike
+
+    ## @brief one day has passed for every bike
+    def pass_day(self):
+        self.day += 1 # nb_days is computed from the day
+        self._record("pass_day")
+
+        self._notify(BIKE, UPDATED)
+
+    ## @brief release the resources of the store (nothing to release for the in-memory store)
+    def close(self):
+        pass
+
+
+## @brief Columns and handle indexes of FleetStore (shared by replace, copied by snapshot)
+COLUMNS = ("bike_ids", "bike_numbers", "battery_levels", "battery_ints", "day_origins", "nb_rents", "bike_stations",
+           "docked_previous", "docked_next", "station_ids", "docked_first", "docked_last", "docked_counts",
+           "docked_batteries")
+
+## @brief Running totals of FleetStore (shared by replace, copied by snapshot)
+COUNTERS = ("day", "battery_total", "rents_total", "returns_total")
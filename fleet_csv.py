@@ -0,0 +1,136 @@
+## @file fleet_csv.py
+#
+# @brief Streaming reader of the CSV files of bikes or stations, added to the current database in a single batch.
+# @brief The file is read row by row and each row is checked like the fields of the add windows, so that a wrong file is
+# @brief rejected before any record is added. The reader is a generator yielding its progress (0 to 1), it only fills a
+# @brief batch: the batch is added to the store afterwards, on the tkinter thread.
+# @brief A file of stations has the columns name, x, y and optionally id. A file of bikes has the columns battery_level,
+# @brief station (the name of the station) and optionally number and id. The missing ids are generated and the missing
+# @brief numbers take the next free numbers.
+#
+# @section libraries_fleet_csv Libraries/Modules
+# - csv
+# - io
+# - os
+# - uuid
+# - fleet
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import csv
+import io
+import os
+from uuid import uuid4
+from fleet import BIKE, STATION
+
+## @brief Number of rows read between two progress reports
+PROGRESS_STEP = 500
+
+## @brief Columns of a file of stations, as (required, optional) couples
+STATION_COLUMNS = ({"name", "x", "y"}, {"id"})
+
+## @brief Columns of a file of bikes, as (required, optional) couples
+BIKE_COLUMNS = ({"battery_level", "station"}, {"number", "id"})
+
+## @brief Largest coordinate of a station (in both directions)
+MAX_COORDINATE = 100
+
+
+class CSVBatch:
+
+    ## @brief initialize an empty batch, its kind is given by the header of the file
+    def __init__(self):
+        ## @brief BIKE or STATION (None until the header is read)
+        self.kind = None
+        ## @brief Records read, as (station_id, name, x, y) or (bike_id, number, battery_level, station name)
+        self.records = []
+
+    ## @brief number of records
+    def __len__(self):
+        return len(self.records)
+
+    ## @brief add the records to a store, all of them or none
+    # @return The added records
+    # @exception KeyError a bike is docked to a station that doesn't exist
+    # @exception ValueError a record is already in the store, or twice in the batch
+    def apply(self, store):
+        if self.kind == STATION:
+            return store.add_stations(self.records)
+
+        bikes = []
+        station_ids = {}
+        for bike_id, bike_number, battery_level, station_name in self.records:
+            if station_name not in station_ids:
+                station = store.get_station_by_name(station_name)
+                if station is None:
+                    raise KeyError(f"there is no station named {station_name}")
+                station_ids[station_name] = station["id"]
+            bikes.append((bike_id, bike_number, battery_level, station_ids[station_name]))
+        return store.add_bikes(bikes)
+
+
+## @brief integer of a field
+# @exception ValueError the field isn't an integer
+def _integer(row, column, line):
+    try:
+        return int(row[column])
+    except ValueError:
+        raise ValueError(f"line {line}: {column} must be an integer") from None
+
+
+## @brief station of a row, checked like the fields of the window adding a station
+def _read_station(row, line):
+    name = row["name"]
+    if name == "":
+        raise ValueError(f"line {line}: the name of the station is empty")
+    x = _integer(row, "x", line)
+    y = _integer(row, "y", line)
+    if x == 0 and y == 0:
+        raise ValueError(f"line {line}: the coordinates (0, 0) are the ones of the main warehouse")
+    if not (-MAX_COORDINATE <= x <= MAX_COORDINATE and -MAX_COORDINATE <= y <= MAX_COORDINATE):
+        raise ValueError(f"line {line}: the coordinates must be between {-MAX_COORDINATE} and {MAX_COORDINATE}")
+    return (row.get("id") or str(uuid4()), name, x, y)
+
+
+## @brief bike of a row, checked like the fields of the window adding a bike
+def _read_bike(row, line):
+    battery_level = _integer(row, "battery_level", line)
+    if not 0 <= battery_level <= 100:
+        raise ValueError(f"line {line}: the battery level must be between 0 and 100")
+    station_name = row["station"]
+    if station_name == "":
+        raise ValueError(f"line {line}: the station of the bike is empty")
+    return (row.get("id") or str(uuid4()), row.get("number") or None, battery_level, station_name)
+
+
+## @brief read a CSV file of bikes or stations into a batch, row by row (generator yielding the progress)
+# @param file File opened in binary mode
+# @param batch The CSVBatch receiving the records
+# @exception ValueError the header isn't the one of a file of bikes or stations, or a row is invalid
+def read_csv(file, batch):
+    size = max(1, os.fstat(file.fileno()).st_size)
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = [column.strip().lower() for column in next(reader, [])]
+        for kind, (required, optional) in ((STATION, STATION_COLUMNS), (BIKE, BIKE_COLUMNS)):
+            if required <= set(header) and set(header) <= required | optional:
+                batch.kind = kind
+                break
+        else:
+            raise ValueError("the header must be name,x,y[,id] for stations or battery_level,station[,number][,id] for bikes")
+        read_record = _read_station if batch.kind == STATION else _read_bike
+
+        for values in reader:
+            if not any(value.strip() for value in values): # blank line
+                continue
+            if len(values) != len(header):
+                raise ValueError(f"line {reader.line_num}: {len(header)} columns expected, {len(values)} found")
+            batch.records.append(read_record(dict(zip(header, (value.strip() for value in values))), reader.line_num))
+            if len(batch.records) % PROGRESS_STEP == 0:
+                yield file.tell() / size
+    finally:
+        text.detach() # the file is closed by its owner
+    yield 1.0
@@ -0,0 +1,186 @@
+## @file fleet_index.py
+#
+# @brief Sorted indexes of the fleet, used for the sorted lists of the summary and the rentable bikes of the stations.
+# @brief An index holds (value, handle) pairs sorted by value then by handle (insertion order), split into small buckets of
+# @brief arrays: inserting or removing a pair only moves the entries of one bucket, and the pair at a position is found by
+# @brief bisecting the bucket offsets. The store keeps its indexes up to date, the views read them page by page without
+# @brief copying nor sorting the records.
+#
+# @section libraries_fleet_index Libraries/Modules
+# - array
+# - bisect
+# - itertools
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+## @brief Number of pairs above which a bucket is split in two
+BUCKET_SIZE = 2000
+
+
+class SortedIndex:
+
+    ## @brief initialize an index from pairs already sorted
+    # @param typecode Array type of the values ("q": int64, "d": float64)
+    # @param values Values of the pairs, sorted
+    # @param handles Handles of the pairs, sorted by handle among the equal values
+    def __init__(self, typecode, values=(), handles=()):
+        self.typecode = typecode
+        ## @brief Buckets of pairs, as (values, handles) arrays
+        self.buckets = []
+        ## @brief Last pair of each bucket, to find the bucket of a pair
+        self.maxes = []
+        ## @brief Number of pairs before each bucket (None when it must be computed again)
+        self.offsets = None
+        self.length = 0
+
+        step = BUCKET_SIZE // 2 # the buckets have some room to grow
+        for start in range(0, len(handles), step):
+            self.buckets.append((array(typecode, values[start:start + step]), array("q", handles[start:start + step])))
+        self.maxes = [(bucket_values[-1], bucket_handles[-1]) for bucket_values, bucket_handles in self.buckets]
+        self.length = len(handles)
+
+    ## @brief build the index of a column
+    # @param column Values by handle
+    # @param handles Handles to index, in increasing order
+    # @param negate True to index the opposite of the values
+    @classmethod
+    def from_column(cls, typecode, column, handles, negate=False):
+        order = sorted(handles, key=column.__getitem__, reverse=negate) # stable, so the equal values keep the handle order
+        if negate:
+            return cls(typecode, [-column[handle] for handle in order], order)
+        return cls(typecode, [column[handle] for handle in order], order)
+
+    ## @brief number of pairs
+    def __len__(self):
+        return self.length
+
+    ## @brief position of a pair in a bucket (the position where it would be inserted if it isn't there)
+    @staticmethod
+    def _find(bucket, value, handle):
+        values, handles = bucket
+        start = bisect_left(values, value)
+        return bisect_left(handles, handle, start, bisect_right(values, value, start))
+
+    ## @brief add a pair
+    def insert(self, value, handle):
+        if not self.buckets:
+            self.buckets.append((array(self.typecode), array("q")))
+            self.maxes.append((value, handle))
+        index = min(bisect_left(self.maxes, (value, handle)), len(self.buckets) - 1)
+        bucket = self.buckets[index]
+        position = self._find(bucket, value, handle)
+        bucket[0].insert(position, value)
+        bucket[1].insert(position, handle)
+        self.maxes[index] = (bucket[0][-1], bucket[1][-1])
+        self.length += 1
+        self.offsets = None
+
+        if len(bucket[1]) > BUCKET_SIZE: # split the bucket in two
+            half = len(bucket[1]) // 2
+            first = (bucket[0][:half], bucket[1][:half])
+            second = (bucket[0][half:], bucket[1][half:])
+            self.buckets[index:index + 1] = [first, second]
+            self.maxes[index:index + 1] = [(first[0][-1], first[1][-1]), (second[0][-1], second[1][-1])]
+
+    ## @brief remove a pair
+    # @exception ValueError the pair isn't in the index
+    def remove(self, value, handle):
+        index = bisect_left(self.maxes, (value, handle))
+        if index == len(self.buckets):
+            raise ValueError(f"({value}, {handle}) isn't in the index")
+        bucket = self.buckets[index]
+        position = self._find(bucket, value, handle)
+        if position == len(bucket[1]) or bucket[1][position] != handle or bucket[0][position] != value:
+            raise ValueError(f"({value}, {handle}) isn't in the index")
+        del bucket[0][position]
+        del bucket[1][position]
+        if bucket[1]:
+            self.maxes[index] = (bucket[0][-1], bucket[1][-1])
+        else:
+            del self.buckets[index]
+            del self.maxes[index]
+        self.length -= 1
+        self.offsets = None
+
+    ## @brief number of pairs before each bucket
+    def _offsets(self):
+        if self.offsets is None:
+            self.offsets = list(accumulate((len(bucket[1]) for bucket in self.buckets), initial=0))
+        return self.offsets
+
+    ## @brief number of pairs whose value is lower than or equal to a value
+    def count_up_to(self, value):
+        index = bisect_right(self.maxes, (value, float("inf")))
+        if index == len(self.buckets):
+            return self.length
+        return self._offsets()[index] + bisect_right(self.buckets[index][0], value)
+
+    ## @brief handles of the pairs from a position to another (excluded)
+    def handles(self, start, stop):
+        self._offsets()
+        start, stop = max(start, 0), min(stop, self.length)
+        handles = []
+        index = bisect_right(self.offsets, start) - 1
+        while start < stop:
+            bucket_handles = self.buckets[index][1]
+            offset = self.offsets[index]
+            end = min(stop - offset, len(bucket_handles))
+            handles.extend(bucket_handles[start - offset:end])
+            start = offset + end
+            index += 1
+        return handles
+
+
+class SortedView:
+
+    ## @brief lazy list of records read through a sorted index (ties in handle order, reversed too if the order is reversed)
+    # @param get_index Function giving the current index (it is rebuilt when the data is replaced)
+    # @param get_record Function giving a record from its handle
+    # @param reverse True for the decreasing order
+    def __init__(self, get_index, get_record, reverse=False):
+        self.get_index = get_index
+        self.get_record = get_record
+        self.reverse = reverse
+
+    ## @brief number of records
+    def __len__(self):
+        return len(self.get_index())
+
+    ## @brief record at a position, or list of the records of a slice (top-K, page)
+    def __getitem__(self, index):
+        length = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            if step != 1:
+                return [self[position] for position in range(start, stop, step)]
+            return [self.get_record(handle) for handle in self._handles(start, stop)]
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("record index out of range")
+        return self.get_record(self._handles(index, index + 1)[0])
+
+    ## @brief handles of the records from a position to another (excluded)
+    def _handles(self, start, stop):
+        if stop <= start:
+            return []
+        if not self.reverse:
+            return self.get_index().handles(start, stop)
+        length = len(self)
+        handles = self.get_index().handles(length - stop, length - start)
+        handles.reverse()
+        return handles
+
+    ## @brief every record, in order
+    def __iter__(self):
+        return iter(self[:])
+
+    ## @brief nothing to read again, the index is kept up to date by the store
+    def refresh(self):
+        pass
@@ -0,0 +1,203 @@
+## @file fleet_io.py
+#
+# @brief Streaming reader and writer of the JSON databases.
+# @brief The bikes and the stations are read and written record by record, so that neither the whole text nor a second copy
+# @brief of the records is held in memory. Both are generators yielding their progress (0 to 1), so that they can be run
+# @brief a few records at a time from the tkinter event loop.
+#
+# @section libraries_fleet_io Libraries/Modules
+# - json
+# - codecs
+# - os
+# - re
+# - fleet
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import json
+import codecs
+import os
+import re
+from fleet import FILE_CHECK
+
+## @brief Number of bytes read from the file at once
+CHUNK_SIZE = 1 << 16
+
+## @brief Number of records read or written between two progress reports
+PROGRESS_STEP = 500
+
+## @brief Keys of the database holding a list of records, which are streamed
+RECORD_LISTS = ("bikes", "stations")
+
+## @brief Whitespaces allowed between JSON tokens
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+## @brief Characters that can continue a JSON number
+NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+
+## @brief Error raised when the "file_check" key of a file doesn't match the expected database
+class WrongDatabaseError(ValueError):
+    pass
+
+
+class JSONStream:
+
+    ## @brief read the JSON text of a binary file, keeping only the unread part of the current chunk in memory
+    # @param file File opened in binary mode
+    # @param chunk_size Number of bytes read at once
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        ## @brief Decoded text not parsed yet (from position)
+        self.buffer = ""
+        ## @brief Position of the next character to parse in the buffer
+        self.position = 0
+        ## @brief Number of bytes read from the file
+        self.bytes_read = 0
+        ## @brief True once the whole file has been read
+        self.eof = False
+        self.text_decoder = codecs.getincrementaldecoder("utf-8-sig")() # skips the byte order mark, even cut by a chunk
+        ## @brief Keys of the records already read, shared by every record as json.loads does
+        self.keys = {}
+        self.json_decoder = json.JSONDecoder(object_pairs_hook=self.make_object)
+
+    ## @brief build a JSON object, sharing the key strings between the records
+    def make_object(self, pairs):
+        keys = self.keys
+        return {keys.setdefault(key, key): value for key, value in pairs}
+
+    ## @brief read the next chunk of the file, dropping the parsed text (returns False at the end of the file)
+    def read(self):
+        if self.eof:
+            return False
+        data = self.file.read(self.chunk_size)
+        self.bytes_read += len(data)
+        self.eof = len(data) == 0
+        text = self.text_decoder.decode(data, final=self.eof)
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+        return True
+
+    ## @brief next character after the whitespaces, without consuming it ("" at the end of the file)
+    def peek(self):
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read():
+                return ""
+
+    ## @brief consume the next character, which must be one of the given characters
+    def expect(self, characters):
+        character = self.peek()
+        if character == "" or character not in characters:
+            raise json.JSONDecodeError(f"Expecting {' or '.join(repr(c) for c in characters)}", self.buffer, self.position)
+        self.position += 1
+        return character
+
+    ## @brief parse the next JSON value
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.read(): # the value is really invalid
+                    raise
+                continue
+            # a number cut by the end of the chunk ("12" of "12.5") may continue in the next chunk
+            is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if is_number and NUMBER_TAIL.match(self.buffer, end).end() == len(self.buffer) and self.read():
+                continue
+            self.position = end
+            return value
+
+    ## @brief check that nothing but whitespaces is left in the file
+    def end(self):
+        if self.peek() != "":
+            raise json.JSONDecodeError("Extra data", self.buffer, self.position)
+
+
+## @brief load a database file into a store, record by record (generator yielding the progress)
+# @param file File opened in binary mode
+# @param store The FleetStore receiving the records (emptied first)
+# @param file_check Expected value of the "file_check" key
+# @exception WrongDatabaseError the file holds another database
+# @exception KeyError the file has no "file_check" key, or a record misses a field
+# @exception json.JSONDecodeError the file isn't valid JSON
+def read_database(file, store, file_check=FILE_CHECK, chunk_size=CHUNK_SIZE):
+    size = max(1, os.fstat(file.fileno()).st_size)
+    stream = JSONStream(file, chunk_size)
+    store.begin_load(file_check)
+    checked = False
+    count = 0
+
+    stream.expect("{")
+    if stream.peek() == "}":
+        stream.expect("}")
+    else:
+        while True:
+            key = stream.value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError("Expecting property name", stream.buffer, stream.position)
+            stream.expect(":")
+
+            if key in RECORD_LISTS: # stream the records
+                load_record = store.load_bike if key == "bikes" else store.load_station
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        load_record(stream.value())
+                        count += 1
+                        if count % PROGRESS_STEP == 0:
+                            yield stream.bytes_read / size
+                        if stream.expect(",]") == "]":
+                            break
+            else:
+                value = stream.value()
+                if key == "file_check":
+                    if value != file_check: # stop as soon as the file is known to be another database
+                        raise WrongDatabaseError(f"the file holds a {value} database")
+                    checked = True
+                elif key == "last_bike_number":
+                    store.last_bike_number = value
+
+            if stream.expect(",}") == "}":
+                break
+    stream.end()
+
+    if not checked:
+        raise KeyError("file_check")
+    store.end_load()
+    yield 1.0
+
+
+## @brief write the content of a store as a database file, record by record (generator yielding the progress)
+# @brief The text is the same as the one written by json.dump(store.to_dict(), file).
+# @param file File opened in text mode
+# @param store The store to write (FleetStore, or SQLiteStore whose records are read by queries)
+def write_database(file, store):
+    total = max(1, store.bike_count() + store.station_count())
+    count = 0
+
+    file.write('{"file_check": ' + json.dumps(store.file_check) + ', "bikes": [')
+    for index, bike in enumerate(store.bikes()):
+        file.write((", " if index > 0 else "") + json.dumps(bike.copy()))
+        count += 1
+        if count % PROGRESS_STEP == 0:
+            yield count / total
+
+    file.write('], "stations": [')
+    for index, station in enumerate(store.stations()):
+        file.write((", " if index > 0 else "") + json.dumps(store.station_data(station)))
+        count += 1
+        if count % PROGRESS_STEP == 0:
+            yield count / total
+
+    file.write('], "last_bike_number": ' + json.dumps(store.last_bike_number) + '}')
+    yield 1.0
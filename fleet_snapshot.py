@@ -0,0 +1,327 @@
+## @file fleet_snapshot.py
+#
+# @brief Compact binary snapshot of the databases, read through a memory map.
+# @brief The bikes and the stations are stored column by column with fixed-width values, the strings (ids, numbers, names)
+# @brief once each in a string table. Opening a snapshot only reads its header, a column is only read (and its pages loaded)
+# @brief when it is used. The JSON files stay the interchange format, both formats convert into each other without loss.
+#
+# @section libraries_fleet_snapshot Libraries/Modules
+# - mmap
+# - struct
+# - array
+# - fleet
+# - fleet_io
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import mmap
+import struct
+from array import array
+from fleet import FleetStore, FILE_CHECK
+import fleet_io
+
+## @brief First bytes of every snapshot
+MAGIC = b"MRCLSNAP"
+
+## @brief Version of the snapshot layout
+VERSION = 1
+
+## @brief Header: magic, version, number of columns, number of bikes, number of stations, file_check (string index), last bike number
+HEADER = struct.Struct("<8sHHIIIq")
+
+## @brief Entry of the column directory: name, type code, offset in the file, number of values
+COLUMN_ENTRY = struct.Struct("<24sc7xQQ")
+
+## @brief Fields of the bike records, with the type code of their column (None: int64 or float64, depending on the values)
+BIKE_FIELDS = (("id", "I"), ("number", "I"), ("battery_level", None), ("station_id", "I"), ("nb_days", None), ("nb_rents", None))
+
+## @brief Fields of the station records, with the type code of their column (None: int64 or float64, depending on the values)
+STATION_FIELDS = (("id", "I"), ("name", "I"), ("x", None), ("y", None), ("nb_rents", None), ("nb_returns", None))
+
+## @brief Number of records written or loaded between two progress reports
+PROGRESS_STEP = 5000
+
+
+## @brief true if a binary file is a snapshot (the file position is kept)
+def is_snapshot(file):
+    position = file.tell()
+    magic = file.read(len(MAGIC))
+    file.seek(position)
+    return magic == MAGIC
+
+
+class Snapshot:
+
+    ## @brief open a snapshot, only its header and its column directory are read
+    # @param file File opened in binary mode (it must stay open while the snapshot is used)
+    # @exception ValueError the file isn't a snapshot
+    def __init__(self, file):
+        try:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty file
+            raise ValueError("the file isn't a snapshot")
+        if len(self.map) < HEADER.size or self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError("the file isn't a snapshot")
+
+        magic, version, nb_columns, self.nb_bikes, self.nb_stations, file_check, self.last_bike_number = HEADER.unpack_from(self.map, 0)
+        if version != VERSION:
+            self.map.close()
+            raise ValueError(f"snapshot version {version} isn't supported")
+
+        if len(self.map) < HEADER.size + nb_columns * COLUMN_ENTRY.size:
+            self.map.close()
+            raise ValueError("the snapshot is truncated")
+
+        ## @brief Column name -> (type code, offset, number of values)
+        self.directory = {}
+        for index in range(nb_columns):
+            name, code, offset, count = COLUMN_ENTRY.unpack_from(self.map, HEADER.size + index * COLUMN_ENTRY.size)
+            self.directory[name.rstrip(b"\0").decode("ascii")] = (code.decode("ascii"), offset, count)
+        ## @brief Columns already mapped, name -> memoryview
+        self.columns = {}
+        ## @brief Whole string table, decoded when a string column is first read
+        self.text = None
+        try:
+            ## @brief Offsets of the strings in the string data
+            self.string_offsets = self.column("strings/offsets")
+            ## @brief UTF-8 data of the strings
+            self.string_data = self.column("strings/data")
+            ## @brief Value of the "file_check" key of the database
+            self.file_check = self.string(file_check)
+        except (ValueError, KeyError, IndexError):
+            self.close()
+            raise ValueError("the snapshot is damaged")
+
+    ## @brief values of a column, read from the file when they are used
+    def column(self, name):
+        view = self.columns.get(name)
+        if view is None:
+            code, offset, count = self.directory[name]
+            size = struct.calcsize(code)
+            if offset + count * size > len(self.map):
+                raise ValueError("the snapshot is truncated")
+            view = memoryview(self.map)[offset:offset + count * size].cast(code)
+            self.columns[name] = view
+        return view
+
+    ## @brief string of the string table
+    def string(self, index):
+        return bytes(self.string_data[self.string_offsets[index]:self.string_offsets[index + 1]]).decode("utf-8")
+
+    ## @brief values of a string column, decoded
+    def strings(self, name):
+        offsets = self.string_offsets
+        if self.text is None:
+            self.text = bytes(self.string_data).decode("utf-8")
+        if len(self.text) == len(self.string_data): # ascii only, the byte offsets are the character offsets
+            text = self.text
+            return [text[offsets[index]:offsets[index + 1]] for index in self.column(name)]
+        return [self.string(index) for index in self.column(name)]
+
+    ## @brief values of a number column, as a list
+    def numbers(self, name):
+        values = self.column(name).tolist()
+        if name + ":int" in self.directory: # float column holding integers too
+            values = [int(value) if integer else value for value, integer in zip(values, self.column(name + ":int"))]
+        return values
+
+    ## @brief value of a column, decoded
+    def value(self, name, code, index):
+        value = self.column(name)[index]
+        if code == "I":
+            return self.string(value)
+        if name + ":int" in self.directory and self.column(name + ":int")[index]:
+            return int(value)
+        return value
+
+    ## @brief field of a bike
+    def bike_field(self, index, field):
+        return self.value("bikes/" + field, dict(BIKE_FIELDS)[field], index)
+
+    ## @brief field of a station
+    def station_field(self, index, field):
+        return self.value("stations/" + field, dict(STATION_FIELDS)[field], index)
+
+    ## @brief bike record (JSON format)
+    def bike(self, index):
+        return {field: self.bike_field(index, field) for field, code in BIKE_FIELDS}
+
+    ## @brief station record (JSON format), with its docked bikes' ids
+    def station(self, index):
+        station = {field: self.station_field(index, field) for field, code in STATION_FIELDS}
+        offsets = self.column("stations/docked_offsets")
+        docked = self.column("stations/docked")
+        bike_ids = self.column("bikes/id")
+        station["docked_bikes"] = [self.string(bike_ids[bike]) for bike in docked[offsets[index]:offsets[index + 1]]]
+        return station
+
+    ## @brief release the memory map
+    def close(self):
+        for view in self.columns.values():
+            view.release()
+        self.columns = {}
+        self.string_offsets = self.string_data = self.text = None
+        self.map.close()
+
+
+## @brief load a snapshot into a store (generator yielding the progress)
+# @param file File opened in binary mode
+# @param store The FleetStore receiving the records (emptied first)
+# @param file_check Expected value of the "file_check" key
+# @exception fleet_io.WrongDatabaseError the file holds another database
+# @exception ValueError the file isn't a snapshot
+def read_snapshot(file, store, file_check=FILE_CHECK):
+    snapshot = Snapshot(file)
+    try:
+        if snapshot.file_check != file_check:
+            raise fleet_io.WrongDatabaseError(f"the file holds a {snapshot.file_check} database")
+        store.begin_load(snapshot.file_check, snapshot.last_bike_number)
+        total = max(1, snapshot.nb_bikes + snapshot.nb_stations)
+
+        # the string columns are decoded at once, the numeric ones converted to lists
+        bike_ids = snapshot.strings("bikes/id")
+        offsets = snapshot.column("stations/docked_offsets").tolist()
+        docked = snapshot.column("stations/docked").tolist()
+        station_columns = [snapshot.strings("stations/" + field) if code == "I" else snapshot.numbers("stations/" + field) for field, code in STATION_FIELDS]
+        fields = [field for field, code in STATION_FIELDS]
+        for index, values in enumerate(zip(*station_columns)):
+            station = dict(zip(fields, values))
+            station["docked_bikes"] = [bike_ids[bike] for bike in docked[offsets[index]:offsets[index + 1]]]
+            store.load_station(station)
+            if (index + 1) % PROGRESS_STEP == 0:
+                yield (index + 1) / total
+        del station_columns, offsets, docked
+
+        bike_columns = [bike_ids if field == "id" else snapshot.strings("bikes/" + field) if code == "I" else snapshot.numbers("bikes/" + field) for field, code in BIKE_FIELDS]
+        yield (snapshot.nb_stations + snapshot.nb_bikes / 2) / total # the bike columns are given to the store at once
+        store.load_bikes(*bike_columns)
+        del bike_columns, bike_ids
+    finally:
+        snapshot.close()
+
+    store.end_load()
+    yield 1.0
+
+
+## @brief column of numbers: int64 if every value is an integer, float64 otherwise, with a mask of the integers if there are both
+def _number_columns(values, name):
+    if all(type(value) is int for value in values):
+        try:
+            return array("q", values), None
+        except OverflowError:
+            raise ValueError(f"{name} is too large to be stored in a snapshot")
+    if not all(type(value) in (int, float) for value in values):
+        raise ValueError(f"{name} must be a number to be stored in a snapshot")
+
+    integers = array("B", (type(value) is int for value in values))
+    if not any(integers):
+        return array("d", values), None
+    for value in values:
+        if type(value) is int and int(float(value)) != value:
+            raise ValueError(f"{name} is too large to be stored in a snapshot")
+    return array("d", values), integers
+
+
+## @brief write the content of a store as a snapshot (generator yielding the progress)
+# @param file File opened in binary mode
+# @param store The FleetStore to write
+# @exception ValueError a record doesn't fit in the snapshot layout (unknown field, or wrong type)
+def write_snapshot(file, store):
+    strings = {} # string -> index in the string table
+
+    def string_column(values, name):
+        column = array("I")
+        for value in values:
+            if type(value) is not str:
+                raise ValueError(f"{name} must be a string to be stored in a snapshot")
+            column.append(strings.setdefault(value, len(strings)))
+        return column
+
+    def record_columns(records, fields, kind):
+        known = {field for field, code in fields}
+        for record in records:
+            if set(record.keys()) != known:
+                raise ValueError(f"the {kind} {record.get('id')} has fields that can't be stored in a snapshot")
+        columns = {}
+        for field, code in fields:
+            values = [record[field] for record in records]
+            if code == "I":
+                columns[kind + "/" + field] = string_column(values, field)
+            else:
+                columns[kind + "/" + field], integers = _number_columns(values, field)
+                if integers is not None: # the integers of a float column are given back as integers
+                    columns[kind + "/" + field + ":int"] = integers
+        return columns
+
+    file_check = strings.setdefault(store.file_check, 0)
+    bikes = list(store.bikes_by_id.values())
+    stations = list(store.stations_by_id.values())
+    columns = {}
+
+    columns.update(record_columns(stations, STATION_FIELDS, "stations"))
+    yield 0.2
+    columns.update(record_columns(bikes, BIKE_FIELDS, "bikes"))
+    yield 0.6
+
+    # docked bikes of every station, as indexes in the bike columns
+    bike_indexes = {bike_id: index for index, bike_id in enumerate(store.bikes_by_id)}
+    docked_offsets = array("Q", [0])
+    docked = array("I")
+    for station in stations:
+        docked.extend(bike_indexes[bike_id] for bike_id in store.docked_bike_ids(station["id"]))
+        docked_offsets.append(len(docked))
+    columns["stations/docked_offsets"] = docked_offsets
+    columns["stations/docked"] = docked
+    del bike_indexes
+    yield 0.7
+
+    # string table
+    string_offsets = array("Q", [0])
+    string_data = bytearray()
+    for value in strings: # in index order
+        string_data += value.encode("utf-8")
+        string_offsets.append(len(string_data))
+    columns["strings/offsets"] = string_offsets
+    columns["strings/data"] = array("B", string_data)
+    del strings, string_data
+    yield 0.8
+
+    # header, directory, then the columns aligned on 8 bytes
+    offset = HEADER.size + len(columns) * COLUMN_ENTRY.size
+    directory = []
+    for name, column in columns.items():
+        offset = (offset + 7) // 8 * 8
+        directory.append(COLUMN_ENTRY.pack(name.encode("ascii"), column.typecode.encode("ascii"), offset, len(column)))
+        offset += len(column) * column.itemsize
+
+    file.write(HEADER.pack(MAGIC, VERSION, len(columns), len(bikes), len(stations), file_check, store.last_bike_number))
+    position = file.write(b"".join(directory)) + HEADER.size
+    for column in columns.values():
+        padding = (8 - position % 8) % 8
+        position += file.write(b"\0" * padding)
+        position += file.write(column.tobytes())
+    yield 1.0
+
+
+## @brief convert a JSON database to a snapshot, or a snapshot to a JSON database (given by the extension of the destination)
+# @param source_path Path of the database to convert (JSON or snapshot)
+# @param destination_path Path of the converted database, a snapshot if it ends with ".snap", a JSON file otherwise
+# @param file_check Expected value of the "file_check" key
+def convert(source_path, destination_path, file_check=FILE_CHECK):
+    store = FleetStore()
+    with open(source_path, "rb") as file:
+        steps = read_snapshot(file, store, file_check) if is_snapshot(file) else fleet_io.read_database(file, store, file_check)
+        for progress in steps:
+            pass
+
+    if destination_path.endswith(".snap"):
+        with open(destination_path, "wb") as file:
+            for progress in write_snapshot(file, store):
+                pass
+    else:
+        with open(destination_path, "w") as file:
+            for progress in fleet_io.write_database(file, store):
+                pass
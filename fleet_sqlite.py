@@ -0,0 +1,654 @@
+## @file fleet_sqlite.py
+#
+# @brief SQLite storage of the bikes and the stations, with the same interface as the in-memory FleetStore.
+# @brief Every mutation is a transaction, so the data is saved as soon as it changes and a database larger than the memory can be
+# @brief opened. The lists given to the views are lazy: they are read page by page with indexed queries, when the rows are shown.
+# @brief A worker thread opens its own connection to the same file: a whole database is loaded in a single transaction, while the
+# @brief other connections keep reading the previous data, and an export reads the data in a single read transaction.
+#
+# @section libraries_fleet_sqlite Libraries/Modules
+# - contextlib
+# - sqlite3
+# - fleet
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from contextlib import contextmanager
+import sqlite3
+from fleet import FleetStore, FILE_CHECK, BIKE, STATION, ADDED, UPDATED, REMOVED, RESET, BATCH
+
+## @brief Fields of the bike records, in the order of the JSON files
+BIKE_FIELDS = ("id", "number", "battery_level", "station_id", "nb_days", "nb_rents")
+
+## @brief Fields of the station records, in the order of the JSON files
+STATION_FIELDS = ("id", "name", "x", "y", "nb_rents", "nb_returns")
+
+## @brief Fields the lists can be sorted by (only indexed fields)
+SORT_FIELDS = {
+    "bikes": ("battery_level", "nb_days", "nb_rents"),
+    "stations": ("nb_rents", "nb_returns")
+}
+
+## @brief Number of rows read at once by the lazy lists
+PAGE_SIZE = 100
+
+## @brief Number of pages kept in memory by a lazy list
+CACHED_PAGES = 8
+
+## @brief Number of records inserted at once while loading
+LOAD_BATCH = 10000
+
+## @brief Tables of the database. The numeric columns have no type, so that integers and floats are kept as they are.
+TABLES = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS stations (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL UNIQUE,
+    x, y, nb_rents, nb_returns,
+    UNIQUE (x, y)
+);
+CREATE TABLE IF NOT EXISTS bikes (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    number, battery_level, station_id, nb_days, nb_rents,
+    docked_at INTEGER NOT NULL
+);
+"""
+
+## @brief Indexes of the queries of the views (dropped while loading a whole database, then built at once)
+INDEXES = """
+CREATE INDEX IF NOT EXISTS bikes_station ON bikes (station_id, battery_level);
+CREATE INDEX IF NOT EXISTS bikes_docking ON bikes (station_id, docked_at);
+CREATE INDEX IF NOT EXISTS bikes_battery ON bikes (battery_level);
+CREATE INDEX IF NOT EXISTS bikes_days ON bikes (nb_days);
+CREATE INDEX IF NOT EXISTS bikes_rents ON bikes (nb_rents);
+CREATE INDEX IF NOT EXISTS stations_rents ON stations (nb_rents);
+CREATE INDEX IF NOT EXISTS stations_returns ON stations (nb_returns);
+"""
+
+
+class QueryRows:
+
+    ## @brief lazy list of the records of a query, read page by page
+    # @param store The SQLiteStore
+    # @param table "bikes" or "stations"
+    # @param where Condition of the query ("" for every record)
+    # @param params Parameters of the condition
+    # @param order Order of the records (SQL)
+    def __init__(self, store, table, where="", params=(), order="position"):
+        self.store = store
+        self.table = table
+        self.fields = BIKE_FIELDS if table == "bikes" else STATION_FIELDS
+        self.where = " WHERE " + where if where else ""
+        self.params = tuple(params)
+        self.order = order
+        ## @brief Number of records (None until it is needed)
+        self.count = None
+        ## @brief Page number -> list of records, in the order of use
+        self.pages = {}
+
+    ## @brief number of records
+    def __len__(self):
+        if self.count is None:
+            self.count = self.store.connection.execute(f"SELECT COUNT(*) FROM {self.table}{self.where}", self.params).fetchone()[0]
+        return self.count
+
+    ## @brief record at a position, its page is read if it isn't in memory, or list of the records of a slice (top-K, page)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+
+        number = index // PAGE_SIZE
+        page = self.pages.pop(number, None)
+        if page is None:
+            # the skipped rows are only read in the index, then the rows of the page are read in the table
+            positions = [row[0] for row in self.store.connection.execute(
+                f"SELECT position FROM {self.table}{self.where} ORDER BY {self.order} LIMIT ? OFFSET ?",
+                self.params + (PAGE_SIZE, number * PAGE_SIZE))]
+            rows = {row[0]: dict(zip(self.fields, row[1:])) for row in self.store.connection.execute(
+                f"SELECT position, {', '.join(self.fields)} FROM {self.table} WHERE position IN ({', '.join('?' * len(positions))})", positions)}
+            page = [rows[position] for position in positions]
+            if len(self.pages) >= CACHED_PAGES:
+                del self.pages[next(iter(self.pages))] # least recently used page
+        self.pages[number] = page
+        return page[index % PAGE_SIZE]
+
+    ## @brief every record, read with a single query
+    def __iter__(self):
+        cursor = self.store.connection.execute(f"SELECT {', '.join(self.fields)} FROM {self.table}{self.where} ORDER BY {self.order}", self.params)
+        for row in cursor:
+            yield dict(zip(self.fields, row))
+
+    ## @brief forget the records read, the data has changed
+    def refresh(self):
+        self.count = None
+        self.pages = {}
+
+
+class SQLiteStore:
+
+    ## @brief open (or create) a database
+    # @param path Path of the SQLite file (":memory:" for a temporary database)
+    def __init__(self, path):
+        ## @brief Path of the database, opened again by the connections of the worker threads
+        self.path = path
+        ## @brief Connection to the database, only used from the thread that opened it
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL") # a commit only appends to the write-ahead log
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        with self.connection:
+            self.connection.executescript(TABLES + INDEXES)
+        ## @brief Functions called with (kind, action, record) after every mutation
+        self.listeners = []
+        ## @brief The mutations are saved by the database itself, there is no journal
+        self.journal = None
+        ## @brief Docking order found in the loaded file, per station (only used while loading)
+        self.file_docking = {}
+        ## @brief Bike rows waiting to be inserted (only used while loading)
+        self.loaded_bikes = []
+
+    ## @brief value stored in the meta table
+    def _meta(self, key, default):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    ## @brief store a value in the meta table (inside the current transaction)
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    ## @brief Value of the "file_check" key, kept for the export
+    @property
+    def file_check(self):
+        return self._meta("file_check", FILE_CHECK)
+
+    ## @brief Number given to the last bike added to the database
+    @property
+    def last_bike_number(self):
+        return self._meta("last_bike_number", 0)
+
+    ## @brief set the last bike number while loading (inside the transaction of the load)
+    @last_bike_number.setter
+    def last_bike_number(self, number):
+        self._set_meta("last_bike_number", number)
+
+    ## @brief true if the database is a file, which the connections of other threads can open (not a temporary database)
+    def is_file(self):
+        return self.path not in ("", ":memory:")
+
+    ## @brief read every query of the block from the same state of the database, even if another connection changes it meanwhile
+    @contextmanager
+    def reading(self):
+        self.connection.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            self.connection.rollback()
+
+    ## @brief next value of the docking counter, giving the order of the docked bikes
+    def _next_docking(self):
+        docking = self._meta("docking", 0) + 1
+        self._set_meta("docking", docking)
+        return docking
+
+    ## @brief record of a table from its id (None if it doesn't exist)
+    def _get(self, table, record_id):
+        fields = BIKE_FIELDS if table == "bikes" else STATION_FIELDS
+        row = self.connection.execute(f"SELECT {', '.join(fields)} FROM {table} WHERE id = ?", (record_id,)).fetchone()
+        return None if row is None else dict(zip(fields, row))
+
+    ## @brief replace the content of the store with a database dict (JSON format)
+    def load(self, data):
+        self.begin_load(data.get("file_check", FILE_CHECK), data.get("last_bike_number", 0))
+        for station in data.get("stations", []):
+            self.load_station(station)
+        for bike in data.get("bikes", []):
+            self.load_bike(bike)
+        self.end_load()
+
+    ## @brief empty the store before loading records one by one, in a single transaction ended by end_load (the other connections
+    # keep reading the previous data until it is committed, the load is rolled back if the connection is closed before)
+    def begin_load(self, file_check=FILE_CHECK, last_bike_number=0):
+        if not self.connection.in_transaction:
+            self.connection.execute("BEGIN IMMEDIATE") # the dropped indexes are part of the transaction too
+        for name in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall():
+            self.connection.execute(f"DROP INDEX {name[0]}") # faster to build once every record is inserted
+        self.connection.execute("DELETE FROM bikes")
+        self.connection.execute("DELETE FROM stations")
+        self.connection.execute("DELETE FROM meta")
+        self._set_meta("file_check", file_check)
+        self._set_meta("last_bike_number", last_bike_number)
+        self.file_docking = {}
+        self.loaded_bikes = []
+
+    ## @brief load a station record of a database (JSON format), in any order with the bikes
+    def load_station(self, station):
+        self.file_docking[station["id"]] = station.get("docked_bikes", [])
+        self.connection.execute(f"INSERT INTO stations ({', '.join(STATION_FIELDS)}) VALUES ({', '.join('?' * len(STATION_FIELDS))})", [station[field] for field in STATION_FIELDS])
+
+    ## @brief load a bike record of a database (JSON format), in any order with the stations
+    def load_bike(self, bike):
+        self.loaded_bikes.append([bike[field] for field in BIKE_FIELDS])
+        if len(self.loaded_bikes) >= LOAD_BATCH:
+            self._insert_loaded_bikes()
+
+    ## @brief load the bikes of a database given by columns (one sequence per field of BIKE_FIELDS), like load_bike for each bike
+    def load_bikes(self, ids, numbers, battery_levels, station_ids, nb_days, nb_rents):
+        for values in zip(ids, numbers, battery_levels, station_ids, nb_days, nb_rents):
+            self.load_bike(dict(zip(BIKE_FIELDS, values)))
+
+    ## @brief insert the bike rows waiting to be inserted
+    def _insert_loaded_bikes(self):
+        self.connection.executemany(f"INSERT INTO bikes ({', '.join(BIKE_FIELDS)}, docked_at) VALUES ({', '.join('?' * len(BIKE_FIELDS))}, 0)", self.loaded_bikes)
+        self.loaded_bikes = []
+
+    ## @brief give the docking order once every record is loaded, commit and notify the listeners
+    def end_load(self):
+        try:
+            self._insert_loaded_bikes()
+
+            # the docked lists of the file give the order, then the bikes in the order of the file
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS docking (id TEXT PRIMARY KEY, station_id TEXT, docked_at INTEGER)")
+            self.connection.execute("DELETE FROM docking")
+            docking = self._docking_rows()
+            self.connection.executemany("INSERT OR IGNORE INTO docking (id, station_id, docked_at) VALUES (?, ?, ?)", docking)
+            self.connection.execute("UPDATE bikes SET docked_at = docking.docked_at FROM docking WHERE bikes.id = docking.id AND bikes.station_id = docking.station_id")
+            self.connection.execute("UPDATE bikes SET docked_at = ? + position WHERE docked_at = 0", (len(docking),))
+            self.connection.execute("DELETE FROM docking")
+            self._set_meta("docking", self.connection.execute("SELECT COALESCE(MAX(docked_at), 0) FROM bikes").fetchone()[0])
+            for index in INDEXES.split(";"): # the indexes are built after the inserts, in one pass each
+                if index.strip():
+                    self.connection.execute(index)
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.rollback() # the previous records and indexes are back
+            raise
+        finally:
+            self.file_docking = {}
+            self.loaded_bikes = []
+
+        self._notify(STATION, RESET)
+        self._notify(BIKE, RESET)
+
+    ## @brief (bike id, station id, docking order) rows of the docked lists found in the loaded file
+    def _docking_rows(self):
+        rows = []
+        for station_id, bike_ids in self.file_docking.items():
+            for bike_id in bike_ids:
+                rows.append((bike_id, station_id, len(rows) + 1))
+        return rows
+
+    ## @brief replace the content of the store with the content of another store (loaded in the background)
+    def replace(self, other):
+        try:
+            self.begin_load(other.file_check, other.last_bike_number)
+            for station in other.stations():
+                station = dict(station)
+                station["docked_bikes"] = other.docked_bike_ids(station["id"])
+                self.load_station(station)
+            for bike in other.bikes():
+                self.load_bike(bike)
+        except (sqlite3.Error, KeyError):
+            self.connection.rollback()
+            self.file_docking = {}
+            self.loaded_bikes = []
+            raise
+        self.end_load()
+
+    ## @brief export the content of the store as a database dict (JSON format)
+    def to_dict(self):
+        return self.snapshot().to_dict()
+
+    ## @brief dict of a station as written in the database files, its docked bikes in the key order of the application's files
+    def station_data(self, station):
+        return {
+            "id": station["id"],
+            "name": station["name"],
+            "x": station["x"],
+            "y": station["y"],
+            "docked_bikes": self.docked_bike_ids(station["id"]),
+            "nb_rents": station["nb_rents"],
+            "nb_returns": station["nb_returns"]
+        }
+
+    ## @brief in-memory copy of the store (the copy can be read from another thread while the store changes)
+    def snapshot(self):
+        copy = FleetStore()
+        copy.begin_load(self.file_check, self.last_bike_number)
+        for station in self.stations():
+            station["docked_bikes"] = self.docked_bike_ids(station["id"])
+            copy.load_station(station)
+        for bike in self.bikes():
+            copy.load_bike(bike)
+        copy.end_load()
+        return copy
+
+    ## @brief notify the listeners that every record may have changed (a whole database has been loaded by another connection)
+    def reload(self):
+        self._notify(STATION, RESET)
+        self._notify(BIKE, RESET)
+
+    ## @brief register a function called with (kind, action, record) after every mutation
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    ## @brief unregister a listener
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    ## @brief notify a mutation to every listener
+    def _notify(self, kind, action, record=None):
+        for listener in list(self.listeners): # a listener may unsubscribe itself
+            listener(kind, action, record)
+
+    ## @brief lazy list of the bikes, in insertion order
+    def bikes(self):
+        return QueryRows(self, "bikes")
+
+    ## @brief lazy list of the stations, in insertion order
+    def stations(self):
+        return QueryRows(self, "stations")
+
+    ## @brief lazy list of the bikes sorted by an indexed field (insertion order if None)
+    def sorted_bikes(self, field=None, reverse=False):
+        return QueryRows(self, "bikes", order=self._order("bikes", field, reverse))
+
+    ## @brief lazy list of the stations sorted by an indexed field (insertion order if None)
+    def sorted_stations(self, field=None, reverse=False):
+        return QueryRows(self, "stations", order=self._order("stations", field, reverse))
+
+    ## @brief SQL order of a sorted list, ties in insertion order (reversed too if the order is reversed, as the index is read backwards)
+    def _order(self, table, field, reverse):
+        if field is None:
+            return "position DESC" if reverse else "position"
+        if field not in SORT_FIELDS[table]:
+            raise ValueError(f"the {table} can't be sorted by {field}")
+        if reverse:
+            return f"{field} DESC, position DESC"
+        return f"{field}, position"
+
+    ## @brief lazy list of the bikes docked to a station with more battery than a minimum, the most charged first (ties in reverse insertion order)
+    def available_bikes(self, station_id, min_battery):
+        return QueryRows(self, "bikes", "station_id = ? AND battery_level > ?", (station_id, min_battery), "battery_level DESC, position DESC")
+
+    ## @brief average battery level of every bike, or of the bikes docked to a station (None if there is no bike)
+    def average_battery(self, station_id=None):
+        if station_id is None:
+            return self.connection.execute("SELECT AVG(battery_level) FROM bikes").fetchone()[0]
+        return self.connection.execute("SELECT AVG(battery_level) FROM bikes WHERE station_id = ?", (station_id,)).fetchone()[0]
+
+    ## @brief total number of rents from the stations
+    def total_rents(self):
+        return self.connection.execute("SELECT COALESCE(SUM(nb_rents), 0) FROM stations").fetchone()[0]
+
+    ## @brief total number of returns to the stations
+    def total_returns(self):
+        return self.connection.execute("SELECT COALESCE(SUM(nb_returns), 0) FROM stations").fetchone()[0]
+
+    ## @brief number of bikes in the store
+    def bike_count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM bikes").fetchone()[0]
+
+    ## @brief number of stations in the store
+    def station_count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM stations").fetchone()[0]
+
+    ## @brief get a bike from its id (None if it doesn't exist)
+    def get_bike(self, bike_id):
+        return self._get("bikes", bike_id)
+
+    ## @brief get a station from its id (None if it doesn't exist)
+    def get_station(self, station_id):
+        return self._get("stations", station_id)
+
+    ## @brief get a station from its name (None if it doesn't exist)
+    def get_station_by_name(self, station_name):
+        row = self.connection.execute(f"SELECT {', '.join(STATION_FIELDS)} FROM stations WHERE name = ?", (station_name,)).fetchone()
+        return None if row is None else dict(zip(STATION_FIELDS, row))
+
+    ## @brief get the station placed at some coordinates (None if there is none)
+    def get_station_at(self, x, y):
+        row = self.connection.execute(f"SELECT {', '.join(STATION_FIELDS)} FROM stations WHERE x = ? AND y = ?", (x, y)).fetchone()
+        return None if row is None else dict(zip(STATION_FIELDS, row))
+
+    ## @brief name of a station from its id, or a default value if the station doesn't exist
+    def station_name(self, station_id, default="Unknown"):
+        row = self.connection.execute("SELECT name FROM stations WHERE id = ?", (station_id,)).fetchone()
+        return default if row is None else row[0]
+
+    ## @brief ids of the bikes docked to a station
+    def docked_bike_ids(self, station_id):
+        return [row[0] for row in self.connection.execute("SELECT id FROM bikes WHERE station_id = ? ORDER BY docked_at", (station_id,))]
+
+    ## @brief bikes docked to a station
+    def docked_bikes(self, station_id):
+        return list(QueryRows(self, "bikes", "station_id = ?", (station_id,), "docked_at"))
+
+    ## @brief number of bikes docked to a station
+    def docked_count(self, station_id):
+        return self.connection.execute("SELECT COUNT(*) FROM bikes WHERE station_id = ?", (station_id,)).fetchone()[0]
+
+    ## @brief give the next free bike number, updating the last bike number
+    def next_bike_number(self):
+        with self.connection:
+            number = self.last_bike_number + 1
+            self._set_meta("last_bike_number", number)
+        return str(number)
+
+    ## @brief add a new bike, docked to an existing station
+    def add_bike(self, bike_id, bike_number, battery_level, station_id):
+        station = self.get_station(station_id)
+        if station is None:
+            raise KeyError(f"station with id {station_id} doesn't exist")
+        if self.get_bike(bike_id) is not None:
+            raise ValueError(f"bike with id {bike_id} already exists")
+
+        bike = {
+            "id": bike_id,
+            "number": bike_number,
+            "battery_level": battery_level,
+            "station_id": station_id,
+            "nb_days": 0,
+            "nb_rents": 0
+        }
+        with self.connection:
+            self.connection.execute(f"INSERT INTO bikes ({', '.join(BIKE_FIELDS)}, docked_at) VALUES ({', '.join('?' * len(BIKE_FIELDS))}, ?)", [bike[field] for field in BIKE_FIELDS] + [self._next_docking()])
+
+        self._notify(BIKE, ADDED, bike)
+        self._notify(STATION, UPDATED, station)
+        return bike
+
+    ## @brief add a batch of bikes in a single transaction, checked as a whole before any is added, with a single notification
+    # @param bikes List of (bike_id, bike_number, battery_level, station_id), a bike number of None takes the next free number
+    # @return The added bikes
+    # @exception KeyError a station doesn't exist
+    # @exception ValueError an id or a number is already used (by the store or by the batch)
+    # @exception TypeError a battery level isn't a number
+    def add_bikes(self, bikes):
+        bikes = [tuple(bike) for bike in bikes]
+        bike_ids, station_ids = set(), set()
+        for bike_id, bike_number, battery_level, station_id in bikes: # checked in the order of the in-memory store
+            if station_id not in station_ids:
+                if self.get_station(station_id) is None:
+                    raise KeyError(f"station with id {station_id} doesn't exist")
+                station_ids.add(station_id)
+            if bike_id in bike_ids or self.get_bike(bike_id) is not None:
+                raise ValueError(f"bike with id {bike_id} already exists")
+            if not isinstance(battery_level, (int, float)):
+                raise TypeError(f"the battery level of the bike {bike_id} must be a number")
+            bike_ids.add(bike_id)
+
+        numbers, last_bike_number = FleetStore.number_bikes(bikes, lambda: [row[0] for row in self.connection.execute("SELECT number FROM bikes")], self.last_bike_number)
+        rows = []
+        with self.connection:
+            docking = self._meta("docking", 0)
+            for (bike_id, bike_number, battery_level, station_id), number in zip(bikes, numbers):
+                docking += 1
+                rows.append([bike_id, number, battery_level, station_id, 0, 0, docking])
+            self.connection.executemany(f"INSERT INTO bikes ({', '.join(BIKE_FIELDS)}, docked_at) VALUES ({', '.join('?' * len(BIKE_FIELDS))}, ?)", rows)
+            self._set_meta("last_bike_number", last_bike_number)
+            self._set_meta("docking", docking)
+
+        self._notify(BIKE, BATCH)
+        self._notify(STATION, UPDATED)
+        return [dict(zip(BIKE_FIELDS, row)) for row in rows]
+
+    ## @brief add a batch of stations in a single transaction, checked as a whole before any is added, with a single notification
+    # @param stations List of (station_id, station_name, station_x, station_y)
+    # @return The added stations
+    # @exception ValueError an id, a name or coordinates are already used (by the store or by the batch)
+    def add_stations(self, stations):
+        stations = [tuple(station) for station in stations]
+        station_ids, names, coordinates = set(), set(), set()
+        for station_id, station_name, station_x, station_y in stations:
+            if station_id in station_ids or self.get_station(station_id) is not None:
+                raise ValueError(f"station with id {station_id} already exists")
+            if station_name in names or self.get_station_by_name(station_name) is not None:
+                raise ValueError(f"there is already a station named {station_name}")
+            if (station_x, station_y) in coordinates or self.get_station_at(station_x, station_y) is not None:
+                raise ValueError(f"there is already a station at the coordinates ({station_x}, {station_y})")
+            station_ids.add(station_id)
+            names.add(station_name)
+            coordinates.add((station_x, station_y))
+
+        rows = [[station_id, station_name, station_x, station_y, 0, 0] for station_id, station_name, station_x, station_y in stations]
+        with self.connection:
+            self.connection.executemany(f"INSERT INTO stations ({', '.join(STATION_FIELDS)}) VALUES ({', '.join('?' * len(STATION_FIELDS))})", rows)
+
+        self._notify(STATION, BATCH)
+        return [dict(zip(STATION_FIELDS, row)) for row in rows]
+
+    ## @brief add a new station
+    def add_station(self, station_id, station_name, station_x, station_y):
+        if self.get_station(station_id) is not None:
+            raise ValueError(f"station with id {station_id} already exists")
+        if self.get_station_by_name(station_name) is not None:
+            raise ValueError(f"there is already a station named {station_name}")
+        if self.get_station_at(station_x, station_y) is not None:
+            raise ValueError("there is already a station at these coordinates")
+
+        station = {
+            "id": station_id,
+            "name": station_name,
+            "x": station_x,
+            "y": station_y,
+            "nb_rents": 0,
+            "nb_returns": 0
+        }
+        with self.connection:
+            self.connection.execute(f"INSERT INTO stations ({', '.join(STATION_FIELDS)}) VALUES ({', '.join('?' * len(STATION_FIELDS))})", [station[field] for field in STATION_FIELDS])
+
+        self._notify(STATION, ADDED, station)
+        return station
+
+    ## @brief move a bike to another station
+    def move_bike(self, bike_id, station_id):
+        bike = self.get_bike(bike_id)
+        if bike is None:
+            raise KeyError(bike_id)
+        if self.get_station(station_id) is None:
+            raise KeyError(f"station with id {station_id} doesn't exist")
+
+        previous_station = self.get_station(bike["station_id"])
+        with self.connection:
+            self.connection.execute("UPDATE bikes SET station_id = ?, docked_at = ? WHERE id = ?", (station_id, self._next_docking(), bike_id))
+        bike["station_id"] = station_id
+
+        self._notify(BIKE, UPDATED, bike)
+        if previous_station is not None and previous_station["id"] != station_id:
+            self._notify(STATION, UPDATED, previous_station)
+        self._notify(STATION, UPDATED, self.get_station(station_id))
+        return bike
+
+    ## @brief move a batch of bikes in a single transaction, checked as a whole before any is moved, with a single notification
+    # @param moves List of (bike_id, station_id)
+    # @exception KeyError a bike or a station doesn't exist
+    def move_bikes(self, moves):
+        moves = [tuple(move) for move in moves]
+        for bike_id, station_id in moves:
+            if self.get_bike(bike_id) is None:
+                raise KeyError(bike_id)
+        for station_id in {move[1] for move in moves}:
+            if self.get_station(station_id) is None:
+                raise KeyError(f"station with id {station_id} doesn't exist")
+
+        with self.connection:
+            docking = self._meta("docking", 0)
+            rows = []
+            for bike_id, station_id in moves:
+                docking += 1
+                rows.append((station_id, docking, bike_id))
+            self.connection.executemany("UPDATE bikes SET station_id = ?, docked_at = ? WHERE id = ?", rows)
+            self._set_meta("docking", docking)
+
+        self._notify(BIKE, UPDATED)
+        self._notify(STATION, UPDATED)
+
+    ## @brief remove a bike from the store
+    def remove_bike(self, bike_id):
+        bike = self.get_bike(bike_id)
+        if bike is None:
+            raise KeyError(bike_id)
+        station = self.get_station(bike["station_id"])
+        with self.connection:
+            self.connection.execute("DELETE FROM bikes WHERE id = ?", (bike_id,))
+
+        self._notify(BIKE, REMOVED, bike)
+        if station is not None:
+            self._notify(STATION, UPDATED, station)
+        return bike
+
+    ## @brief remove an empty station from the store
+    def remove_station(self, station_id):
+        station = self.get_station(station_id)
+        if station is None:
+            raise KeyError(station_id)
+        if self.docked_count(station_id) > 0:
+            raise ValueError("the station is not empty")
+        with self.connection:
+            self.connection.execute("DELETE FROM stations WHERE id = ?", (station_id,))
+
+        self._notify(STATION, REMOVED, station)
+        return station
+
+    ## @brief rent a bike: use some battery, update the counters and dock the bike to the return station
+    def rent_bike(self, bike_id, station_id, battery_used):
+        bike = self.get_bike(bike_id)
+        if bike is None:
+            raise KeyError(bike_id)
+        if self.get_station(station_id) is None:
+            raise KeyError(f"station with id {station_id} doesn't exist")
+
+        current_id = bike["station_id"]
+        with self.connection: # the bike and both stations change together, or not at all
+            self.connection.execute("UPDATE bikes SET battery_level = battery_level - ?, nb_rents = nb_rents + 1, station_id = ?, docked_at = ? WHERE id = ?", (battery_used, station_id, self._next_docking(), bike_id))
+            self.connection.execute("UPDATE stations SET nb_rents = nb_rents + 1 WHERE id = ?", (current_id,))
+            self.connection.execute("UPDATE stations SET nb_returns = nb_returns + 1 WHERE id = ?", (station_id,))
+        bike = self.get_bike(bike_id)
+        current_station = self.get_station(current_id)
+        target_station = self.get_station(station_id)
+
+        self._notify(BIKE, UPDATED, bike)
+        if current_station is not None:
+            self._notify(STATION, UPDATED, current_station)
+        if current_id != station_id:
+            self._notify(STATION, UPDATED, target_station)
+        return bike
+
+    ## @brief one day has passed for every bike
+    def pass_day(self):
+        with self.connection:
+            self.connection.execute("UPDATE bikes SET nb_days = nb_days + 1")
+
+        self._notify(BIKE, UPDATED)
+
+    ## @brief close the database
+    def close(self):
+        self.connection.close()
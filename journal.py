@@ -0,0 +1,338 @@
+## @file journal.py
+#
+# @brief Automatic saving of the data: an append-only journal of the mutations over the last snapshot.
+# @brief Every mutation of the store is appended to the journal as one short line, the lines are written and synced to the disk
+# @brief by batches. On startup the last snapshot is loaded and the journal replayed over it, a torn last line (crash while
+# @brief writing) is dropped. When the journal grows too large it is compacted into a new snapshot, so that saving costs
+# @brief as much as the number of changes, not as the size of the fleet. If the application stopped after an import but before
+# @brief its snapshot was written, the data is restored as it was before the import, and the journals that can't be replayed are
+# @brief kept aside.
+#
+# @section libraries_journal Libraries/Modules
+# - json
+# - os
+# - re
+# - zlib
+# - fleet
+# - fleet_snapshot
+# - metrics
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import json
+import os
+import re
+import zlib
+from fleet import FILE_CHECK, BIKE, RESET
+import fleet_snapshot
+from metrics import timed
+
+## @brief Directory holding the snapshots and the journals
+DEFAULT_DIRECTORY = "./data/autosave/"
+
+## @brief Interval (in ms) between two writes of the pending lines
+FLUSH_INTERVAL = 1000
+
+## @brief Number of pending lines written at once, even before the interval is over
+BATCH_SIZE = 1000
+
+## @brief Size (in bytes) of the journal above which it is compacted into a new snapshot
+COMPACT_SIZE = 4 << 20
+
+## @brief Methods of the store that can be replayed
+OPERATIONS = ("next_bike_number", "add_bike", "add_station", "move_bike", "remove_bike", "remove_station", "rent_bike", "pass_day",
+              "add_bikes", "add_stations", "move_bikes")
+
+## @brief First line of a journal that follows the previous one
+CONTINUE = "continue"
+
+## @brief First line of a journal that follows a replacement of the whole data (it needs its own snapshot)
+RESTART = "restart"
+
+## @brief Suffix added to the journals that can't be replayed (kept aside, they are no longer read)
+UNRESTORED_SUFFIX = ".unrestored"
+
+## @brief Names of the snapshots and the journals, numbered by generation
+FILE_NAME = re.compile(r"^(snapshot|journal)-(\d{6})\.(snap|log)$")
+
+
+class Journal:
+
+    ## @brief initialize the journal (nothing is read before open)
+    # @param directory Directory holding the snapshots and the journals
+    # @param file_check Value of the "file_check" key of the database
+    def __init__(self, directory=DEFAULT_DIRECTORY, file_check=FILE_CHECK):
+        self.directory = directory
+        self.file_check = file_check
+        ## @brief The saved store
+        self.store = None
+        ## @brief Generation of the journal being written, the snapshot of the same generation holds the data before it
+        self.generation = 0
+        ## @brief Journal file being written
+        self.file = None
+        ## @brief Size of the journal file being written
+        self.size = 0
+        ## @brief Lines not written yet
+        self.pending = []
+        ## @brief True while a new snapshot is being written
+        self.compacting = False
+        ## @brief (generation, copy of the store) of the snapshot being written, kept to finish it on close (None if no compaction)
+        self.compaction = None
+        ## @brief True if the whole data has been replaced since the last snapshot
+        self.restarted = False
+        ## @brief Paths of the journals that couldn't be replayed by open, kept aside (empty if every journal has been replayed)
+        self.unrestored = []
+
+    ## @brief path of the snapshot or the journal of a generation
+    def path(self, kind, generation):
+        extension = "snap" if kind == "snapshot" else "log"
+        return os.path.join(self.directory, f"{kind}-{generation:06d}.{extension}")
+
+    ## @brief generations of the snapshots and of the journals in the directory
+    def generations(self):
+        snapshots, journals = [], []
+        for name in os.listdir(self.directory):
+            match = FILE_NAME.match(name)
+            if match is not None:
+                (snapshots if match.group(1) == "snapshot" else journals).append(int(match.group(2)))
+        return sorted(snapshots), sorted(journals)
+
+    ## @brief load the last snapshot, replay the journals over it, then save every following mutation of the store.
+    # A journal following an import whose snapshot hasn't been written can't be replayed: the data is restored as it was before
+    # the import, a snapshot of it starts a new generation, and the journals from the import on are renamed (see unrestored).
+    # @param store The FleetStore to fill and save
+    # @return Number of replayed mutations
+    # @exception ValueError the saved data is damaged, or a journal is missing or damaged (the files are kept)
+    # @exception OSError the saved data can't be read, or the snapshot of the data restored before an import can't be written
+    def open(self, store):
+        os.makedirs(self.directory, exist_ok=True)
+        snapshots, journals = self.generations()
+        store.journal = None
+
+        # last snapshot, or an empty store
+        base = snapshots[-1] if snapshots else 0
+        if snapshots:
+            with open(self.path("snapshot", base), "rb") as file:
+                for progress in fleet_snapshot.read_snapshot(file, store, self.file_check):
+                    pass
+        else:
+            store.load({"file_check": self.file_check})
+
+        # journals of the snapshot and of the following generations
+        replayed = 0
+        self.generation = base
+        self.unrestored = []
+        for generation in [generation for generation in journals if generation >= base]:
+            if generation != self.generation and generation != self.generation + 1:
+                raise ValueError(f"the journal {self.generation + 1} is missing")
+            lines = self.replay(store, generation, generation == journals[-1], generation == base)
+            if lines is None: # replacement of the data whose snapshot hasn't been written, the previous data is restored
+                self.unrestored = [self.path("journal", later) + UNRESTORED_SUFFIX for later in journals if later >= generation]
+                break
+            replayed += lines
+            self.generation = generation
+
+        # the files that won't be used anymore (every journal has been replayed), and the snapshots interrupted by a crash
+        for name in os.listdir(self.directory):
+            if name.endswith(".snap.part"):
+                os.remove(os.path.join(self.directory, name))
+        for generation in snapshots:
+            if generation < base:
+                os.remove(self.path("snapshot", generation))
+        for generation in journals:
+            if generation < base:
+                os.remove(self.path("journal", generation))
+
+        if self.unrestored:
+            # the journals that can't be replayed are kept aside, then the restored data starts a generation after them
+            for path in self.unrestored:
+                os.replace(path[:-len(UNRESTORED_SUFFIX)], path)
+            self.generation = journals[-1] + 1
+            self.write_snapshot(self.generation, store)
+
+        self.store = store
+        self.open_file(CONTINUE)
+        store.journal = self
+        store.subscribe(self.on_fleet_change)
+        return replayed
+
+    ## @brief replay a journal over the store
+    # @param last True for the last journal, whose last line may have been torn by a crash
+    # @param loaded True if the store holds the snapshot of the same generation
+    # @return Number of replayed mutations, None if the journal can't be replayed without its snapshot
+    def replay(self, store, generation, last, loaded):
+        path = self.path("journal", generation)
+        replayed = 0
+        valid_size = 0
+        with open(path, "rb") as file:
+            for number, line in enumerate(file):
+                operation = self.decode(line)
+                if operation is None: # torn or damaged line
+                    if not last:
+                        raise ValueError(f"the journal {generation} is damaged")
+                    break
+                valid_size += len(line)
+
+                name, args = operation[0], operation[1:]
+                if number == 0: # first line, how the journal follows the snapshot
+                    if name == RESTART and not loaded:
+                        return None
+                    continue
+                if name not in OPERATIONS:
+                    raise ValueError(f"unknown operation {name} in the journal {generation}")
+                try:
+                    getattr(store, name)(*args)
+                except (KeyError, ValueError, TypeError):
+                    raise ValueError(f"the journal {generation} doesn't match the saved data")
+                replayed += 1
+
+        if os.path.getsize(path) != valid_size: # drop the torn end, the next lines are appended after the valid ones
+            with open(path, "r+b") as file:
+                file.truncate(valid_size)
+        return replayed
+
+    ## @brief encode a mutation as a journal line, checksummed to detect torn writes
+    @staticmethod
+    def encode(operation, args):
+        text = json.dumps([operation, *args], separators=(",", ":"))
+        return f"{zlib.crc32(text.encode('utf-8')):08x} {text}\n"
+
+    ## @brief decode a journal line (None if the line is torn or damaged)
+    @staticmethod
+    def decode(line):
+        if not line.endswith(b"\n") or len(line) < 10:
+            return None
+        checksum, text = line[:8], line[9:-1]
+        try:
+            if int(checksum, 16) != zlib.crc32(text):
+                return None
+            operation = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(operation, list) or not operation or not isinstance(operation[0], str):
+            return None
+        return operation
+
+    ## @brief open the journal of the current generation for appending
+    # @param start First line of a new journal (CONTINUE or RESTART)
+    def open_file(self, start):
+        path = self.path("journal", self.generation)
+        self.file = open(path, "ab")
+        self.size = self.file.tell()
+        if self.size == 0:
+            self.pending.append(self.encode(start, ()))
+            self.flush()
+        sync_directory(self.directory)
+
+    ## @brief add a mutation of the store to the journal (called by the store)
+    def record(self, operation, *args):
+        self.pending.append(self.encode(operation, args))
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    ## @brief write the pending lines and sync them to the disk
+    def flush(self):
+        if not self.pending or self.file is None:
+            return
+        data = "".join(self.pending).encode("utf-8")
+        self.pending = []
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size += len(data)
+
+    ## @brief the whole data has been replaced (database imported), it needs a new snapshot
+    def on_fleet_change(self, kind, action, record):
+        if kind == BIKE and action == RESET:
+            self.flush()
+            self.file.close()
+            self.generation += 1 # the next mutations can't be replayed over the previous snapshot
+            self.open_file(RESTART)
+            self.restarted = True
+
+    ## @brief true if the journal should be compacted into a new snapshot
+    def should_compact(self):
+        return not self.compacting and (self.restarted or self.size > COMPACT_SIZE)
+
+    ## @brief start a compaction: the next mutations go to a new journal, the snapshot is written by write_snapshot
+    # @return (generation, copy of the store) to give to write_snapshot, which can run on another thread
+    def start_compaction(self):
+        self.flush()
+        self.file.close()
+        self.generation += 1
+        self.open_file(CONTINUE)
+        self.compacting = True
+        self.restarted = False
+        self.compaction = (self.generation, self.store.snapshot())
+        return self.compaction
+
+    ## @brief write the snapshot of a generation, then remove the files it replaces (can run on another thread)
+    @timed("io.journal_snapshot")
+    def write_snapshot(self, generation, copy, task=None):
+        path = self.path("snapshot", generation)
+        temporary_path = path + ".part"
+        try:
+            with open(temporary_path, "wb") as file:
+                for progress in fleet_snapshot.write_snapshot(file, copy):
+                    if task is not None:
+                        task.report(progress)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, path) # the snapshot only exists once complete
+        except BaseException: # cancelled or failed, the journals are kept
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        sync_directory(self.directory)
+
+        snapshots, journals = self.generations()
+        for old in snapshots:
+            if old < generation:
+                os.remove(self.path("snapshot", old))
+        for old in journals:
+            if old < generation:
+                os.remove(self.path("journal", old))
+
+    ## @brief the compaction is over (called on the thread of the store)
+    def end_compaction(self, error=None):
+        self.compacting = False
+        self.compaction = None
+        if error is not None: # the snapshot will be written by the next compaction
+            self.restarted = True
+
+    ## @brief write the snapshot of an unfinished compaction (cancelled background task), or of replaced data, without waiting
+    # @exception OSError the snapshot can't be written (the journals are kept)
+    def finish_compaction(self):
+        if self.compaction is None and not self.restarted:
+            return
+        generation, copy = self.compaction if self.compaction is not None else self.start_compaction()
+        try:
+            self.write_snapshot(generation, copy)
+        except BaseException as error:
+            self.end_compaction(error)
+            raise
+        self.end_compaction()
+
+    ## @brief write the pending lines and stop saving the store
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.store is not None:
+            self.store.journal = None
+            self.store.unsubscribe(self.on_fleet_change)
+            self.store = None
+
+
+## @brief sync a directory, so that the created and renamed files are on the disk (not possible on Windows)
+def sync_directory(directory):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
@@ -12,38 +12,53 @@
 #
 # @brief Main file for the application.
 # @brief Contains the main window and the main loop.
+# @brief The windows only read the entries of the user, the operations are checked and applied by the engine (core.py).
 #
 # @section libraries_main Libraries/Modules
 # - tkinter
-# - json
-# - pillow (PIL)
-# - networkx
-# - matplotlib
+# - matplotlib (imported by the first route displayed)
 # - uuid
-# - ctypes
+# - sqlite3
+# - sys
+# - core
+# - fleet
+# - fleet_io
+# - tasks
+# - journal
+# - widgets
+# - route
+# - metrics
+# - diagnostics (imported by the first Diagnostics window)
+# - route_plot (imported by the first route displayed)
 #
 # @author Vincent Gonnet
 #
 # @date 2022/05/10
 
 # importation of the libraries
-from asyncio.windows_events import NULL
 from tkinter import *
 from tkinter import ttk
 from tkinter import filedialog
 from tkinter.messagebox import showinfo
 import tkinter as tk
-from PIL import Image, ImageTk
-import json
 from uuid import uuid4
-from ctypes import *
-import networkx as nx
-import matplotlib.pyplot as plt
+import sqlite3
+import sys
+import core
+from core import FleetError
+from fleet import FILE_CHECK, BIKE, ADDED, REMOVED, RESET, BATCH
+from widgets import VirtualTable, TaskStatusBar, load_icon
+import fleet_io
+from tasks import TaskScheduler, TaskCancelled
+import journal
+import route
+from metrics import timed
 
 class App(tk.Tk):
 
     ## @brief initialize the main window
-    def __init__(self):
+    # @param database Optional path of a SQLite database holding the data, the data is kept in memory and journaled otherwise
+    def __init__(self, database=None):
         tk.Tk.__init__(self)
         self.title("Le Marcel Manager")
         self.resizable(False, False)
@@ -51,90 +66,150 @@ class App(tk.Tk):
         self.columnconfigure(0, weight=1)
         self.columnconfigure(1, weight=1)
 
-        self.init_variables()
+        self.init_variables(database)
         self.load_admin_widgets()
+        self.fleet.subscribe(self.on_fleet_change) # patch the tables after every mutation of the data
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.after(journal.FLUSH_INTERVAL, self.save)
+
+    ## @brief close the application, saving the last mutations and cancelling the background tasks
+    def close(self):
+        saving = self.core.journal is not None and (self.core.journal.compacting or self.core.journal.restarted)
+        self.scheduler.shutdown(wait=saving) # a cancelled snapshot is written again below, not while its task still writes it
+        try:
+            self.core.close()
+        except OSError as error:
+            showinfo("Saving failed", "The last snapshot can't be written: " + str(error) + ". The last changes may not be restored on the next start.")
+        self.destroy()
+
+    ## @brief save the last mutations, and compact the journal into a new snapshot in the background when it is too large
+    def save(self):
+        if self.core.journal is None:
+            return
+        try:
+            if self.core.flush():
+                saving = self.core.journal
+                generation, copy = saving.start_compaction()
+                # a cancelled snapshot ends the compaction too, the next one writes it again
+                self.scheduler.submit("Saving a snapshot", lambda task: saving.write_snapshot(generation, copy, task), on_done=lambda result: saving.end_compaction(),
+                                      on_error=saving.end_compaction, on_cancel=lambda: saving.end_compaction(TaskCancelled()))
+        except OSError as error: # the data can't be saved anymore
+            self.core.stop_saving()
+            showinfo("Saving stopped", "The data can't be saved anymore: " + str(error) + ". Please export it before closing the application.")
+            return
+        self.after(journal.FLUSH_INTERVAL, self.save)
 
     ## @brief initialize the variables
-    def init_variables(self):
+    # @param database Optional path of a SQLite database holding the data
+    def init_variables(self, database=None):
         ## @brief Current user mode (Administrator or User)
         self.administrator_mode = "Administrator"
         ## @brief Color of the text in the change-user-mode button
         self.usermode_button_foreground = "red"
-        ## @brief Variable that holds all the data loaded in our application
-        self.data = {"file_check": "data_marcel_manager", "bikes": [], "stations": [], "last_bike_number": 0}
+        ## @brief Engine holding the data and checking the operations of the user (the data is restored from the journal)
+        self.core = core.FleetManager(database)
+        ## @brief Indexed store that holds all the data loaded in our application
+        self.fleet = self.core.fleet
+        if self.core.restore_error is not None: # damaged saved data, the application starts empty and doesn't save
+            showinfo("Saved data not restored", "The saved data can't be restored: " + str(self.core.restore_error) + ". Changes won't be saved automatically.")
+        elif self.core.restore_warning is not None: # stopped right after an import, the data before it is restored and saved
+            showinfo("Saved data partly restored", self.core.restore_warning + ".")
         
-        img = Image.open("img/pin.png")
-        img = img.resize((10, 10), Image.LANCZOS)
+        # the icons are resized by the first launch only
         ## @brief The pin image
-        self.pin_image = ImageTk.PhotoImage(img)
-        img = Image.open("img/bin.png")
-        img = img.resize((10,10), Image.LANCZOS)
+        self.pin_image = load_icon("img/pin.png", (10, 10))
         ## @brief The bin image
-        self.bin_image = ImageTk.PhotoImage(img)
-        img = Image.open("img/bike.png")
-        img = img.resize((10,10), Image.LANCZOS)
+        self.bin_image = load_icon("img/bin.png", (10, 10))
         ## @brief The bike image
-        self.bike_image = ImageTk.PhotoImage(img)
+        self.bike_image = load_icon("img/bike.png", (10, 10))
         ## @brief Station's sorting mode in the summary window (0 = by number of rents, 1 = by number of returns)
         self.stations_sort = 0
         ## @brief Station's sorting mode in the summary window (0 = by days, 1 = by times rented)
         self.bikes_sort = 0
+        ## @brief Id of the station selected in the user mode (None if no station is selected)
+        self.user_station_id = None
+        ## @brief Runs the import, export and route computation in the background
+        self.scheduler = TaskScheduler(self)
 
-    ## @brief display the shortest path to visit all the stations
+    ## @brief display the maintenance window, to choose how the route is computed and how many vans are used
     def maintenance(self):
-        if len(self.data["stations"]) < 2:
+        if self.fleet.station_count() < 2:
             tk.messagebox.showinfo("Not enough stations", "You need at least two stations in the database to use this feature.")
             return
-        fc = CDLL('./tsp.o') # load the library
-        fc.tsp.argtypes = (c_int, POINTER(c_int)) # set the arguments' type of the function
-        fc.tsp.restype = POINTER(c_int) # set the return type of the function
-        list = [0, 0] # create the list containing the stations' coordinates (x, y), the first element is the start station (warehouse)
-        for station in self.data["stations"]:
-            list.append(station["x"])
-            list.append(station["y"])
-        length = len(list)
-        args = c_int * length
-        result_list = fc.tsp(length, args(*list)) # call the function and store the result
-
-        ordered_stations = [] # list of stations by visit order
-        for i in range(0, int(length/2)):
-            if result_list[i]-2 >= 0:
-                ordered_stations.append(self.data["stations"][result_list[i]-2]["name"])
-        
-        G = nx.Graph() # instantiate a graph
-    
-        # create and seed a node list with the stations' name and coordinates
-        nodes = [("Warehouse", {"coords": (0, 0)})]
-        for station in ordered_stations:
-            for station_data in self.data["stations"]:
-                if station_data["name"] == station:
-                    nodes.append((station_data["name"], {"coords": (station_data["x"], station_data["y"])}))
-                    break
-        G.add_nodes_from(nodes) # add the nodes to the graph
-
-        # create and seed an edge list
-        edges = [("Warehouse", ordered_stations[0])]
-        for i in range(0, len(ordered_stations)-1):
-            edges.append((ordered_stations[i], ordered_stations[i+1]))
-        G.add_edges_from(edges) # add the edges to the graph
-
-        coords = nx.get_node_attributes(G, "coords") # get the coordinates of the nodes
-
-        nx.draw(
-            G,
-            pos = coords,
-            with_labels = True,
-            font_weight = 'bold',
-            node_size = 400,
-            node_color = '#e3fafb',
-            edge_color = '#8c8d8d',
-            arrows = True,
-            arrowsize = 15,
-            arrowstyle = "-|>",
-            font_color = "#8B0000"
-        ) # load the graph with all the attributes
-
-        plt.show() # display the graph
+
+        toplevel = Toplevel()
+        toplevel.title("Maintenance route")
+        toplevel.geometry("280x125")
+        toplevel.resizable(False, False)
+        toplevel.columnconfigure(0, weight=1)
+        toplevel.columnconfigure(1, weight=2)
+
+        selected_mode = tk.StringVar(toplevel)
+        selected_mode.set(route.AUTO) # default value
+        nb_vans = tk.StringVar(toplevel)
+        nb_vans.set("1")
+        capacity = tk.StringVar(toplevel)
+        capacity.set("") # no limit by default
+
+        ttk.Label(toplevel, text="Solving mode").grid(row=0, column=0, padx=10, pady=3)
+        ttk.OptionMenu(toplevel, selected_mode, route.AUTO, *route.MODES).grid(row=0, column=1, padx=10, pady=3) # dropdown menu, updating selected_mode
+        ttk.Label(toplevel, text="Number of vans").grid(row=1, column=0, padx=10, pady=3)
+        ttk.Entry(toplevel, textvariable=nb_vans).grid(row=1, column=1, padx=10, pady=3)
+        ttk.Label(toplevel, text="Van capacity").grid(row=2, column=0, padx=10, pady=3)
+        ttk.Entry(toplevel, textvariable=capacity).grid(row=2, column=1, padx=10, pady=3)
+        ttk.Button(toplevel, text="Confirm", command=lambda: confirm()).grid(row=3, column=0, pady=3)
+
+        # @brief check the entries, then close the window and display the route(s)
+        def confirm():
+            if not nb_vans.get().isnumeric() or int(nb_vans.get()) < 1: # check if the number of vans is a positive integer
+                tk.messagebox.showinfo("Error", "The number of vans must be a positive integer.")
+                return
+            if capacity.get() != "" and (not capacity.get().isnumeric() or int(capacity.get()) < 1): # check if the capacity is empty or a positive integer
+                tk.messagebox.showinfo("Error", "The van capacity must be empty (no limit) or a positive integer.")
+                return
+
+            toplevel.destroy()
+            self.display_route(selected_mode.get(), int(nb_vans.get()), int(capacity.get()) if capacity.get() != "" else None)
+
+        toplevel.mainloop()
+
+    ## @brief compute the shortest path(s) to visit all the stations in the background, then display them
+    # @param mode Solving mode of the route (exact, heuristic or auto)
+    # @param nb_vans Number of vans sharing the stations
+    # @param capacity Number of bikes a van can carry (None for no limit)
+    @timed("ui.maintenance")
+    def display_route(self, mode, nb_vans=1, capacity=None):
+        try:
+            plan = self.core.route_plan(nb_vans, capacity) # the stations are read here, on the tkinter thread
+        except FleetError as error:
+            tk.messagebox.showinfo("Error", str(error))
+            return
+
+        def compute(task): # worker thread, only uses the lists read by the plan
+            return plan.compute(mode)
+
+        def failed(error):
+            if isinstance(error, MemoryError):
+                tk.messagebox.showinfo("Error", "Not enough memory to compute the maintenance route.")
+            elif isinstance(error, ValueError): # the vans can't carry every bike
+                tk.messagebox.showinfo("Error", "Impossible to plan the routes: " + str(error) + ".")
+            elif isinstance(error, OSError): # the solver isn't built for this platform
+                tk.messagebox.showinfo("Error", "The route solver can't be loaded: " + str(error) + ".")
+            else:
+                raise error
+
+        self.scheduler.submit("Computing the maintenance route", compute, on_done=lambda routes: self.show_route(routes, plan), on_error=failed)
+
+    ## @brief display the computed route(s)
+    # @param routes List of routes (route.Route)
+    # @param plan The core.RoutePlan giving the stations' coordinates and names
+    @timed("ui.show_route")
+    def show_route(self, routes, plan):
+        from route_plot import RoutePlot, RouteWindow # matplotlib is only loaded when a route is displayed
+
+        # batched drawing embedded in a window, the application keeps running
+        plot = RoutePlot(routes, plan.coordinates, plan.names, plan.title(routes))
+        RouteWindow(self, plot)
 
     ## @brief load the application in the administrator mode
     def load_admin_widgets(self):
@@ -144,13 +219,16 @@ class App(tk.Tk):
         # import / export data
         self.data_management_frame = ttk.Frame(self)
         self.data_management_frame.grid(row=0, column=0, padx=10, sticky="w") 
-        tk.Button(self.data_management_frame, text="Import Data", width=15, command= lambda: self.import_action("data_marcel_manager")).grid(row=0, column=0)
-        tk.Button(self.data_management_frame, text="Export Data", width=15, command= lambda: self.export_action("data", self.data)).grid(row=0, column=1)
+        tk.Button(self.data_management_frame, text="Import Data", width=15, command= lambda: self.import_action(FILE_CHECK)).grid(row=0, column=0)
+        tk.Button(self.data_management_frame, text="Export Data", width=15, command= lambda: self.export_action("data")).grid(row=0, column=1)
 
         # summary & pass day button
         def pass_day():
-            for bike in self.data["bikes"]:
-                bike["nb_days"] += 1
+            try:
+                self.core.pass_day()
+            except FleetError as error: # a database is being imported
+                showinfo("Error", str(error))
+                return
             showinfo("Pass day", "One day has passed")
         
         summ_frame = ttk.Frame(self)
@@ -172,6 +250,20 @@ class App(tk.Tk):
         self.bike_list.grid(row=1, column=0, padx=10, pady=3, sticky="w")
         self.bike_list.grid_rowconfigure(0, weight=1)
         self.bike_list.grid_columnconfigure(0, weight=1)
+
+        ## @brief Virtualized bike table, only the visible rows are materialized
+        self.bike_table = VirtualTable(
+            self.bike_list,
+            headers = ["Bike n°", "Battery", "Station"],
+            format_row = lambda bike: (bike["number"], bike["battery_level"], self.fleet.station_name(bike["station_id"])),
+            actions = [
+                (self.pin_image, self.change_bike_station_window), # change location
+                (self.bin_image, lambda bike: self.remove_bike(bike["id"])) # remove the bike
+            ],
+            widths = [7, 7, 12],
+            key = lambda bike: bike["id"]
+        )
+        self.bike_table.grid(row=0, column=0, sticky="nsew")
         
         self.load_bike_list()
 
@@ -180,6 +272,20 @@ class App(tk.Tk):
         self.station_list.grid(row=1, column=1, padx=10, pady=3, sticky="w")
         self.station_list.grid_rowconfigure(0, weight=1)
         self.station_list.grid_columnconfigure(0, weight=1)
+
+        ## @brief Virtualized station table, only the visible rows are materialized
+        self.station_table = VirtualTable(
+            self.station_list,
+            headers = ["Station name", "Docked bikes"],
+            format_row = lambda station: (station["name"], self.fleet.docked_count(station["id"])),
+            actions = [
+                (self.bike_image, lambda station: self.display_bikes_window(station["id"])), # display the bikes docked to the station
+                (self.bin_image, lambda station: self.remove_station(station["id"])) # remove the station
+            ],
+            widths = [13, 12],
+            key = lambda station: station["id"]
+        )
+        self.station_table.grid(row=0, column=0, sticky="nsew")
         
         self.load_station_list()
 
@@ -187,121 +293,75 @@ class App(tk.Tk):
         ttk.Button(self, text="Add bike", command=self.add_bike_window).grid(row=2, column=0, padx=10, pady=3, sticky="w")
         ttk.Button(self, text="Add station", command=self.add_station_window).grid(row=2, column=1, padx=10, pady=3, sticky="w")
 
-    ## @brief load the bikes into a table
-    def load_bike_list(self):
-        for widget in self.bike_list.winfo_children(): # delete the frame content (refresh process)
-            widget.destroy()
-        
-        self.bike_list_canvas = tk.Canvas(self.bike_list) # create the canvas that will contain the scrollbar and the list
-        self.bike_list_canvas.grid(row=0, column=0, sticky="nsew")
-        
-        self.bike_list_scrollbar = ttk.Scrollbar(self.bike_list, orient="vertical", command=self.bike_list_canvas.yview) # create the scrollbar and link it to the canvas
-        self.bike_list_scrollbar.grid(row=0, column=1, sticky="ns")
-        self.bike_list_canvas.configure(yscrollcommand=self.bike_list_scrollbar.set)
-
-        self.bikes_frame_data = tk.Frame(self.bike_list_canvas) # create the frame that will contain the data
-        self.bike_list_canvas.create_window((0, 0), window=self.bikes_frame_data, anchor='nw')
-
-        ttk.Label(self.bikes_frame_data, text="Bike n°").grid(row=0, column=0) #create the headers
-        ttk.Label(self.bikes_frame_data, text="Battery").grid(row=0, column=1)
-        ttk.Label(self.bikes_frame_data, text="Station").grid(row=0, column=2)
-
-        # seed the list with the bikes' info
-        index = 1
-        for bike in self.data["bikes"]:
-            ttk.Label(self.bikes_frame_data, text=bike["number"]).grid(row=index, column=0) # bike number
-            ttk.Label(self.bikes_frame_data, text=bike["battery_level"]).grid(row=index, column=1) # bike battery
-
-            # station name
-            station_found = False
-            for station in self.data["stations"]:
-                if station["id"] == bike["station_id"]:
-                    ttk.Label(self.bikes_frame_data, text=station["name"]).grid(row=index, column=2)
-                    station_found = True
-                    break
-            if not station_found:
-                ttk.Label(self.bikes_frame_data, text="Unknown").grid(row=index, column=2)
-
-            ttk.Button(self.bikes_frame_data, text="", image=self.pin_image, command=lambda bike=bike: self.change_bike_station_window(bike)).grid(row=index, column=3, padx=5) # change location
-            ttk.Button(self.bikes_frame_data, text="", image=self.bin_image, command=lambda id=bike["id"]: [self.remove_bike(id), self.load_bike_list(), self.load_station_list()]).grid(row=index, column=4, padx=5) # remove the bike
-            
-
-            index += 1
+        # latencies of the operations
+        ttk.Button(self, text="Diagnostics", command=self.diagnostics_action).grid(row=2, column=3, padx=10, pady=3, sticky="e")
+
+        # status of the background tasks
+        TaskStatusBar(self, self.scheduler).grid(row=3, column=0, columnspan=4, padx=10, pady=3, sticky="ew")
+
+    ## @brief patch the displayed tables after a mutation of the data (only the affected rows are redrawn)
+    @timed("ui.patch_tables")
+    def on_fleet_change(self, kind, action, record):
+        if self.administrator_mode == "Administrator":
+            table = self.bike_table if kind == BIKE else self.station_table
+            if action in (RESET, BATCH): # the whole list is read again
+                table.set_rows(self.fleet.bikes() if kind == BIKE else self.fleet.stations())
+            elif action == ADDED:
+                table.insert_record(record)
+            elif action == REMOVED:
+                table.remove_record(record)
+            elif record is None: # every record has been updated
+                table.update_records()
+            else:
+                table.update_record(record)
 
-        self.bikes_frame_data.update_idletasks()  # update geometry of the frame
+        elif kind == BIKE and self.user_station_id is not None: # user mode, reload the list if it shows the bike
+            if record is None or action in (RESET, BATCH) or record["station_id"] == self.user_station_id or self.user_bike_table.position_of(record) is not None:
+                self.load_user_bike_list(self.user_station_id)
 
-        self.bike_list_canvas.config(width=200 + self.bike_list_scrollbar.winfo_width(), height=300) # update the canvas size
-        self.bike_list_canvas.config(scrollregion=self.bike_list_canvas.bbox("all")) # update the scroll region
+    ## @brief load the bikes into the table (only the visible rows are redrawn)
+    @timed("ui.load_bike_list")
+    def load_bike_list(self):
+        self.bike_table.set_rows(self.fleet.bikes())
 
-    ## @brief load the stations into a table
+    ## @brief load the stations into the table (only the visible rows are redrawn)
+    @timed("ui.load_station_list")
     def load_station_list(self):
-        for widget in self.station_list.winfo_children(): # delete the frame content (refresh process)
-            widget.destroy()
-        
-        self.station_list_canvas = tk.Canvas(self.station_list) # create the canvas that will contain the scrollbar and the list
-        self.station_list_canvas.grid(row=0, column=0, sticky="nsew")
-        
-        self.station_list_scrollbar = ttk.Scrollbar(self.station_list, orient="vertical", command=self.station_list_canvas.yview) # create the scrollbar and link it to the canvas
-        self.station_list_scrollbar.grid(row=0, column=1, sticky="ns")
-        self.station_list_canvas.configure(yscrollcommand=self.station_list_scrollbar.set)
+        self.station_table.set_rows(self.fleet.stations())
 
-        self.stations_frame_data = tk.Frame(self.station_list_canvas) # create the frame that will contain the data
-        self.station_list_canvas.create_window((0, 0), window=self.stations_frame_data, anchor='nw')
+    ## @brief display the bikes docked to a station
+    def display_bikes_window(self, station_id):
+        station = self.fleet.get_station(station_id)
+        if station is None:
+            return
 
-        ttk.Label(self.stations_frame_data, text="Station name").grid(row=0, column=0) #create the headers
-        ttk.Label(self.stations_frame_data, text="Docked bikes").grid(row=0, column=1)
+        # check if there are bikes docked to the station
+        if self.fleet.docked_count(station_id) == 0:
+            tk.messagebox.showinfo("No bikes", "There are no bikes docked to this station")
+            return
 
-        # seed the list with the stations' info
-        index = 1
-        for station in self.data["stations"]:
-            ttk.Label(self.stations_frame_data, text=station["name"]).grid(row=index, column=0)
-            ttk.Label(self.stations_frame_data, text=str(len(station["docked_bikes"]))).grid(row=index, column=1)
+        # create a top-level window with a bike list 
+        bikes_window = tk.Toplevel(self)
+        bikes_window.title("Bikes docked at " + station["name"])
+        bikes_window.geometry("300x130")
+        bikes_window.resizable(False, True)
 
-            ttk.Button(self.stations_frame_data, text="", image=self.bike_image, command=lambda id=station["id"]: self.display_bikes_window(id)).grid(row=index, column=2, padx=5) # display the bikes docked to the station
-            ttk.Button(self.stations_frame_data, text="", image=self.bin_image, command=lambda id=station["id"]: [self.remove_station(id), self.load_bike_list(), self.load_station_list()]).grid(row=index, column=3, padx=5) # remove the station
+        ttk.Label(bikes_window, text="Bike n°").grid(row=0, column=0, pady=10)
+        ttk.Label(bikes_window, text="Battery level").grid(row=0, column=1, pady=10)
 
+        index = 1
+        for bike in self.fleet.docked_bikes(station_id):
+            ttk.Label(bikes_window, text=bike["number"]).grid(row=index, column=0)
+            ttk.Label(bikes_window, text=bike["battery_level"]).grid(row=index, column=1)
             index += 1
+        
+        ttk.Button(bikes_window, text="Close", command=bikes_window.destroy).grid(row=index+1, column=0, padx=50, pady=20)
 
-        self.stations_frame_data.update_idletasks()  # update geometry of the frame
-
-        self.station_list_canvas.config(width=200 + self.station_list_scrollbar.winfo_width(), height=300) # update the canvas size
-        self.station_list_canvas.config(scrollregion=self.station_list_canvas.bbox("all")) # update the scroll region
-
-    ## @brief display the bikes docked to a station
-    def display_bikes_window(self, station_id):
-        for station in self.data["stations"]:
-            if station["id"] == station_id:
-
-                # check if there are bikes docked to the station
-                if len(station["docked_bikes"]) == 0:
-                    tk.messagebox.showinfo("No bikes", "There are no bikes docked to this station")
-                    return
-
-                # create a top-level window with a bike list 
-                bikes_window = tk.Toplevel(self)
-                bikes_window.title("Bikes docked at " + station["name"])
-                bikes_window.geometry("300x130")
-                bikes_window.resizable(False, True)
-
-                ttk.Label(bikes_window, text="Bike n°").grid(row=0, column=0, pady=10)
-                ttk.Label(bikes_window, text="Battery level").grid(row=0, column=1, pady=10)
-
-                index = 1
-                for bike_id in station["docked_bikes"]:
-                    for bike in self.data["bikes"]:
-                        if bike["id"] == bike_id:
-                            ttk.Label(bikes_window, text=bike["number"]).grid(row=index, column=0)
-                            ttk.Label(bikes_window, text=bike["battery_level"]).grid(row=index, column=1)
-                            index += 1
-                            break
-                
-                ttk.Button(bikes_window, text="Close", command=bikes_window.destroy).grid(row=index+1, column=0, padx=50, pady=20)
-
-                bikes_window.mainloop()
+        bikes_window.mainloop()
 
     ## @brief display the add bike window
     def add_bike_window(self):
-        if self.data["stations"] == []: # block if there is no station in the database
+        if self.fleet.station_count() == 0: # block if there is no station in the database
             tk.messagebox.showinfo("Error", "You need to add a station before adding a bike.")
             return
 
@@ -312,13 +372,10 @@ class App(tk.Tk):
 
         # defining the variables that will be used in the window
         bike_id = str(uuid4()) #generate a new unique id using the uuid library
-        self.data["last_bike_number"] = self.data["last_bike_number"] + 1 # update the last bike number
-        bike_number = str(self.data["last_bike_number"])
+        bike_number = self.fleet.next_bike_number() # update the last bike number
 
         # variables that will be used for the dropdown menu
-        station_list = []
-        for station in self.data["stations"]:
-            station_list.append(station["name"])
+        station_list = [station["name"] for station in self.fleet.stations()]
         selected_station = tk.StringVar(toplevel)
         selected_station.set(station_list[0]) # default value
 
@@ -345,13 +402,13 @@ class App(tk.Tk):
             if not battery_level.get().isnumeric(): # check if the battery level is a number
                 tk.messagebox.showinfo("Error", "The battery level must be a number.")
                 return
-            
-            if  0 <= int(battery_level.get()) <= 100: # check if the battery level is between 0 and 100
-                self.add_bike(bike_id, bike_number, int(battery_level.get()), selected_station.get())
-                toplevel.destroy()
-            else:
-                tk.messagebox.showinfo("Error", "The battery level must be between 0 and 100.")
+
+            try: # add the bike and dock it to the station (the tables are patched by on_fleet_change)
+                self.core.add_bike(int(battery_level.get()), selected_station.get(), bike_id, bike_number)
+            except FleetError as error: # battery level out of range, or station removed meanwhile
+                tk.messagebox.showinfo("Error", str(error))
                 return
+            toplevel.destroy()
 
         toplevel.mainloop()
 
@@ -400,74 +457,16 @@ class App(tk.Tk):
             except ValueError:
                 tk.messagebox.showinfo("Error", "The coordinates must be integers.")
                 return
-            
-            if x == 0 and y == 0: # check if the coordinates are not 0;0
-                tk.messagebox.showinfo("Error", "There is already the main warehouse at these coordinates.")
-                return
 
-            if not -100 <= x <= 100 or not -100 <= y <= 100: # check if the coordinates are between -100 and 100
-                tk.messagebox.showinfo("Error", "The coordinates must be between -100 and 100.")
+            try: # add the station (the tables are patched by on_fleet_change)
+                self.core.add_station(station_name.get(), x, y, station_id)
+            except FleetError as error: # coordinates out of range, or name or coordinates already used
+                tk.messagebox.showinfo("Error", str(error))
                 return
-
-            for station in self.data["stations"]: # check if there is already a station at the same coordinates
-                if station["x"] == x and station["y"] == y:
-                    tk.messagebox.showinfo("Error", "There is already a station at these coordinates.")
-                    return
-
-            self.add_station(station_id, station_name.get(), x, y) # add the station
             toplevel.destroy() # close the window
 
         toplevel.mainloop()
 
-    ## @brief add a new bike to the database
-    def add_bike(self, bike_id, bike_number, battery_level, station_name):
-
-        # get the id of the station from the name
-        station_id = None
-        for station in self.data["stations"]:
-            if station["name"] == station_name:
-                station_id = station["id"]
-                break
-        
-        if station_id == None: # if the station doesn't exist (should not happen)
-            tk.messagebox.showinfo("Error", "Something bad has happened, seems like the station doesn't exist anymore.")
-            print(f"ERROR: station with name {station_name} doesn't exist anymore")
-            return
-        
-        self.data["bikes"].append(
-            {
-                "id": bike_id, 
-                "number": bike_number, 
-                "battery_level": battery_level, 
-                "station_id": station_id, 
-                "nb_days": 0, 
-                "nb_rents": 0
-            }
-        ) # add the bike to the database
-        
-        for station in self.data["stations"]:
-            if station["id"] == station_id:
-                station["docked_bikes"].append(bike_id) # add the bike to the station
-        
-        self.load_bike_list() # refresh the bike list
-        self.load_station_list() # refresh the station list (to update the docked_bikes list)
-
-    ## @brief add a new station to the database
-    def add_station(self, station_id, station_name, station_x, station_y):
-        self.data["stations"].append(
-            {
-                "id": station_id,
-                "name": station_name,
-                "x": station_x,
-                "y": station_y,
-                "docked_bikes": [],
-                "nb_rents": 0,
-                "nb_returns": 0
-            }
-        ) # add the station to the database
-
-        self.load_station_list() # refresh the station list
-
     ## @brief move a bike to another station (admin mode)
     def change_bike_station_window(self, bike):
         toplevel = Toplevel() # create the toplevel window
@@ -482,9 +481,7 @@ class App(tk.Tk):
 
 
         # variables that will be used for the dropdown menu
-        station_list = []
-        for station in self.data["stations"]:
-            station_list.append(station["name"])
+        station_list = [station["name"] for station in self.fleet.stations()]
         selected_station = tk.StringVar(toplevel)
         selected_station.set(station_list[0]) # default value
 
@@ -492,63 +489,32 @@ class App(tk.Tk):
         ttk.Button(toplevel, text="Confirm", command=lambda: confirm()).grid(row=1, column=0, pady=3)
 
         def confirm(): # update the database
-            
-            the_station = NONE
-            for station in self.data["stations"]: # get the station
-                if station["name"] == selected_station.get():
-                    the_station = station
-                    break
-
-            if the_station != NONE: # if the station exists, move the bike
-                self.move_bike(bike, the_station)
-            
+            try: # update the bike and both stations' docked bikes
+                self.core.move_bike(bike["id"], selected_station.get())
+            except FleetError as error: # the bike or the station has been removed meanwhile
+                tk.messagebox.showinfo("Error", str(error))
+
             toplevel.destroy() #close the toplevel window
-            self.load_bike_list() # refresh the bike list
-            self.load_station_list() # refresh the station list
 
         toplevel.mainloop()
 
-    ## @brief move a bike to another station
-    def move_bike(self, bike, new_station):
-
-        index = self.data["bikes"].index(bike) # get the index of the bike in the database
-
-        # change the station id in bike database
-        self.data["bikes"][index]["station_id"] = new_station["id"]
-
-        # remove the bike from the previous station db
-        for station in self.data["stations"]:
-            if bike["id"] in station["docked_bikes"]:
-                station["docked_bikes"].remove(bike["id"])
-
-        # add the bike to the new station db
-        for station in self.data["stations"]:
-            if station["name"] == new_station["name"]:
-                station["docked_bikes"].append(bike["id"])
-
     ## @brief remove a bike from the database
     def remove_bike(self, bike_id):
-        for station in self.data["stations"]:
-            if bike_id in station["docked_bikes"]:
-                station["docked_bikes"].remove(bike_id) # remove the bike from the stations
-        
-        for bike in self.data["bikes"]:
-            if bike["id"] == bike_id:
-                self.data["bikes"].remove(bike) # remove the bike from the database
+        try:
+            self.core.remove_bike(bike_id) # remove the bike from the database and from its station
+        except FleetError as error: # a database is being imported
+            tk.messagebox.showinfo("Error", str(error))
 
     ## @brief remove a station from the database
     def remove_station(self, station_id):
-        for station in self.data["stations"]:
-            if station["id"] == station_id:
-                if station["docked_bikes"] == []: # check if the station is empty
-                    self.data["stations"].remove(station) # remove the station from the database
-                else:
-                    tk.messagebox.showinfo("Error", "The station is not empty, please move all the bikes before removing the station.")
-                    return
+        try:
+            self.core.remove_station(station_id) # remove the station from the database if it is empty
+        except FleetError as error:
+            tk.messagebox.showinfo("Error", str(error))
 
     ## @brief display a window with the overall system summary
     def summary_action(self):
-        if self.data["bikes"] == []:
+        if self.fleet.bike_count() == 0:
             tk.messagebox.showinfo("Error", "There are no bikes in the database. You must add some bikes before you can see the summary.")
             return
 
@@ -577,13 +543,15 @@ class App(tk.Tk):
         row_1_frame.grid(row=1, column=0, columnspan=2, sticky="nwe")
         row_1_frame.columnconfigure(0, weight=1)
         row_1_frame.columnconfigure(1, weight=1)
-        bikes_number = len(self.data["bikes"])
-        average_overall_battery_level = 0
-        for bike in self.data["bikes"]:
-            average_overall_battery_level += bike["battery_level"]
-        average_overall_battery_level /= bikes_number
-        tk.Label(row_1_frame, text="Number of bikes : " + str(bikes_number)).grid(row=0, column=0, sticky="new")
-        tk.Label(row_1_frame, text="Average overall battery level : " + str(average_overall_battery_level)).grid(row=0, column=1, sticky="new")
+        number_label = tk.Label(row_1_frame)
+        number_label.grid(row=0, column=0, sticky="new")
+        battery_label = tk.Label(row_1_frame)
+        battery_label.grid(row=0, column=1, sticky="new")
+
+        def load_header():
+            summary = self.core.summary()
+            number_label.configure(text="Number of bikes : " + str(summary["bike_count"]))
+            battery_label.configure(text="Average overall battery level : " + str(summary["average_battery"]))
 
         # row 2 : sort selection
         sort_selection = ttk.Frame(summary_window)
@@ -609,110 +577,67 @@ class App(tk.Tk):
             elif list == "stations":
                 self.stations_sort = sort_id
 
+        # compute the av. battery of the station's bikes
+        def station_av_battery(station):
+            av_battery = self.fleet.average_battery(station["id"])
+            if av_battery is None: # no docked bike
+                return "-"
+            return av_battery
+
+        bike_table = VirtualTable(
+            bike_list_frame,
+            headers = ["Bike n°", "Battery", "Station", "Days in use", "Times rented"],
+            format_row = lambda bike: (bike["number"], bike["battery_level"], self.fleet.station_name(bike["station_id"]), bike["nb_days"], bike["nb_rents"]),
+            visible_rows = 13,
+            key = lambda bike: bike["id"]
+        )
+        bike_table.grid(row=0, column=0, sticky="nsew")
+
+        station_table = VirtualTable(
+            station_list_frame,
+            headers = ["Station name", "Docked bikes", "Rents", "Returns", "Av. battery"],
+            format_row = lambda station: (station["name"], self.fleet.docked_count(station["id"]), station["nb_rents"], station["nb_returns"], str(station_av_battery(station))),
+            visible_rows = 13,
+            key = lambda station: station["id"]
+        )
+        station_table.grid(row=0, column=0, sticky="nsew")
+
+        @timed("ui.summary_bike_list")
         def load_bike_list():
-            for widget in bike_list_frame.winfo_children(): # delete the frame content (refresh process)
-                widget.destroy()
-        
-            bike_list_canvas = tk.Canvas(bike_list_frame) # create the canvas that will contain the scrollbar and the list
-            bike_list_canvas.grid(row=0, column=0, sticky="nsew")
-            
-            bike_list_scrollbar = ttk.Scrollbar(bike_list_frame, orient="vertical", command=bike_list_canvas.yview) # create the scrollbar and link it to the canvas
-            bike_list_scrollbar.grid(row=0, column=1, sticky="ns")
-            bike_list_canvas.configure(yscrollcommand=bike_list_scrollbar.set)
-
-            bike_frame_data = tk.Frame(bike_list_canvas) # create the frame that will contain the data
-            bike_list_canvas.create_window((0, 0), window=bike_frame_data, anchor='nw')
-
-            ttk.Label(bike_frame_data, text="Bike n°").grid(row=0, column=0, padx=4) #create the headers
-            ttk.Label(bike_frame_data, text="Battery").grid(row=0, column=1, padx=4)
-            ttk.Label(bike_frame_data, text="Station").grid(row=0, column=2, padx=4)
-            ttk.Label(bike_frame_data, text="Days in use").grid(row=0, column=3, padx=4)
-            ttk.Label(bike_frame_data, text="Times rented").grid(row=0, column=4, padx=4)
-
-            data = self.data["bikes"]
-            if self.bikes_sort == 0:
-                data.sort(key= lambda x: x["nb_days"], reverse=True)
-            elif self.bikes_sort == 1:
-                data.sort(key= lambda x: x["nb_rents"], reverse=True)
-
-            # seed the list with the stations' info
-            index = 1
-            for bike in data:
-                for station in self.data["stations"]:
-                    if station["id"] == bike["station_id"]:
-                        station_name = station["name"]
-                        break
-                
-                ttk.Label(bike_frame_data, text=bike["number"]).grid(row=index, column=0)
-                ttk.Label(bike_frame_data, text=bike["battery_level"]).grid(row=index, column=1)
-                ttk.Label(bike_frame_data, text=station_name).grid(row=index, column=2)
-                ttk.Label(bike_frame_data, text=bike["nb_days"]).grid(row=index, column=3)
-                ttk.Label(bike_frame_data, text=bike["nb_rents"]).grid(row=index, column=4)
-
-                index += 1
-
-            bike_frame_data.update_idletasks()  # update geometry of the frame
-
-            bike_list_canvas.config(width=310 + bike_list_scrollbar.winfo_width(), height=300) # update the canvas size
-            bike_list_canvas.config(scrollregion=bike_list_canvas.bbox("all")) # update the scroll region
+            bike_table.set_rows(self.core.summary(bikes_sort=core.BIKE_SORTS[self.bikes_sort])["bikes"])
 
+        @timed("ui.summary_station_list")
         def load_station_list():
-            for widget in station_list_frame.winfo_children(): # delete the frame content (refresh process)
-                widget.destroy()
-        
-            station_list_canvas = tk.Canvas(station_list_frame) # create the canvas that will contain the scrollbar and the list
-            station_list_canvas.grid(row=0, column=0, sticky="nsew")
-            
-            station_list_scrollbar = ttk.Scrollbar(station_list_frame, orient="vertical", command=station_list_canvas.yview) # create the scrollbar and link it to the canvas
-            station_list_scrollbar.grid(row=0, column=1, sticky="ns")
-            station_list_canvas.configure(yscrollcommand=station_list_scrollbar.set)
-
-            stations_frame_data = tk.Frame(station_list_canvas) # create the frame that will contain the data
-            station_list_canvas.create_window((0, 0), window=stations_frame_data, anchor='nw')
-
-            ttk.Label(stations_frame_data, text="Station name").grid(row=0, column=0, padx=4) #create the headers
-            ttk.Label(stations_frame_data, text="Docked bikes").grid(row=0, column=1, padx=4)
-            ttk.Label(stations_frame_data, text="Rents").grid(row=0, column=2, padx=4)
-            ttk.Label(stations_frame_data, text="Returns").grid(row=0, column=3, padx=4)
-            ttk.Label(stations_frame_data, text="Av. battery").grid(row=0, column=4, padx=4)
-
-            data = self.data["stations"]
-            if self.stations_sort == 0:
-                data.sort(key= lambda x: x["nb_rents"], reverse=True)
-            elif self.stations_sort == 1:
-                data.sort(key= lambda x: x["nb_returns"], reverse=True)
-
-            # seed the list with the stations' info
-            index = 1
-            for station in data:
-                
-                if station["docked_bikes"] != []:
-                    av_battery = 0
-                    for bike_id in station["docked_bikes"]: # compute the av. battery of the station's bikes
-                        for bike in self.data["bikes"]:
-                            if bike["id"] == bike_id:
-                                av_battery += bike["battery_level"]
-                                break
-                    
-                    av_battery /= len(station["docked_bikes"])
-                else:
-                    av_battery = "-"
-
-                ttk.Label(stations_frame_data, text=station["name"]).grid(row=index, column=0)
-                ttk.Label(stations_frame_data, text=str(len(station["docked_bikes"]))).grid(row=index, column=1)
-                ttk.Label(stations_frame_data, text=station["nb_rents"]).grid(row=index, column=2)
-                ttk.Label(stations_frame_data, text=station["nb_returns"]).grid(row=index, column=3)
-                ttk.Label(stations_frame_data, text=str(av_battery)).grid(row=index, column=4)
-
-                index += 1
-
-            stations_frame_data.update_idletasks()  # update geometry of the frame
-
-            station_list_canvas.config(width=310 + station_list_scrollbar.winfo_width(), height=300) # update the canvas size
-            station_list_canvas.config(scrollregion=station_list_canvas.bbox("all")) # update the scroll region
-
-        load_bike_list()
-        load_station_list()
+            station_table.set_rows(self.core.summary(stations_sort=core.STATION_SORTS[self.stations_sort])["stations"])
+
+        # patch the summary after a mutation of the data (the sorted lists are kept in order by the store)
+        def on_fleet_change(kind, action, record):
+            table = bike_table if kind == BIKE else station_table
+            if action in (RESET, BATCH): # the whole list is read again
+                load_bike_list() if kind == BIKE else load_station_list()
+            elif action == ADDED:
+                table.insert_record(record)
+            elif action == REMOVED:
+                table.remove_record(record)
+            elif record is None: # every record has been updated
+                table.update_records()
+            else:
+                table.update_record(record)
+
+            if kind == BIKE:
+                load_header()
+
+        def on_destroy(event):
+            if event.widget is summary_window:
+                self.fleet.unsubscribe(on_fleet_change)
+
+        self.fleet.subscribe(on_fleet_change)
+        summary_window.bind("<Destroy>", on_destroy)
+
+        with timed("ui.summary_action"): # the first display, the window's loop isn't measured
+            load_header()
+            load_bike_list()
+            load_station_list()
         summary_window.mainloop()
 
     ## @brief load the application in the user mode
@@ -742,9 +667,7 @@ class App(tk.Tk):
 
         ttk.Label(station_selection_frame, text="Station list").grid(row=0, column=0, padx=10, pady=5, sticky="w")
 
-        stations = []
-        for station in self.data["stations"]:
-            stations.append(station["name"])
+        stations = [station["name"] for station in self.fleet.stations()]
         
         station_var = tk.StringVar(value=stations)
 
@@ -764,60 +687,41 @@ class App(tk.Tk):
         self.user_bike_list = tk.Frame(bike_list_frame, highlightbackground="black", highlightthickness=1)
         self.user_bike_list.grid(row=1, column=0, padx=10, pady=5, sticky="w")
 
+        ## @brief Virtualized table of the bikes available at the selected station
+        self.user_bike_table = VirtualTable(
+            self.user_bike_list,
+            headers = ["Bike n°", "Battery"],
+            format_row = lambda bike: (bike["number"], bike["battery_level"]),
+            format_colors = lambda bike: ("", "red" if bike["battery_level"] <= core.LOW_BATTERY else "black"), # low battery in red
+            actions = [("Rent", self.rent_bike)],
+            visible_rows = 10,
+            widths = [9, 9],
+            key = lambda bike: bike["id"]
+        )
+        self.user_bike_table.grid(row=0, column=0, sticky="w")
+        self.user_station_id = None
+
         # handle selection
         def items_selected(event):
             # load the bike list for the selected station
-            station_name = stations[listbox.curselection()[0]]
-            for station in self.data["stations"]:
-                if station["name"] == station_name:
-                    self.load_user_bike_list(station["id"])
-                    break
+            if not listbox.curselection(): # the selection has been cleared
+                return
+            station = self.fleet.get_station_by_name(stations[listbox.curselection()[0]])
+            if station is not None:
+                self.load_user_bike_list(station["id"])
 
         listbox.bind("<<ListboxSelect>>", items_selected)
 
+        # status of the background tasks
+        TaskStatusBar(self, self.scheduler).grid(row=2, column=0, columnspan=2, padx=10, pady=3, sticky="ew")
+
     ## @brief load the bike list in the listbox
+    @timed("ui.load_user_bike_list")
     def load_user_bike_list(self, station_id):
-        for widget in self.user_bike_list.winfo_children(): # clear the frame (reload process)
-            widget.destroy()
-
-        bike_list_canvas = tk.Canvas(self.user_bike_list) # create the canvas that will contain the scrollbar and the list
-        bike_list_canvas.grid(row=0, column=0, sticky="w")
-        
-        bike_list_scrollbar = ttk.Scrollbar(self.user_bike_list, orient="vertical", command=bike_list_canvas.yview) # create the scrollbar and link it to the canvas
-        bike_list_scrollbar.grid(row=0, column=1, sticky="ns")
-        bike_list_canvas.configure(yscrollcommand=bike_list_scrollbar.set)
-
-        bikes_frame_data = tk.Frame(bike_list_canvas) # create the frame that will contain the data
-        bike_list_canvas.create_window((0, 0), window=bikes_frame_data, anchor='nw')
+        self.user_station_id = station_id
 
-        ttk.Label(bikes_frame_data, text="Bike n°").grid(row=0, column=0, padx=5) #create the headers
-        ttk.Label(bikes_frame_data, text="Battery").grid(row=0, column=1, padx=5)
-
-        data = self.data["bikes"]
-        data.sort(key= lambda x: x["battery_level"], reverse=True) # sort the bikes by battery level
-
-        # seed the list with the bikes' info
-        index = 1
-        for bike in data:
-            battery_color = "black"
-            if bike["station_id"] != station_id: # if the bike is not in the selected station, skip it
-                continue
-            if bike["battery_level"] <= 2: # if the bike is low on battery, skip it
-                continue
-            if bike["battery_level"] <= 20: # if the bike is low on battery, change the color of the battery level
-                battery_color = "red"
-
-            ttk.Label(bikes_frame_data, text=bike["number"]).grid(row=index, column=0) # bike number
-            tk.Label(bikes_frame_data, text=bike["battery_level"], fg=battery_color).grid(row=index, column=1) # bike battery
-
-            ttk.Button(bikes_frame_data, text="Rent", command=lambda bike=bike: self.rent_bike(bike)).grid(row=index, column=3, padx=5) # change location
-            
-            index += 1
-
-        bikes_frame_data.update_idletasks()  # update geometry of the frame
-
-        bike_list_canvas.config(width=230 + bike_list_scrollbar.winfo_width(), height=286) # update the canvas size
-        bike_list_canvas.config(scrollregion=bike_list_canvas.bbox("all")) # update the scroll region
+        # skip the bikes low on battery, the most charged first
+        self.user_bike_table.set_rows(self.core.rentable_bikes(station_id))
 
     ## @brief rent a bike, moving it from one station to another, updating the battery level and the stations' & bike's data
     def rent_bike(self, bike):
@@ -830,9 +734,7 @@ class App(tk.Tk):
         rent_window.columnconfigure(1, weight=1)
 
         # variables that will be used for the dropdown menu
-        station_list = []
-        for station in self.data["stations"]:
-            station_list.append(station["name"])
+        station_list = [station["name"] for station in self.fleet.stations()]
         selected_station = tk.StringVar(rent_window)
         selected_station.set(station_list[0]) # default value
 
@@ -847,63 +749,29 @@ class App(tk.Tk):
 
         # handle the confirm button
         def confirm():
-            
-            target_station = NONE
-            for station in self.data["stations"]:
-                if station["name"] == selected_station.get():
-                    target_station = station
-                    break
-
-            # managing exceptions
-
-            if target_station == NONE:
-                showinfo("Error", "The station isn't in the data anymore. If this problem persist, please reload the application.")
-                return
-
             try:
                 rent_time_value = int(rent_time.get())
             except ValueError:
                 showinfo("Error", "The rent time must be an integer.")
                 return
 
-            if not 0 < rent_time_value <= 50:
-                showinfo("Error", "The rent time must be between 1 and 50 minutes.")
-                return
-
-            if 2*rent_time_value > bike["battery_level"]:
-                showinfo("Error", "This bike doesn't have enough battery to be rented for that long.")
+            try: # update the bike's battery and rents, the stations' rents and returns, and move the bike
+                self.core.rent_bike(bike["id"], selected_station.get(), rent_time_value)
+            except FleetError as error: # rent time out of range, battery too low, or station removed meanwhile
+                showinfo("Error", str(error))
                 return
 
-            # update the bike's data
-            bike_index = self.data["bikes"].index(bike)
-            self.data["bikes"][bike_index]["battery_level"] = bike["battery_level"] - 2*rent_time_value # update the battery level
-            self.data["bikes"][bike_index]["nb_rents"] += 1 # update the number of rents
-
-            # update the current station's data
-            current_station = NULL
-            for station in self.data["stations"]:
-                if station["id"] == bike["station_id"]:
-                    current_station = station
-                    break
-            if current_station == NULL:
-                showinfo("Error", "The station isn't in the data anymore. If this problem persist, please reload the application.")
-                return
-            station_index = self.data["stations"].index(current_station)
-            self.data["stations"][station_index]["nb_rents"] += 1 # update the number of rents
-
-            # update the target station's data
-            target_station_index = self.data["stations"].index(target_station)
-            self.data["stations"][target_station_index]["nb_returns"] += 1 # update the number of returns
-
-            self.move_bike(bike, target_station) # move the bike
-
-            rent_window.destroy() # close the window
-            self.load_user_bike_list(current_station["id"]) # reload the bike list
+            rent_window.destroy() # close the window (the bike list is patched by on_fleet_change)
 
         ttk.Button(rent_window, text="Confirm", command=confirm).grid(row=2, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
 
         rent_window.mainloop()
 
+    ## @brief display the latencies of the operations (the window doesn't block the application)
+    def diagnostics_action(self):
+        from diagnostics import DiagnosticsWindow # the window is only loaded when opened
+        DiagnosticsWindow(self)
+
     ## @brief change the user mode between administrator and user, reloading the application 
     def change_user_mode(self):
         if self.administrator_mode == "User" :
@@ -915,47 +783,78 @@ class App(tk.Tk):
             self.usermode_button_foreground = "black"
             self.load_user_widgets()
 
-    ## @brief importation of the data from a JSON file
+    ## @brief importation of the data from a JSON file or a snapshot, or of bikes or stations from a CSV file (added to the current data)
     def import_action(self, excepted_db):
-        file  = filedialog.askopenfile(
+        path = filedialog.askopenfilename(
             title="Import a database",
             initialdir="./data/",
-            filetypes=(('JSON files', '*.json'),)
-        ) # opening the file
+            filetypes=(('Databases', '*.json *.snap'), ('JSON files', '*.json'), ('Snapshots', '*.snap'), ('CSV files', '*.csv'))
+        ) # selecting the file
+        if not path: # no file selected
+            print("No file provided")
+            return
+
+        is_csv = core.is_csv_path(path)
         try:
-            result = json.loads(file.read()) # loading the data from the file
+            read_file = self.core.start_import(path, excepted_db)
+        except FleetError as error: # a database is already being imported
+            showinfo("Error", str(error))
+            return
 
-            try:
-                if excepted_db == result["file_check"]: # checking if the file is the correct one
-                    self.data = result # importing the data
-
-                    if self.administrator_mode == "Administrator": # refresh the bike list
-                        self.load_bike_list()
-                        self.load_station_list()
-                    
-                else: # file not generated by the program
-                    showinfo("Wrong file selected", "This file holds incompatible data with the database you selected. Please make sure you are trying to import the right file.")
-            except KeyError: # file not generated by the program
+        # worker thread, the records are streamed in a new store, in the SQLite database by a connection of the worker, or in a batch for a CSV file
+        def read(task):
+            return read_file(task.report)
+
+        def failed(error):
+            self.core.cancel_import()
+            if isinstance(error, FleetError): # a database is being imported
+                showinfo("Error", str(error))
+            elif is_csv and isinstance(error, (ValueError, KeyError, TypeError)): # invalid row, nothing has been added
+                showinfo("Incompatible file", "The file can't be imported: " + str(error.args[0] if isinstance(error, KeyError) and error.args else error))
+            elif isinstance(error, fleet_io.WrongDatabaseError): # file not generated by the program
+                showinfo("Wrong file selected", "This file holds incompatible data with the database you selected. Please make sure you are trying to import the right file.")
+            elif isinstance(error, (ValueError, KeyError, TypeError)): # no data / corrupted data in the JSON file
                 showinfo("Incompatible file", "Please provide a JSON file generated with this software")
-        except json.decoder.JSONDecodeError: # no data / corrupted data in the JSON file
-            showinfo("Incompatible file", "Please provide a JSON file generated with this software")
-            pass
-        except AttributeError: # no file selected
-            print("No file provided")
-            pass
+            elif isinstance(error, OSError):
+                showinfo("Import failed", "The file can't be read: " + str(error))
+            elif isinstance(error, sqlite3.Error):
+                showinfo("Import failed", "The database can't be written: " + str(error))
+            else:
+                raise error
+
+        def loaded(result): # tkinter thread, the batch is checked as a whole before any record is added
+            try:
+                self.core.import_data(result)
+            except (ValueError, KeyError, TypeError) as error:
+                failed(error)
+
+        # importing the data on the tkinter thread once the file is accepted (the tables are reloaded by on_fleet_change)
+        self.scheduler.submit("Importing the database", read, on_done=loaded, on_error=failed, on_cancel=self.core.cancel_import)
         
-    ## @brief export the data to a JSON file
-    def export_action(self, file_name, data):
-        file = filedialog.asksaveasfile(filetypes=(('JSON files', '*.json'),), defaultextension=json, initialfile=file_name, initialdir="./data/") # opening the file
-        try:
-            self.writeJSONtoFile(file, data) # writing the data in the file
-        except AttributeError: # no file selected
+    ## @brief export the data to a JSON file or a snapshot (given by the extension)
+    def export_action(self, file_name):
+        path = filedialog.asksaveasfilename(filetypes=(('JSON files', '*.json'), ('Snapshots', '*.snap')), defaultextension=".json", initialfile=file_name, initialdir="./data/") # selecting the file
+        if not path: # no file selected
             print("No file provided")
-            pass
+            return
+
+        write_file = self.core.start_export(path) # copy of the in-memory data, or the SQLite database read by the worker
+
+        def write(task): # worker thread, the file only replaces the previous one once complete
+            write_file(task.report)
+
+        def failed(error):
+            if isinstance(error, OSError):
+                showinfo("Export failed", "The file can't be written: " + str(error))
+            elif isinstance(error, sqlite3.Error):
+                showinfo("Export failed", "The database can't be read: " + str(error))
+            elif isinstance(error, ValueError): # a record doesn't fit in a snapshot
+                showinfo("Export failed", "The data can't be saved as a snapshot: " + str(error) + ". Please export it as a JSON file.")
+            else:
+                raise error
 
-    ## @brief write the data in a JSON file
-    def writeJSONtoFile(self, file, data):
-        json.dump(data, file)        
+        self.scheduler.submit("Exporting the database", write, on_error=failed)
 
-app = App()
-app.mainloop()
+if __name__ == "__main__": # the route workers import this module, they must not open the application
+    app = App(sys.argv[1] if len(sys.argv) > 1 else None) # optional SQLite database
+    app.mainloop()
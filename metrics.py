@@ -0,0 +1,248 @@
+## @file metrics.py
+#
+# @brief Latency metrics of the application, without any display (viewed in the Diagnostics window, dumped by the command line).
+# @brief timed() measures an operation, as a decorator or a with block, into a rolling histogram of its last durations. count()
+# @brief increments a counter (the changes notified by the store are counted this way). The metrics can be dumped to a JSON file.
+# @brief A single timed operation can also be profiled: profile_next() arms cProfile, which then runs during the next operation
+# @brief (of a given name, or any), and the statistics are saved to a .prof file readable by pstats or snakeviz.
+# @brief The metrics are recorded from the tkinter thread and from the worker threads, they are protected by a lock.
+#
+# @section libraries_metrics Libraries/Modules
+# - collections
+# - cProfile (only to profile an operation)
+# - functools
+# - io
+# - json
+# - os
+# - pstats (only to profile an operation)
+# - threading
+# - time
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from collections import deque
+from functools import wraps
+import io
+import json
+import os
+import threading
+import time
+
+## @brief Number of last durations kept by each histogram
+WINDOW = 1000
+
+## @brief Upper bounds (in seconds) of the buckets of the histograms, the last one takes the longer durations
+BUCKETS = (0.0001, 0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+## @brief Directory of the saved profiles
+PROFILE_DIRECTORY = "./data/profiles/"
+
+## @brief Number of functions listed by the text summary of a profile
+PROFILE_LINES = 25
+
+
+class LatencyHistogram:
+
+    ## @brief initialize an empty histogram
+    # @param window Number of last durations kept
+    def __init__(self, window=WINDOW):
+        ## @brief Last durations, in seconds
+        self.samples = deque(maxlen=window)
+        ## @brief Number of durations since the start (or the last reset)
+        self.count = 0
+        ## @brief Sum of the durations since the start
+        self.total = 0.0
+        ## @brief Longest duration since the start
+        self.max = 0.0
+
+    ## @brief add a duration (in seconds)
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    ## @brief number of last durations in each bucket
+    def buckets(self):
+        counts = [0] * len(BUCKETS)
+        for seconds in self.samples:
+            index = 0
+            while seconds > BUCKETS[index]:
+                index += 1
+            counts[index] += 1
+        return counts
+
+    ## @brief summary of the histogram: count, mean and max since the start, percentiles and buckets of the last durations (in seconds)
+    def summary(self):
+        ordered = sorted(self.samples)
+
+        def percentile(fraction):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "buckets": self.buckets()
+        }
+
+
+class Metrics:
+
+    ## @brief initialize empty metrics
+    def __init__(self):
+        ## @brief Histograms of the timed operations, by name
+        self.histograms = {}
+        ## @brief Counters, by name
+        self.counters = {}
+        ## @brief False to stop recording (the timed operations are then only called)
+        self.enabled = True
+        ## @brief Name of the operation to profile ("" for any, None if no profile is armed)
+        self.profile_name = None
+        ## @brief (operation name, path of the .prof file, text summary) of the last profile (None if no profile has been saved)
+        self.last_profile = None
+        self.lock = threading.Lock()
+
+    ## @brief add a duration to the histogram of an operation
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(seconds)
+
+    ## @brief increment a counter
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    ## @brief count a change notified by a store (FleetStore.subscribe listener)
+    def count_change(self, kind, action, record):
+        self.count(f"{kind}.{action}")
+
+    ## @brief forget the recorded metrics
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    ## @brief summaries of the histograms and values of the counters
+    # @return Dictionary {"operations": {name: summary}, "counters": {name: value}}, times in seconds
+    def report(self):
+        with self.lock:
+            return {
+                "operations": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items()))
+            }
+
+    ## @brief write the report to a JSON file
+    def dump(self, path):
+        report = self.report()
+        report["buckets"] = [bound if bound != float("inf") else None for bound in BUCKETS] # upper bounds, None for no bound
+        report["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+
+    ## @brief profile the next timed operation
+    # @param name Name of the operation ("" for the next operation of any name)
+    def profile_next(self, name=""):
+        with self.lock:
+            self.profile_name = name
+
+    ## @brief start profiling an operation if a profile is armed for it
+    # @return The running profiler, None if the operation isn't profiled
+    def start_profile(self, name):
+        if self.profile_name is None: # checked without the lock, the operations are only slowed down when a profile is armed
+            return None
+        with self.lock:
+            if self.profile_name is None or self.profile_name not in ("", name):
+                return None
+            self.profile_name = None
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # another profiler is running on this thread
+            return None
+        return profiler
+
+    ## @brief stop a profiler and save its statistics
+    def end_profile(self, profiler, name):
+        profiler.disable()
+        import pstats
+        text = io.StringIO()
+        statistics = pstats.Stats(profiler, stream=text)
+        statistics.sort_stats("cumulative").print_stats(PROFILE_LINES)
+        path = None
+        try:
+            os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+            path = os.path.join(PROFILE_DIRECTORY, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+            statistics.dump_stats(path)
+        except OSError: # the summary is still kept
+            path = None
+        with self.lock:
+            self.last_profile = (name, path, text.getvalue())
+
+
+## @brief Metrics of the application
+METRICS = Metrics()
+
+
+class Timer:
+
+    ## @brief measure an operation into the metrics, as a decorator or a with block (see timed)
+    # @param name Name of the operation
+    # @param metrics The Metrics receiving the durations
+    def __init__(self, name, metrics=METRICS):
+        self.name = name
+        self.metrics = metrics
+        self.start = None
+        self.profiler = None
+
+    ## @brief decorate a function, each call is measured
+    def __call__(self, function):
+        name, metrics = self.name, self.metrics
+
+        @wraps(function)
+        def measured(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            profiler = metrics.start_profile(name)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.record(name, time.perf_counter() - start)
+                if profiler is not None:
+                    metrics.end_profile(profiler, name)
+        return measured
+
+    ## @brief start measuring a with block
+    def __enter__(self):
+        if self.metrics.enabled:
+            self.profiler = self.metrics.start_profile(self.name)
+            self.start = time.perf_counter()
+        return self
+
+    ## @brief measure the with block
+    def __exit__(self, exception_type, exception, traceback):
+        if self.start is not None:
+            self.metrics.record(self.name, time.perf_counter() - self.start)
+            self.start = None
+        if self.profiler is not None:
+            self.metrics.end_profile(self.profiler, self.name)
+            self.profiler = None
+        return False
+
+
+## @brief measure an operation: @timed("name") before a function, or with timed("name"): around a block
+def timed(name, metrics=METRICS):
+    return Timer(name, metrics)
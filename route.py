@@ -0,0 +1,400 @@
+## @file route.py
+#
+# @brief Maintenance route planning, python side of the tsp.c solver.
+# @brief The heuristic mode gives a good tour for any number of stations, the exact mode proves the optimal tour of small sets of stations
+# @brief by running the branch and bound solver on every core, and returns the best tour found if the time budget runs out.
+# @brief The library is loaded once, the coordinates are given to the solver without copy from a caller-owned array('d') and the
+# results are written in caller-owned buffers, so the solver can be called from worker threads.
+# @brief RouteCache memoizes the last route, and repairs it (removal, cheapest insertion, then local improvement) when only a few stations changed.
+# @brief plan_van_routes splits the stations between several vans of limited capacity (sweep around the warehouse) and optimizes
+# the routes of the vans in parallel in a process pool.
+#
+# @section libraries_route Libraries/Modules
+# - ctypes
+# - array
+# - concurrent.futures
+# - sys
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from ctypes import CDLL, POINTER, byref, sizeof, c_int, c_double
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+import threading
+import math
+import time
+import sys
+import os
+
+## @brief Name of the compiled solver for each platform (see tsp.c for the compilation commands)
+LIBRARY_NAMES = {"win32": "tsp.dll", "cygwin": "tsp.dll", "darwin": "libtsp.dylib"}
+
+## @brief Path of the compiled solver of the running platform, next to this file
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), LIBRARY_NAMES.get(sys.platform, "libtsp.so"))
+
+## @brief Solving modes
+AUTO = "auto"
+EXACT = "exact"
+HEURISTIC = "heuristic"
+MODES = [AUTO, EXACT, HEURISTIC]
+
+## @brief Largest number of stations solved with the exact solver in the auto mode
+EXACT_MAX_STATIONS = 20
+
+## @brief Largest number of stations given to the exact solver in the exact mode (the best tour found within the time budget is
+# returned above EXACT_MAX_STATIONS), the larger sets are solved by the heuristic
+EXACT_MODE_MAX_STATIONS = 100
+
+## @brief Largest number of stations whose route gets the minimum spanning tree lower bound (quadratic time), the larger sets get
+# the weaker bound of the farthest station, which doesn't give a meaningful optimality gap
+BOUND_MAX_STATIONS = 5000
+
+## @brief Default wall-clock budget of a route computation, in seconds
+DEFAULT_TIME_LIMIT = 2.0
+
+## @brief Largest fraction of changed stations for which the cached route is repaired instead of computed again
+REPAIR_MAX_CHANGES = 0.1
+
+## @brief Smallest number of stations for which the vans' routes are optimized in a process pool (below, starting the processes costs more than it saves)
+PARALLEL_MIN_STATIONS = 200
+
+
+class Route:
+
+    ## @brief initialize the route
+    # @param order Indexes of the stations by visit order (the warehouse is not included)
+    # @param cost Total distance, return to the warehouse included
+    # @param lower_bound Known lower bound of the optimal distance
+    # @param optimal Whether the route is proven optimal
+    # @param mode Solving mode that produced the route
+    # @param tight_bound Whether the lower bound is the minimum spanning tree bound (or the cost of the optimal route), close enough
+    # to the optimal distance to give the optimality gap
+    def __init__(self, order, cost, lower_bound, optimal, mode, tight_bound=False):
+        ## @brief Indexes of the stations by visit order (the warehouse is not included)
+        self.order = order
+        ## @brief Total distance, return to the warehouse included
+        self.cost = cost
+        ## @brief Known lower bound of the optimal distance
+        self.lower_bound = lower_bound
+        ## @brief Whether the route is proven optimal
+        self.optimal = optimal
+        ## @brief Solving mode that produced the route
+        self.mode = mode
+        ## @brief Whether the lower bound gives the optimality gap
+        self.tight_bound = tight_bound or optimal
+
+    ## @brief optimality gap: the route is at most this fraction longer than the optimal route (None if the lower bound is too weak to tell)
+    def gap(self):
+        if self.optimal:
+            return 0.0
+        if not self.tight_bound or self.lower_bound <= 0:
+            return None
+        return max(0.0, (self.cost - self.lower_bound) / self.lower_bound)
+
+
+## @brief Solver library, loaded by the first call to load_solver()
+_library = None
+## @brief Lock protecting the loading of the library
+_library_lock = threading.Lock()
+
+
+## @brief load the solver library once and declare the functions' types
+# @exception OSError the library of the running platform isn't built
+def load_solver():
+    global _library
+    with _library_lock:
+        if _library is None:
+            if not os.path.exists(LIBRARY_PATH):
+                raise OSError(f"the route solver {os.path.basename(LIBRARY_PATH)} isn't built for this platform, see tsp.c for the compilation command")
+            library = CDLL(LIBRARY_PATH)
+            library.tspSolve.argtypes = (c_int, POINTER(c_double), c_double, POINTER(c_int), POINTER(c_double))
+            library.tspSolve.restype = c_int
+            library.tspImprove.argtypes = (c_int, POINTER(c_double), c_double, POINTER(c_int), POINTER(c_double))
+            library.tspImprove.restype = c_int
+            library.tspExact.argtypes = (c_int, POINTER(c_double), c_int, c_double, c_double, POINTER(c_int), POINTER(c_double))
+            library.tspExact.restype = c_int
+            library.tspLowerBound.argtypes = (c_int, POINTER(c_double), c_double)
+            library.tspLowerBound.restype = c_double
+            _library = library
+        return _library
+
+
+## @brief build the contiguous node buffer given to the solver: the warehouse (0, 0) then the stations' (x, y) coordinates
+def route_nodes(coordinates):
+    nodes = array("d", (0.0, 0.0))
+    for x, y in coordinates:
+        nodes.append(x)
+        nodes.append(y)
+    return nodes
+
+
+## @brief view a writable buffer (array, memoryview, bytearray) as a ctypes array, without copy
+def _as_ctypes(buffer, ctype):
+    view = memoryview(buffer).cast("B")
+    return (ctype * (view.nbytes // sizeof(ctype))).from_buffer(view)
+
+
+## @brief number of nodes of a node buffer
+def _node_count(nodes):
+    return memoryview(nodes).cast("B").nbytes // sizeof(c_double) // 2
+
+
+## @brief heuristic tour (closest neighbor improved by 2-opt and Or-opt)
+# @param nodes Buffer of doubles (x, y) of every node, the warehouse first (array('d') or writable memoryview)
+# @param time_limit Budget of the improvement phase, in seconds
+# @param order Optional buffer of ints receiving the visit order (array('i') of at least one int per node), allocated if not given
+# @return (order, number of nodes written, cost of the tour)
+def solve(nodes, time_limit=DEFAULT_TIME_LIMIT, order=None):
+    nb_nodes = _node_count(nodes)
+    if order is None:
+        order = array("i", bytes(nb_nodes * sizeof(c_int)))
+    cost = c_double()
+    count = load_solver().tspSolve(nb_nodes, _as_ctypes(nodes, c_double), time_limit, _as_ctypes(order, c_int), byref(cost))
+    if count < 0:
+        raise MemoryError("the route solver couldn't allocate its buffers")
+    return order, count, cost.value
+
+
+## @brief improve an existing tour (2-opt and Or-opt), the warehouse being node 0
+# @param nodes Buffer of doubles (x, y) of every node, the warehouse first (array('d') or writable memoryview)
+# @param order Buffer of ints holding the tour to improve (array('i'), every node once), receives the improved tour
+# @param time_limit Budget of the improvement phase, in seconds
+# @return Cost of the improved tour
+def improve(nodes, order, time_limit=DEFAULT_TIME_LIMIT):
+    cost = c_double()
+    count = load_solver().tspImprove(_node_count(nodes), _as_ctypes(nodes, c_double), time_limit, _as_ctypes(order, c_int), byref(cost))
+    if count == -2:
+        raise ValueError("the tour to improve must visit every node once")
+    if count < 0:
+        raise MemoryError("the route solver couldn't allocate its buffers")
+    return cost.value
+
+
+## @brief compute the maintenance route starting from and returning to the warehouse (0, 0)
+# @param coordinates List of the stations' (x, y) coordinates
+# @param mode Solving mode (AUTO, EXACT or HEURISTIC)
+# @param time_limit Wall-clock budget of the computation, in seconds
+# @param threads Number of threads of the exact solver (one per processor if None)
+def plan_route(coordinates, mode=AUTO, time_limit=DEFAULT_TIME_LIMIT, threads=None):
+    if mode not in MODES:
+        raise ValueError(f"unknown route mode {mode}")
+
+    library = load_solver()
+    deadline = time.monotonic() + time_limit
+
+    nodes = route_nodes(coordinates)
+    nb_nodes = len(nodes) // 2
+    raw_nodes = _as_ctypes(nodes, c_double) # shared by every call, never copied
+
+    use_exact = (mode == EXACT and len(coordinates) <= EXACT_MODE_MAX_STATIONS) or (mode == AUTO and len(coordinates) <= EXACT_MAX_STATIONS)
+
+    # the heuristic tour is always computed, it is the starting upper bound of the exact solver
+    order, count, cost = solve(nodes, time_limit / 2 if use_exact else time_limit)
+    order = list(order[:count])
+    lower_bound = -2
+    if nb_nodes - 1 <= BOUND_MAX_STATIONS:
+        lower_bound = library.tspLowerBound(nb_nodes, raw_nodes, max(0.0, deadline - time.monotonic()))
+        if lower_bound == -1:
+            raise MemoryError("the route solver couldn't allocate its buffers")
+    tight_bound = lower_bound >= 0
+    if not tight_bound: # too many stations, or the time budget was spent first
+        lower_bound = 2 * max(math.dist((0, 0), point) for point in coordinates) # the farthest station is reached and left
+    optimal = nb_nodes <= 3 # every tour is optimal
+
+    if use_exact and not optimal:
+        best = {"cost": cost, "order": order}
+        lock = threading.Lock()
+
+        # explore the tours starting with a given station, with the best known cost as upper bound
+        def explore(first_node):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            output = array("i", bytes(nb_nodes * sizeof(c_int)))
+            found_cost = c_double()
+            with lock:
+                upper_bound = best["cost"]
+            complete = library.tspExact(nb_nodes, raw_nodes, first_node, upper_bound, remaining, _as_ctypes(output, c_int), byref(found_cost))
+            if complete < 0:
+                raise MemoryError("the route solver couldn't allocate its buffers")
+            with lock:
+                if found_cost.value < best["cost"]:
+                    best["cost"] = found_cost.value
+                    best["order"] = list(output)
+            return complete == 1
+
+        with ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as executor: # ctypes releases the GIL during the calls
+            completed = list(executor.map(explore, range(1, nb_nodes)))
+
+        order, cost = best["order"], best["cost"]
+        optimal = all(completed)
+        if optimal:
+            lower_bound = cost
+
+    # node 0 is the warehouse, node i is the station i - 1
+    stations_order = [node - 1 for node in order if node >= 1]
+    return Route(stations_order, cost, lower_bound, optimal, EXACT if use_exact else HEURISTIC, tight_bound)
+
+
+class RouteCache:
+
+    ## @brief initialize an empty cache
+    def __init__(self):
+        ## @brief Fingerprint of the stations' coordinates of the cached route (None if there is no cached route)
+        self.fingerprint = None
+        ## @brief Requested mode of the cached route
+        self.mode = None
+        ## @brief Coordinates of the stations by visit order
+        self.tour = []
+        ## @brief Cached route (its order refers to the coordinates list given when it was computed)
+        self.route = None
+
+    ## @brief forget the cached route
+    def clear(self):
+        self.fingerprint = None
+        self.mode = None
+        self.tour = []
+        self.route = None
+
+    ## @brief compute the maintenance route, reusing or repairing the cached route when possible
+    # @param coordinates List of the stations' (x, y) coordinates (every station has different coordinates)
+    # @param mode Solving mode (AUTO, EXACT or HEURISTIC)
+    # @param time_limit Wall-clock budget of the computation, in seconds
+    def plan(self, coordinates, mode=AUTO, time_limit=DEFAULT_TIME_LIMIT):
+        coordinates = [tuple(point) for point in coordinates]
+        fingerprint = frozenset(coordinates)
+
+        if self.route is not None and mode == self.mode and fingerprint == self.fingerprint: # nothing changed
+            return self._route_for(coordinates, self.route)
+
+        if self.route is not None and mode == self.mode and self.route.mode == HEURISTIC and len(coordinates) > EXACT_MAX_STATIONS:
+            previous = frozenset(self.tour)
+            removed = previous - fingerprint
+            added = [point for point in coordinates if point not in previous]
+            if len(removed) + len(added) <= max(1, REPAIR_MAX_CHANGES * len(coordinates)):
+                self._repair(removed, added, time_limit)
+                self.fingerprint = fingerprint
+                return self._route_for(coordinates, self.route)
+
+        # compute the route from scratch
+        new_route = plan_route(coordinates, mode, time_limit)
+        self.fingerprint = fingerprint
+        self.mode = mode
+        self.tour = [coordinates[index] for index in new_route.order]
+        self.route = new_route
+        return self._route_for(coordinates, new_route)
+
+    ## @brief repair the cached tour: remove the stations that disappeared, insert the new ones where they cost the least, then improve the tour
+    def _repair(self, removed, added, time_limit):
+        tour = [point for point in self.tour if point not in removed]
+
+        for point in added: # cheapest insertion, the tour being a cycle through the warehouse
+            cycle = [(0, 0)] + tour
+            best_position, best_cost = 0, math.inf
+            for position in range(len(cycle)):
+                a = cycle[position]
+                b = cycle[(position + 1) % len(cycle)]
+                cost = math.dist(a, point) + math.dist(point, b) - math.dist(a, b)
+                if cost < best_cost:
+                    best_position, best_cost = position, cost
+            tour.insert(best_position, point)
+
+        nodes = route_nodes(tour)
+        order = array("i", range(len(tour) + 1)) # the repaired tour, the warehouse first
+        cost = improve(nodes, order, time_limit)
+
+        # the optimal tour of the remaining stations plus a detour of twice the distance to the closest station per removed
+        # station is a valid tour of the previous stations, so the previous lower bound minus these detours is still a lower bound
+        # (adding stations can't make the optimal tour shorter)
+        lower_bound = self.route.lower_bound
+        for point in removed:
+            lower_bound -= 2 * min(math.dist(point, other) for other in [(0, 0)] + tour)
+
+        self.tour = [tour[node - 1] for node in order if node >= 1]
+        self.route = Route(None, cost, max(0.0, lower_bound), False, HEURISTIC, self.route.tight_bound)
+
+    ## @brief route whose order refers to the given coordinates list
+    def _route_for(self, coordinates, cached):
+        index = {point: i for i, point in enumerate(coordinates)}
+        order = [index[point] for point in self.tour]
+        return Route(order, cached.cost, cached.lower_bound, cached.optimal, cached.mode, cached.tight_bound)
+
+
+## @brief compute the route of one van (top-level function, so that it can be sent to a worker process)
+# @param task (coordinates, mode, time_limit, threads) of the van's stations
+def _plan_van_route(task):
+    coordinates, mode, time_limit, threads = task
+    return plan_route(coordinates, mode, time_limit, threads)
+
+
+## @brief split the stations between the vans: stations are swept by angle around the warehouse, a van takes the next stations
+# until it is full or has its share of the stations
+# @return List of lists of station indexes, one per used van
+def _sweep(coordinates, demands, nb_vans, capacity):
+    if any(demand > capacity for demand in demands):
+        raise ValueError("a station holds more bikes than a van can carry")
+    if sum(demands) > nb_vans * capacity:
+        raise ValueError("the vans can't carry every bike")
+
+    stations = sorted(range(len(coordinates)), key=lambda index: math.atan2(coordinates[index][1], coordinates[index][0]))
+
+    # start the sweep after the largest angular gap, so that no van route straddles two opposite groups of stations
+    if len(stations) > 1:
+        angles = [math.atan2(coordinates[index][1], coordinates[index][0]) for index in stations]
+        gaps = [(angles[(i + 1) % len(angles)] - angles[i]) % (2 * math.pi) for i in range(len(angles))]
+        start = (max(range(len(gaps)), key=gaps.__getitem__) + 1) % len(stations)
+        stations = stations[start:] + stations[:start]
+
+    groups = []
+    position = 0
+    while position < len(stations):
+        vans_left = nb_vans - len(groups)
+        if vans_left == 0:
+            raise ValueError("the vans can't carry every bike")
+        share = math.ceil((len(stations) - position) / vans_left) # stations per remaining van
+        group, load = [], 0
+        while position < len(stations):
+            index = stations[position]
+            if len(group) > 0 and (load + demands[index] > capacity or len(group) >= share):
+                break
+            group.append(index)
+            load += demands[index]
+            position += 1
+        groups.append(group)
+    return groups
+
+
+## @brief compute the maintenance routes of several vans of limited capacity, each one starting from and returning to the warehouse
+# @param coordinates List of the stations' (x, y) coordinates
+# @param demands Number of bikes to pick up at each station
+# @param nb_vans Number of available vans
+# @param capacity Number of bikes a van can carry
+# @param mode Solving mode of each van's route (AUTO, EXACT or HEURISTIC)
+# @param time_limit Wall-clock budget of each van's route, in seconds
+# @return List of routes, one per used van, their order referring to the coordinates list
+def plan_van_routes(coordinates, demands, nb_vans, capacity, mode=AUTO, time_limit=DEFAULT_TIME_LIMIT):
+    if nb_vans < 1:
+        raise ValueError("at least one van is needed")
+    if len(demands) != len(coordinates):
+        raise ValueError("every station needs a demand")
+
+    groups = _sweep(coordinates, demands, nb_vans, capacity)
+
+    if len(coordinates) >= PARALLEL_MIN_STATIONS and len(groups) > 1:
+        from concurrent.futures import ProcessPoolExecutor # multiprocessing is only loaded by the routes of several vans
+        import multiprocessing
+        workers = min(len(groups), os.cpu_count() or 1)
+        threads = max(1, (os.cpu_count() or 1) // workers) # the exact solvers of the workers share the processors
+        tasks = [([coordinates[index] for index in group], mode, time_limit, threads) for group in groups]
+        # spawned workers: forking a process running tkinter and other threads isn't safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            routes = list(executor.map(_plan_van_route, tasks))
+    else:
+        routes = [_plan_van_route(([coordinates[index] for index in group], mode, time_limit, None)) for group in groups]
+
+    # the routes' orders refer to their group, make them refer to the coordinates list
+    for group, van_route in zip(groups, routes):
+        van_route.order = [group[index] for index in van_route.order]
+    return routes
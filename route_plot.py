@@ -0,0 +1,126 @@
+## @file route_plot.py
+#
+# @brief Rendering of the maintenance routes.
+# @brief Every route is drawn as one batched line collection and every station as one scatter, the stations' names are only
+# @brief displayed when few stations are visible (zooming in shows them). The figure is embedded in a Tk window, which doesn't block
+# @brief the application, or exported to a PNG / SVG file without any display.
+#
+# @section libraries_route_plot Libraries/Modules
+# - tkinter
+# - matplotlib
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from tkinter import ttk
+from tkinter import filedialog
+import tkinter as tk
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+## @brief Largest number of visible stations for which the names are displayed
+LABEL_MAX = 60
+
+## @brief Colors of the vans' routes
+ROUTE_COLORS = ["#8c8d8d", "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#bcbd22", "#17becf"]
+
+
+class RoutePlot:
+
+    ## @brief build the figure of the routes
+    # @param routes List of routes (route.Route), their order referring to the stations' lists
+    # @param coordinates List of the stations' (x, y) coordinates
+    # @param names List of the stations' names
+    # @param title Title of the figure
+    def __init__(self, routes, coordinates, names, title=""):
+        ## @brief List of the stations' (x, y) coordinates, the warehouse last
+        self.points = list(coordinates) + [(0, 0)]
+        ## @brief List of the stations' names, the warehouse last
+        self.names = list(names) + ["Warehouse"]
+        ## @brief Station name texts currently displayed
+        self.labels = []
+        ## @brief Axes limits for which the labels have been placed
+        self.labelled_limits = None
+
+        ## @brief The matplotlib figure (not managed by pyplot, so it can be embedded or exported)
+        self.figure = Figure(figsize=(7, 6))
+        ## @brief The axes of the figure
+        self.axes = self.figure.add_subplot()
+        self.axes.set_aspect("equal", adjustable="datalim")
+        self.axes.set_axis_off()
+        self.axes.set_title(title)
+
+        # one line collection per van, the route going from the warehouse to the last station
+        for i, van_route in enumerate(routes):
+            path = [(0, 0)] + [coordinates[index] for index in van_route.order]
+            segments = list(zip(path[:-1], path[1:]))
+            self.axes.add_collection(LineCollection(segments, colors=ROUTE_COLORS[i % len(ROUTE_COLORS)] if len(routes) > 1 else ROUTE_COLORS[0], linewidths=1.5, zorder=1))
+
+        # every station in a single scatter, the warehouse apart
+        if len(coordinates) > 0:
+            xs, ys = zip(*coordinates)
+            self.axes.scatter(xs, ys, s=30, c="#e3fafb", edgecolors="#8c8d8d", zorder=2)
+        self.axes.scatter([0], [0], s=80, c="#8B0000", marker="s", zorder=3)
+        self.axes.autoscale_view()
+
+        self.update_labels()
+        self.axes.callbacks.connect("xlim_changed", self.update_labels)
+        self.axes.callbacks.connect("ylim_changed", self.update_labels)
+
+    ## @brief display the names of the visible stations, if there are few of them
+    def update_labels(self, axes=None):
+        x_min, x_max = self.axes.get_xlim()
+        y_min, y_max = self.axes.get_ylim()
+        limits = (x_min, x_max, y_min, y_max)
+        if limits == self.labelled_limits: # both limits changed for the same zoom
+            return
+        self.labelled_limits = limits
+
+        for label in self.labels:
+            label.remove()
+        self.labels = []
+
+        visible = []
+        for index, (x, y) in enumerate(self.points):
+            if x_min <= x <= x_max and y_min <= y <= y_max:
+                visible.append(index)
+                if len(visible) > LABEL_MAX: # too many stations, no names
+                    return
+
+        for index in visible:
+            x, y = self.points[index]
+            self.labels.append(self.axes.annotate(self.names[index], (x, y), xytext=(4, 4), textcoords="offset points", fontsize=8, fontweight="bold", color="#8B0000", zorder=4))
+
+    ## @brief export the figure to a file without any display (the format is given by the extension, .png or .svg)
+    def export(self, path):
+        FigureCanvasAgg(self.figure) # attach a headless canvas
+        self.figure.savefig(path)
+
+
+class RouteWindow(tk.Toplevel):
+
+    ## @brief open a window displaying the routes (the window doesn't block the application)
+    # @param parent The parent window
+    # @param plot The RoutePlot to display
+    def __init__(self, parent, plot):
+        tk.Toplevel.__init__(self, parent)
+        self.title("Maintenance route")
+        ## @brief The displayed RoutePlot
+        self.plot = plot
+
+        canvas = FigureCanvasTkAgg(plot.figure, master=self)
+        toolbar = NavigationToolbar2Tk(canvas, self, pack_toolbar=False) # zoom and pan
+        toolbar.update()
+        ttk.Button(self, text="Export", command=self.export_action).pack(side=tk.BOTTOM, pady=3)
+        toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+        canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        canvas.draw_idle()
+
+    ## @brief export the displayed routes to a PNG / SVG file
+    def export_action(self):
+        path = filedialog.asksaveasfilename(parent=self, filetypes=(('PNG files', '*.png'), ('SVG files', '*.svg')), defaultextension=".png", initialfile="route")
+        if path: # a file has been selected
+            self.plot.figure.savefig(path)
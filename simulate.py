@@ -0,0 +1,320 @@
+## @file simulate.py
+#
+# @brief Discrete-event simulation of the rents, without any display, to size the fleet and to load the store at high event rates.
+# @brief The riders arrive at random stations (a Poisson process of trips per day) and take the most charged bike, as on the user
+# @brief screen, following the rules of the engine (core.py): a bike at MIN_RENT_BATTERY % or less can't be rented, a rent lasts 1 to
+# @brief MAX_RENT_TIME minutes and uses BATTERY_PER_MINUTE % per minute, the rider goes away if the bike can't last the trip. The
+# @brief bike is then ridden to a random station, where it is docked again when the trip ends, and the rents and returns are
+# @brief counted. The batteries aren't charged by the application, so the days also measure how long the fleet lasts.
+# @brief Several independent runs (Monte Carlo, one seed each) are spread over a process pool. With --store, each rent is also
+# @brief applied to a real store through the engine, and the store is checked against the simulation at the end.
+# @brief     python simulate.py --bikes 100000 --trips-per-day 1000000 --days 3 --runs 8
+# @brief     python simulate.py --file data/data.json --store
+#
+# @section libraries_simulate Libraries/Modules
+# - argparse
+# - concurrent.futures (only to run several simulations at once)
+# - heapq
+# - json
+# - os
+# - random
+# - sys
+# - time
+# - benchmark
+# - core
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import time
+import benchmark
+import core
+
+## @brief Number of minutes in a day
+MINUTES_PER_DAY = 24 * 60
+
+## @brief Mean duration (in minutes) of the trips, the durations are exponentially distributed between 1 and core.MAX_RENT_TIME
+TRIP_MINUTES = 15
+
+## @brief Default number of trips per day
+TRIPS_PER_DAY = 100000
+
+## @brief Fleet given to the simulations by a worker initializer, read once per process (instead of once per run)
+worker_fleet = None
+
+
+class FleetData:
+
+    ## @brief plain lists of a fleet, sent to the worker processes
+    # @param stations List of (station_id, station_name, x, y)
+    # @param bikes List of (bike_id, battery_level, station index in stations), the bikes of an unknown station are skipped
+    def __init__(self, stations, bikes):
+        self.stations = stations
+        self.bikes = bikes
+
+    ## @brief read the fleet of a store
+    @staticmethod
+    def from_store(fleet):
+        stations = [(station["id"], station["name"], station["x"], station["y"]) for station in fleet.stations()]
+        indexes = {station[0]: index for index, station in enumerate(stations)}
+        bikes = [(bike["id"], bike["battery_level"], indexes[bike["station_id"]]) for bike in fleet.bikes() if bike["station_id"] in indexes]
+        return FleetData(stations, bikes)
+
+    ## @brief synthetic fleet: stations placed on a grid around the warehouse, bikes docked to random stations
+    # @param nb_stations Number of stations
+    # @param nb_bikes Number of bikes
+    # @param battery_level Battery level of every bike (random levels if None)
+    # @param seed Seed of the random generator
+    @staticmethod
+    def generate(nb_stations, nb_bikes, battery_level=None, seed=0):
+        generator = random.Random(seed)
+        stations = [(f"station-{index}", f"Station {index}", x, y) for index, (x, y) in enumerate(benchmark.grid_coordinates(nb_stations))]
+        bikes = [(f"bike-{index}", battery_level if battery_level is not None else generator.randint(0, 100), generator.randrange(nb_stations)) for index in range(nb_bikes)]
+        return FleetData(stations, bikes)
+
+    ## @brief engine holding the fleet in memory (no journal), for the simulations applied to a store
+    def manager(self):
+        manager = core.FleetManager(directory=None)
+        manager.fleet.add_stations(self.stations)
+        manager.fleet.add_bikes([(bike_id, None, battery_level, self.stations[station][0]) for bike_id, battery_level, station in self.bikes])
+        return manager
+
+
+## @brief simulate the rents of a fleet
+# @param data The FleetData simulated (left unchanged)
+# @param trips_per_day Mean number of trips asked per day
+# @param days Number of simulated days
+# @param seed Seed of the random generator, a run is repeated by its seed
+# @param trip_minutes Mean duration of the trips
+# @param store True to also apply each rent and day to a store through the engine, and check the store at the end
+# @return Dictionary of the run: the seed, the counts of the trips (asked, served, refused because the station had no rentable bike
+# or because its most charged bike couldn't last the trip), the state of the fleet at the end of each day, the
+# duration and the events per second, and whether the store matches the simulation (None without store)
+def simulate(data, trips_per_day, days=1, seed=0, trip_minutes=TRIP_MINUTES, store=False):
+    generator = random.Random(seed)
+    expovariate, randrange = generator.expovariate, generator.randrange
+    heappush, heappop = heapq.heappush, heapq.heappop
+    min_battery, max_minutes, battery_per_minute = core.MIN_RENT_BATTERY, core.MAX_RENT_TIME, core.BATTERY_PER_MINUTE
+    nb_stations = len(data.stations)
+    if nb_stations == 0:
+        raise ValueError("there is no station to simulate")
+    manager = data.manager() if store else None
+    station_names = [station[1] for station in data.stations]
+    bike_ids = [bike[0] for bike in data.bikes]
+
+    batteries = [bike[1] for bike in data.bikes]
+    docked = [[] for station in range(nb_stations)] # heaps of (-battery level, bike), the most charged bike first
+    for bike, (bike_id, battery_level, station) in enumerate(data.bikes):
+        docked[station].append((-battery_level, bike))
+    for heap in docked:
+        heapq.heapify(heap)
+    riding = [] # heap of (end of the trip, bike, destination)
+    rents, returns = [0] * nb_stations, [0] * nb_stations
+
+    rate = trips_per_day / MINUTES_PER_DAY # trips per minute
+    trip_rate = 1 / trip_minutes
+    asked = served = refused_empty = refused_battery = 0
+    day_results = []
+    start = time.perf_counter()
+    now = 0.0
+    for day in range(days):
+        end = (day + 1) * MINUTES_PER_DAY
+        day_served = served
+        while rate > 0:
+            now += expovariate(rate) # next rider
+            if now >= end:
+                break
+            while riding and riding[0][0] <= now: # dock the bikes whose trip is over
+                arrival, bike, destination = heappop(riding)
+                heappush(docked[destination], (-batteries[bike], bike))
+
+            asked += 1
+            origin = randrange(nb_stations)
+            heap = docked[origin]
+            if not heap or -heap[0][0] <= min_battery:
+                refused_empty += 1
+                continue
+            minutes = min(max_minutes, int(expovariate(trip_rate)) + 1)
+            battery_used = battery_per_minute * minutes
+            if battery_used > -heap[0][0]:
+                refused_battery += 1
+                continue
+
+            battery_level, bike = heappop(heap)
+            destination = randrange(nb_stations)
+            batteries[bike] = -battery_level - battery_used
+            rents[origin] += 1
+            returns[destination] += 1
+            served += 1
+            heappush(riding, (now + minutes, bike, destination))
+            if manager is not None:
+                manager.rent_bike(bike_ids[bike], station_names[destination], minutes)
+
+        now = end # the arrivals are memoryless, the next day starts at midnight
+        if manager is not None:
+            manager.pass_day()
+        day_results.append({
+            "served": served - day_served,
+            "average_battery": sum(batteries) / len(batteries) if batteries else 0,
+            "drained_bikes": sum(1 for battery_level in batteries if battery_level <= min_battery),
+            "empty_stations": sum(1 for heap in docked if not heap or -heap[0][0] <= min_battery) # without the bikes still ridden
+        })
+    seconds = time.perf_counter() - start
+
+    while riding: # end the last trips
+        arrival, bike, destination = heappop(riding)
+        heappush(docked[destination], (-batteries[bike], bike))
+
+    consistent = None
+    if manager is not None:
+        consistent = manager.fleet.total_rents() == served and manager.fleet.total_returns() == served
+        for station, heap in enumerate(docked):
+            station_id = data.stations[station][0]
+            for battery_level, bike in heap:
+                stored = manager.fleet.get_bike(bike_ids[bike])
+                if stored["station_id"] != station_id or stored["battery_level"] != -battery_level:
+                    consistent = False
+            stored = manager.fleet.get_station(station_id)
+            if stored["nb_rents"] != rents[station] or stored["nb_returns"] != returns[station]:
+                consistent = False
+        manager.close()
+
+    return {
+        "seed": seed,
+        "asked": asked,
+        "served": served,
+        "refused_empty": refused_empty,
+        "refused_battery": refused_battery,
+        "days": day_results,
+        "seconds": seconds,
+        "events_per_second": (asked + served) / seconds if seconds > 0 else 0, # departures asked and arrivals
+        "consistent": consistent
+    }
+
+
+## @brief keep the fleet in a worker process (initializer of the pool)
+def init_worker(data):
+    global worker_fleet
+    worker_fleet = data
+
+
+## @brief simulate the fleet of the worker process
+def simulate_worker(*args):
+    return simulate(worker_fleet, *args)
+
+
+## @brief run independent simulations of a fleet, one per seed, spread over a process pool
+# @param data The FleetData simulated
+# @param runs Number of simulations, with the seeds seed, seed + 1, ...
+# @param workers Number of processes (one per processor if None, the simulations are run in this process if 1)
+# @param log Optional function called with a line of text once a simulation is done
+# @return Dictionary of the settings, the runs (results of simulate, in seed order) and their statistics
+def run(data, trips_per_day=TRIPS_PER_DAY, days=1, runs=1, workers=None, seed=0, trip_minutes=TRIP_MINUTES, store=False, log=None):
+    seeds = range(seed, seed + runs)
+    workers = min(runs, workers or os.cpu_count() or 1)
+    if workers <= 1:
+        results = []
+        for run_seed in seeds:
+            results.append(simulate(data, trips_per_day, days, run_seed, trip_minutes, store))
+            if log is not None:
+                log(f"run {run_seed} done")
+    else:
+        from concurrent.futures import ProcessPoolExecutor # multiprocessing is only loaded by several simulations
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(data,)) as executor:
+            futures = [executor.submit(simulate_worker, trips_per_day, days, run_seed, trip_minutes, store) for run_seed in seeds]
+            results = []
+            for future in futures:
+                results.append(future.result())
+                if log is not None:
+                    log(f"run {results[-1]['seed']} done")
+
+    return {
+        "settings": {"stations": len(data.stations), "bikes": len(data.bikes), "trips_per_day": trips_per_day, "days": days, "runs": runs,
+                     "seed": seed, "trip_minutes": trip_minutes, "store": store},
+        "runs": results,
+        "statistics": statistics(results)
+    }
+
+
+## @brief statistics of the runs: mean, lowest and highest value, and 5th and 95th percentiles of the main counts
+def statistics(results):
+    values = {
+        "served_ratio": [result["served"] / result["asked"] if result["asked"] else 0 for result in results],
+        "refused_empty": [result["refused_empty"] for result in results],
+        "refused_battery": [result["refused_battery"] for result in results],
+        "last_day_served": [result["days"][-1]["served"] if result["days"] else 0 for result in results],
+        "average_battery": [result["days"][-1]["average_battery"] if result["days"] else 0 for result in results],
+        "events_per_second": [result["events_per_second"] for result in results]
+    }
+    summary = {}
+    for name, numbers in values.items():
+        ordered = sorted(numbers)
+        summary[name] = {
+            "mean": sum(ordered) / len(ordered),
+            "min": ordered[0],
+            "p5": ordered[int(0.05 * (len(ordered) - 1))],
+            "p95": ordered[round(0.95 * (len(ordered) - 1))],
+            "max": ordered[-1]
+        }
+    return summary
+
+
+## @brief text table of the statistics of the runs
+def format_results(report):
+    settings = report["settings"]
+    lines = [f"{settings['runs']} run(s) of {settings['days']} day(s) : {settings['bikes']} bikes, {settings['stations']} stations, {settings['trips_per_day']} trips per day"]
+    lines.append(f"{'':<18}" + "".join(f"{name:>14}" for name in ("mean", "min", "p5", "p95", "max")))
+    for name, summary in report["statistics"].items():
+        lines.append(f"{name:<18}" + "".join(f"{value:>14.4f}" if isinstance(value, float) else f"{value:>14}" for value in summary.values()))
+    if settings["store"]:
+        consistent = all(result["consistent"] for result in report["runs"])
+        lines.append("The store matches the simulation" if consistent else "The store doesn't match the simulation")
+    return "\n".join(lines)
+
+
+## @brief run the simulations from the command line
+# @param argv Arguments of the command line (sys.argv[1:] if None)
+# @return Exit status (1 if a store doesn't match its simulation)
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="simulate.py", description="Simulation of the rents of a fleet.")
+    parser.add_argument("--file", help="simulate the fleet of a database (.json, .snap) instead of a synthetic fleet")
+    parser.add_argument("--bikes", type=int, default=10000, help="bikes of the synthetic fleet (default: %(default)s)")
+    parser.add_argument("--stations", type=int, help="stations of the synthetic fleet (one per %d bikes by default)" % benchmark.BIKES_PER_STATION)
+    parser.add_argument("--battery", type=int, help="battery level of the synthetic bikes (random by default)")
+    parser.add_argument("--trips-per-day", type=int, default=TRIPS_PER_DAY, help="mean number of trips asked per day (default: %(default)s)")
+    parser.add_argument("--trip-minutes", type=float, default=TRIP_MINUTES, help="mean duration of the trips (default: %(default)s)")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=1, help="independent simulations (default: %(default)s)")
+    parser.add_argument("--workers", type=int, help="processes running the simulations (one per processor by default)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store", action="store_true", help="also apply the rents to a store through the engine, and check it")
+    parser.add_argument("--output", help="save the runs to a JSON file")
+    arguments = parser.parse_args(argv)
+
+    if arguments.file is not None and core.is_csv_path(arguments.file):
+        parser.error("a CSV file only holds bikes or stations, simulate a database (.json, .snap)")
+    if arguments.file is not None:
+        data = FleetData.from_store(core.read_file(arguments.file))
+    else:
+        data = FleetData.generate(arguments.stations or max(1, arguments.bikes // benchmark.BIKES_PER_STATION), arguments.bikes, arguments.battery, arguments.seed)
+    report = run(data, arguments.trips_per_day, arguments.days, arguments.runs, arguments.workers, arguments.seed, arguments.trip_minutes,
+                 arguments.store, log=lambda line: print(line, file=sys.stderr))
+    print(format_results(report))
+
+    if arguments.output is not None:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if arguments.store and not all(result["consistent"] for result in report["runs"]):
+        return 1
+    return 0
+
+
+if __name__ == "__main__": # the simulation workers import this module, they must not run the simulations again
+    sys.exit(main())
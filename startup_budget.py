@@ -0,0 +1,84 @@
+## @file startup_budget.py
+#
+# @brief Check of the cold startup time of the application, measured with python -X importtime.
+# @brief The application is imported in a new interpreter (without opening its window), the import times of the modules are read
+# @brief from its error output, and the check fails if the imports exceed the budget or if a module that must be imported on first
+# @brief use (matplotlib, numpy, pillow) is imported at startup:
+# @brief     python startup_budget.py [--budget MS] [--module main] [--top 15]
+#
+# @section libraries_startup_budget Libraries/Modules
+# - argparse
+# - os
+# - re
+# - subprocess
+# - sys
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+## @brief Largest import time (in ms) of the application
+STARTUP_BUDGET = 100
+
+## @brief Packages only imported on first use, never at startup
+LAZY_PACKAGES = ("matplotlib", "numpy", "PIL", "multiprocessing")
+
+## @brief Line written by -X importtime: self time, cumulative time (in us) and indented name of the module
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+## @brief import a module in a new interpreter and read its import times
+# @param module Name of the imported module
+# @return List of (name, self time, cumulative time, depth) of the imported modules (times in us), in import order
+# @exception RuntimeError the module can't be imported
+def measure(module="main"):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=directory, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{module} can't be imported:\n{result.stderr}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is not None:
+            imports.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return imports
+
+
+## @brief measure the startup and compare it to the budget
+# @param argv Arguments of the command line (sys.argv[1:] if None)
+# @return Exit status (1 if the budget is exceeded or a lazy package is imported)
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="startup_budget.py", description="Check the import time of the application.")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="largest import time in ms (default: %(default)s)")
+    parser.add_argument("--module", default="main", help="imported module (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules printed (default: %(default)s)")
+    arguments = parser.parse_args(argv)
+
+    imports = measure(arguments.module)
+    total = sum(cumulative for name, self_time, cumulative, depth in imports if depth == 0) / 1000 # the modules imported by the interpreter and the module
+    print(f"Import time of {arguments.module} : {total:.1f} ms (budget {arguments.budget:g} ms)")
+
+    print("Slowest modules (cumulative time) :")
+    for name, self_time, cumulative, depth in sorted(imports, key=lambda item: item[2], reverse=True)[:arguments.top]:
+        print(f"{cumulative / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+    status = 0
+    lazy = sorted({name.split(".")[0] for name, self_time, cumulative, depth in imports} & set(LAZY_PACKAGES))
+    if lazy:
+        print("Imported at startup instead of first use : " + ", ".join(lazy))
+        status = 1
+    if total > arguments.budget:
+        print("The startup budget is exceeded")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
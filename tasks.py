@@ -0,0 +1,144 @@
+## @file tasks.py
+#
+# @brief Background tasks of the application (import, export, route computation).
+# @brief The tasks run on a worker thread, one after another, and their results are handed back to the tkinter thread by polling
+# @brief with after(): tkinter and the data model are only ever touched from the tkinter thread. A task can be cancelled, it then
+# @brief stops at its next progress report and only its on_cancel callback is called, once it has stopped.
+#
+# @section libraries_tasks Libraries/Modules
+# - concurrent.futures
+# - threading
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+## @brief Interval (in ms) between two checks of the running tasks
+POLL_INTERVAL = 50
+
+
+## @brief Error raised inside a task when it has been cancelled
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+
+    ## @brief initialize a task
+    # @param name Text displayed by the status indicator
+    def __init__(self, name):
+        ## @brief Text displayed by the status indicator
+        self.name = name
+        ## @brief Progress of the task, from 0 to 1 (None if the task doesn't report it)
+        self.progress = None
+        ## @brief Future of the worker thread
+        self.future = None
+        self.cancel_event = threading.Event()
+
+    ## @brief ask the task to stop (only its on_cancel callback will be called)
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel() # not started yet
+
+    ## @brief True if the task has been cancelled
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    ## @brief report the progress of the task (called from the worker), stops the task if it has been cancelled
+    def report(self, progress):
+        if self.cancel_event.is_set():
+            raise TaskCancelled()
+        self.progress = progress
+
+
+class TaskScheduler:
+
+    ## @brief initialize the scheduler
+    # @param root The tkinter window whose event loop receives the results
+    def __init__(self, root):
+        self.root = root
+        ## @brief Single worker thread: the tasks run one after another, so they never share the route cache or a file
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task")
+        ## @brief Submitted tasks whose callbacks haven't been called yet, with their (on_done, on_error, on_cancel) callbacks
+        self.tasks = {}
+        ## @brief Functions called with the list of the pending tasks when the status changes
+        self.listeners = []
+        ## @brief Id of the scheduled polling (None when no task is pending)
+        self.poll_id = None
+
+    ## @brief run a function on the worker thread
+    # @param name Text displayed by the status indicator
+    # @param function Function called with the task (to report progress) and args, it must not touch tkinter nor the data model
+    # @param on_done Function called on the tkinter thread with the result of the function
+    # @param on_error Function called on the tkinter thread with the exception raised by the function
+    # @param on_cancel Function called on the tkinter thread once the task has stopped, if it has been cancelled (whether the
+    # function finished or not), to undo what was prepared for the task
+    def submit(self, name, function, *args, on_done=None, on_error=None, on_cancel=None):
+        task = Task(name)
+        task.future = self.executor.submit(function, task, *args)
+        self.tasks[task] = (on_done, on_error, on_cancel)
+        self._notify()
+        if self.poll_id is None:
+            self.poll_id = self.root.after(POLL_INTERVAL, self.poll)
+        return task
+
+    ## @brief hand the results of the finished tasks to their callbacks (tkinter thread)
+    def poll(self):
+        self.poll_id = None
+        for task in [task for task in self.tasks if task.future.done()]:
+            on_done, on_error, on_cancel = self.tasks.pop(task)
+            if task.cancelled():
+                if on_cancel is not None:
+                    on_cancel()
+                continue
+            error = task.future.exception()
+            if error is None:
+                if on_done is not None:
+                    on_done(task.future.result())
+            elif on_error is not None:
+                on_error(error)
+            else:
+                self.root.report_callback_exception(type(error), error, error.__traceback__)
+
+        self._notify()
+        if self.tasks:
+            self.poll_id = self.root.after(POLL_INTERVAL, self.poll)
+
+    ## @brief cancel every pending task
+    def cancel_all(self):
+        for task in self.tasks:
+            task.cancel()
+        self._notify()
+
+    ## @brief cancel the pending tasks and stop the worker (when the application is closed)
+    # @param wait True to wait for the running task, which stops at its next progress report
+    def shutdown(self, wait=False):
+        self.cancel_all()
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+    ## @brief register a function called with the list of the pending tasks when the status changes
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        listener(self.pending())
+
+    ## @brief unregister a listener
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    ## @brief pending tasks, in submission order (the cancelled ones excluded)
+    def pending(self):
+        return [task for task in self.tasks if not task.cancelled()]
+
+    ## @brief give the pending tasks to every listener
+    def _notify(self):
+        pending = self.pending()
+        for listener in list(self.listeners):
+            listener(pending)
@@ -0,0 +1,134 @@
+## @file test_fleet_csv.py
+#
+# @brief Tests of the CSV files of bikes and stations (fleet_csv.py): the header and the rows are checked before any record
+# @brief is added, and a batch is added to the store entirely or not at all.
+#
+# @section libraries_test_fleet_csv Libraries/Modules
+# - os
+# - tempfile
+# - unittest
+# - fleet
+# - fleet_csv
+# - fleet_sqlite
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import os
+import tempfile
+import unittest
+from fleet import FleetStore, FILE_CHECK, BIKE, STATION
+import fleet_csv
+from fleet_sqlite import SQLiteStore
+
+
+class ReadCSVTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "records.csv")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    ## @brief read a CSV text into a batch
+    def read(self, text, prefix=b""):
+        with open(self.path, "wb") as file:
+            file.write(prefix + text.encode("utf-8"))
+        batch = fleet_csv.CSVBatch()
+        with open(self.path, "rb") as file:
+            for progress in fleet_csv.read_csv(file, batch):
+                self.assertLessEqual(progress, 1.0)
+        return batch
+
+    def test_stations(self):
+        batch = self.read("name,x,y,id\r\nGare,3,-4,s1\r\n\r\n\"Place, Nord\", 10 ,0,\r\n")
+        self.assertEqual(batch.kind, STATION)
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.records[0], ("s1", "Gare", 3, -4))
+        self.assertEqual(batch.records[1][1:], ("Place, Nord", 10, 0))
+        self.assertNotEqual(batch.records[1][0], "") # generated id
+
+    def test_bikes(self):
+        batch = self.read(" Battery_Level , STATION,number\n100,Gare,12\n0,Place,\n", "\ufeff".encode("utf-8"))
+        self.assertEqual(batch.kind, BIKE)
+        self.assertEqual([record[1:] for record in batch.records], [("12", 100, "Gare"), (None, 0, "Place")])
+        self.assertNotEqual(batch.records[0][0], batch.records[1][0])
+
+    def test_header_errors(self):
+        for header in ("", "name,x", "name,x,y,battery_level", "battery_level,station,colour", "id\n"):
+            with self.assertRaises(ValueError, msg=header):
+                self.read(header + "\n1,2,3\n")
+
+    def test_row_errors(self):
+        rows = {
+            "name,x,y\nGare,1\n": "line 2: 3 columns expected, 2 found",
+            "name,x,y\nGare,1,2\nPlace,a,2\n": "line 3: x must be an integer",
+            "name,x,y\n,1,2\n": "line 2: the name of the station is empty",
+            "name,x,y\nGare,0,0\n": "line 2: the coordinates (0, 0) are the ones of the main warehouse",
+            "name,x,y\nGare,1,101\n": "line 2: the coordinates must be between -100 and 100",
+            "battery_level,station\n50.5,Gare\n": "line 2: battery_level must be an integer",
+            "battery_level,station\n101,Gare\n": "line 2: the battery level must be between 0 and 100",
+            "battery_level,station\n\n50,\n": "line 3: the station of the bike is empty",
+        }
+        for text, message in rows.items():
+            with self.assertRaises(ValueError, msg=text) as context:
+                self.read(text)
+            self.assertEqual(str(context.exception), message)
+
+
+class CSVBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        memory = FleetStore()
+        sqlite = SQLiteStore(os.path.join(self.directory.name, "fleet.db"))
+        self.stores = [memory, sqlite]
+        for store in self.stores:
+            store.load({"file_check": FILE_CHECK})
+            store.add_stations([("s1", "Gare", 1, 1), ("s2", "Place", 2, 2)])
+            store.add_bikes([("b1", None, 50, "s1")])
+
+    def tearDown(self):
+        self.stores[1].close()
+        self.directory.cleanup()
+
+    ## @brief batch of records
+    def batch(self, kind, records):
+        batch = fleet_csv.CSVBatch()
+        batch.kind = kind
+        batch.records = records
+        return batch
+
+    def test_bikes_added_to_their_stations(self):
+        for store in self.stores:
+            added = self.batch(BIKE, [("b2", None, 80, "Place"), ("b3", "9", 20, "Gare")]).apply(store)
+            self.assertEqual(len(added), 2)
+            self.assertEqual(store.get_bike("b2")["station_id"], "s2")
+            self.assertEqual(store.get_bike("b3")["number"], "9")
+            self.assertEqual(store.bike_count(), 3)
+
+    def test_stations_added(self):
+        for store in self.stores:
+            self.batch(STATION, [("s3", "Parc", 3, 3)]).apply(store)
+            self.assertEqual(store.get_station_by_name("Parc")["id"], "s3")
+
+    def test_nothing_added_on_error(self):
+        batches = [
+            (KeyError, self.batch(BIKE, [("b2", None, 80, "Place"), ("b3", None, 20, "Nowhere")])), # unknown station
+            (ValueError, self.batch(BIKE, [("b2", None, 80, "Place"), ("b1", None, 20, "Gare")])), # bike already in the store
+            (ValueError, self.batch(BIKE, [("b2", None, 80, "Place"), ("b2", None, 20, "Gare")])), # bike twice in the batch
+            (ValueError, self.batch(STATION, [("s3", "Parc", 3, 3), ("s1", "Autre", 4, 4)])), # station already in the store
+            (ValueError, self.batch(STATION, [("s3", "Parc", 3, 3), ("s3", "Autre", 4, 4)])) # station twice in the batch
+        ]
+        for store in self.stores:
+            before = store.to_dict()
+            for error, batch in batches:
+                with self.assertRaises(error, msg=f"{type(store).__name__} {batch.records}"):
+                    batch.apply(store)
+                self.assertEqual(store.to_dict(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+## @file test_fleet_index.py
+#
+# @brief Tests of the sorted indexes (fleet_index.py) against sorted lists, with small buckets so that they are split and
+# @brief emptied, and of the sorted lists and the rentable bikes of the store kept up to date by its mutations.
+#
+# @section libraries_test_fleet_index Libraries/Modules
+# - bisect
+# - random
+# - unittest
+# - unittest.mock
+# - fleet
+# - fleet_index
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import bisect
+import random
+import unittest
+from unittest import mock
+from fleet import FleetStore, FILE_CHECK
+import fleet_index
+from fleet_index import SortedIndex, SortedView
+
+
+class SortedIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(fleet_index, "BUCKET_SIZE", 8)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    ## @brief the index holds the pairs of a sorted list
+    def check_index(self, index, pairs):
+        self.assertEqual(len(index), len(pairs))
+        self.assertEqual(index.handles(0, len(pairs)), [handle for value, handle in pairs])
+        for start, stop in ((0, 1), (3, 17), (len(pairs) - 5, len(pairs) + 3), (-2, 4), (9, 9), (12, 5)):
+            self.assertEqual(index.handles(start, stop), [handle for value, handle in pairs[max(start, 0):max(stop, 0)]])
+        for value in (-1, 0, 7, 25, 50, 51):
+            self.assertEqual(index.count_up_to(value), bisect.bisect_right(pairs, (value, float("inf"))))
+
+    def test_random_inserts_and_removes(self):
+        generator = random.Random(18)
+        index, pairs = SortedIndex("q"), []
+        for handle in range(400):
+            if pairs and generator.random() < 0.4:
+                pair = pairs.pop(generator.randrange(len(pairs)))
+                index.remove(*pair)
+            else:
+                pair = (generator.randint(0, 50), handle)
+                bisect.insort(pairs, pair)
+                index.insert(*pair)
+            if handle % 20 == 0:
+                self.check_index(index, pairs)
+        self.check_index(index, pairs)
+        self.assertGreater(len(index.buckets), 1)
+
+        while pairs: # the buckets are emptied
+            index.remove(*pairs.pop(generator.randrange(len(pairs))))
+        self.check_index(index, pairs)
+        self.assertEqual(index.buckets, [])
+
+    def test_built_from_a_column(self):
+        column = [5, 3, 5, 1, 3, 5]
+        index = SortedIndex.from_column("q", column, range(len(column)))
+        self.check_index(index, sorted((value, handle) for handle, value in enumerate(column)))
+        negated = SortedIndex.from_column("q", column, range(len(column)), negate=True)
+        self.check_index(negated, sorted((-value, handle) for handle, value in enumerate(column)))
+
+    def test_removing_a_missing_pair(self):
+        index = SortedIndex.from_column("d", [1.5, 2.5], [0, 1])
+        for pair in ((1.5, 1), (2.0, 0), (9.0, 0)):
+            with self.assertRaises(ValueError):
+                index.remove(*pair)
+        self.check_index(index, [(1.5, 0), (2.5, 1)])
+
+
+class SortedViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.values = [4, 2, 4, 9, 2, 0, 4]
+        self.index = SortedIndex.from_column("q", self.values, range(len(self.values)))
+
+    def test_positions_and_slices(self):
+        for reverse in (False, True):
+            expected = sorted(range(len(self.values)), key=self.values.__getitem__) # ties in handle order
+            if reverse:
+                expected.reverse()
+            view = SortedView(lambda: self.index, lambda handle: handle, reverse)
+            self.assertEqual(len(view), len(expected))
+            self.assertEqual(list(view), expected)
+            for position in range(-len(expected), len(expected)):
+                self.assertEqual(view[position], expected[position])
+            for positions in (slice(0, 3), slice(2, None), slice(-3, -1), slice(None, None, 2), slice(5, 2)):
+                self.assertEqual(view[positions], expected[positions])
+            for position in (len(expected), -len(expected) - 1):
+                with self.assertRaises(IndexError):
+                    view[position]
+
+    def test_view_follows_the_index(self):
+        view = SortedView(lambda: self.index, lambda handle: handle)
+        self.index.insert(-1, 7)
+        self.assertEqual(view[0], 7)
+        self.index.remove(9, 3)
+        self.assertEqual(view[-1], 6)
+        self.assertEqual(len(view), len(self.values))
+
+
+class StoreSortedListsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fleet = FleetStore()
+        self.fleet.load({"file_check": FILE_CHECK})
+        self.fleet.add_stations([(f"s{index}", f"Station {index}", index, index) for index in range(1, 6)])
+        self.fleet.add_bikes([(f"b{index}", None, index % 7 * 10, f"s{index % 5 + 1}") for index in range(60)])
+
+    def test_sorted_lists_follow_the_mutations(self):
+        generator = random.Random(19)
+        sorted_bikes = {(field, reverse): self.fleet.sorted_bikes(field, reverse) for field in ("nb_days", "nb_rents") for reverse in (False, True)}
+        sorted_stations = {(field, reverse): self.fleet.sorted_stations(field, reverse) for field in ("nb_rents", "nb_returns") for reverse in (False, True)}
+        for step in range(300):
+            operation = generator.randrange(5)
+            bike_id = f"b{generator.randrange(60)}"
+            if bike_id not in self.fleet.bikes_by_id:
+                continue
+            if operation < 3:
+                self.fleet.rent_bike(bike_id, f"s{generator.randint(1, 5)}", 0)
+            elif operation == 3:
+                self.fleet.pass_day()
+            else:
+                self.fleet.remove_bike(bike_id)
+
+        for (field, reverse), view in sorted_bikes.items():
+            expected = sorted(self.fleet.bikes(), key=lambda bike: bike[field]) # ties in insertion order
+            if reverse:
+                expected.reverse()
+            self.assertEqual([bike["id"] for bike in view], [bike["id"] for bike in expected], f"{field}, reverse={reverse}")
+        for (field, reverse), view in sorted_stations.items():
+            expected = sorted(self.fleet.stations(), key=lambda station: station[field])
+            if reverse:
+                expected.reverse()
+            self.assertEqual([station["id"] for station in view], [station["id"] for station in expected], f"{field}, reverse={reverse}")
+
+    def test_available_bikes_follow_the_mutations(self):
+        generator = random.Random(20)
+        for step in range(300):
+            bike_id = f"b{generator.randrange(60)}"
+            if bike_id not in self.fleet.bikes_by_id:
+                continue
+            operation = generator.randrange(4)
+            if operation < 2:
+                bike = self.fleet.get_bike(bike_id)
+                self.fleet.rent_bike(bike_id, f"s{generator.randint(1, 5)}", min(bike["battery_level"], generator.randint(0, 15)))
+            elif operation == 2:
+                self.fleet.move_bike(bike_id, f"s{generator.randint(1, 5)}")
+            else:
+                self.fleet.remove_bike(bike_id)
+
+            if step % 30 == 0:
+                for station_id in ("s1", "s2", "s3", "s4", "s5"):
+                    for min_battery in (0, 20, 20.5, 100):
+                        # the most charged first, ties in reverse insertion order
+                        expected = [bike for bike in self.fleet.bikes() if bike["station_id"] == station_id and bike["battery_level"] > min_battery]
+                        expected.sort(key=lambda bike: bike["battery_level"])
+                        expected.reverse()
+                        self.assertEqual([bike["id"] for bike in self.fleet.available_bikes(station_id, min_battery)], [bike["id"] for bike in expected])
+
+    def test_available_bikes_of_an_unknown_station(self):
+        self.assertEqual(self.fleet.available_bikes("unknown", 0), [])
+        for bike_id in self.fleet.docked_bike_ids("s1"):
+            self.fleet.move_bike(bike_id, "s2")
+        self.fleet.remove_station("s1")
+        self.assertEqual(self.fleet.available_bikes("s1", 0), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+## @file test_fleet_io.py
+#
+# @brief Tests of the streaming JSON reader and writer (fleet_io.py): values cut by the end of a chunk, the byte order mark,
+# @brief the round trip of a database and the errors of the invalid files.
+#
+# @section libraries_test_fleet_io Libraries/Modules
+# - io
+# - json
+# - os
+# - tempfile
+# - unittest
+# - fleet
+# - fleet_io
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from fleet import FleetStore, FILE_CHECK
+import fleet_io
+
+## @brief Values whose text is cut at every position by the small chunks
+VALUES = [12345, -6.25e-3, 0, 1e21, "Gare de l'Est", "café € 🚲", True, False, None, [1, [2.5, "x"], {}], {"a": {"b": -7}}]
+
+## @brief Byte order mark written by some editors at the start of a UTF-8 file
+BOM = "\ufeff".encode("utf-8")
+
+
+## @brief parse every value of a JSON array with a stream reading the given number of bytes at once
+def stream_values(data, chunk_size):
+    stream = fleet_io.JSONStream(io.BytesIO(data), chunk_size)
+    values = []
+    stream.expect("[")
+    while True:
+        values.append(stream.value())
+        if stream.expect(",]") == "]":
+            break
+    stream.end()
+    return values
+
+
+class JSONStreamTest(unittest.TestCase):
+
+    def test_values_across_chunks(self):
+        for separator in (",", " , \n"):
+            data = ("[" + separator.join(json.dumps(value, ensure_ascii=False) for value in VALUES) + "]").encode("utf-8")
+            for chunk_size in range(1, 12):
+                self.assertEqual(stream_values(data, chunk_size), VALUES, f"chunks of {chunk_size} bytes")
+
+    def test_number_at_the_end_of_a_chunk(self):
+        # the first chunk ends after "12", which is a valid number on its own
+        self.assertEqual(stream_values(b"[12345]", 3), [12345])
+        self.assertEqual(stream_values(b"[1, 2.5e10]", 6), [1, 2.5e10])
+
+    def test_byte_order_mark(self):
+        data = BOM + b' [1, "a"]'
+        for chunk_size in range(1, 8):
+            self.assertEqual(stream_values(data, chunk_size), [1, "a"], f"chunks of {chunk_size} bytes")
+
+    def test_invalid_text(self):
+        for data in (b"[1, 2", b"[1 2]", b"[1, tru]", b"[1] 2", b'["a]'):
+            for chunk_size in (1, 4, 64):
+                with self.assertRaises(json.JSONDecodeError, msg=f"{data} in chunks of {chunk_size} bytes"):
+                    stream_values(data, chunk_size)
+
+
+class DatabaseFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "fleet.json")
+        self.fleet = FleetStore()
+        self.fleet.load({"file_check": FILE_CHECK})
+        self.fleet.add_stations([(f"s{index}", f"Station n°{index}", index, -index) for index in range(1, 30)])
+        self.fleet.add_bikes([(f"b{index}", None, index % 101, f"s{index % 29 + 1}") for index in range(200)])
+        self.fleet.rent_bike("b3", "s7", 2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    ## @brief write a text to the database file
+    def write_text(self, text, prefix=b""):
+        with open(self.path, "wb") as file:
+            file.write(prefix + text.encode("utf-8"))
+
+    ## @brief read the database file into a new store
+    def read(self, chunk_size=fleet_io.CHUNK_SIZE):
+        store = FleetStore()
+        with open(self.path, "rb") as file:
+            for progress in fleet_io.read_database(file, store, chunk_size=chunk_size):
+                self.assertLessEqual(progress, 1.0)
+        return store
+
+    def test_written_text_is_the_one_of_json_dump(self):
+        with open(self.path, "w") as file:
+            for progress in fleet_io.write_database(file, self.fleet):
+                pass
+        with open(self.path) as file:
+            self.assertEqual(file.read(), json.dumps(self.fleet.to_dict()))
+
+    def test_round_trip(self):
+        text = json.dumps(self.fleet.to_dict(), indent=2, ensure_ascii=False)
+        for prefix in (b"", BOM):
+            self.write_text(text, prefix)
+            for chunk_size in (1, 7, 100, fleet_io.CHUNK_SIZE):
+                self.assertEqual(self.read(chunk_size).to_dict(), self.fleet.to_dict(), f"chunks of {chunk_size} bytes")
+
+    def test_other_database(self):
+        self.write_text(json.dumps({"file_check": "other", "bikes": [], "stations": []}))
+        with self.assertRaises(fleet_io.WrongDatabaseError):
+            self.read()
+
+    def test_missing_file_check(self):
+        self.write_text(json.dumps({"bikes": [], "stations": []}))
+        with self.assertRaises(KeyError):
+            self.read()
+
+    def test_missing_field(self):
+        data = self.fleet.to_dict()
+        del data["bikes"][0]["battery_level"]
+        self.write_text(json.dumps(data))
+        with self.assertRaises(KeyError):
+            self.read()
+
+    def test_truncated_file(self):
+        text = json.dumps(self.fleet.to_dict())
+        self.write_text(text[:len(text) // 2])
+        with self.assertRaises(json.JSONDecodeError):
+            self.read(64)
+
+
+if __name__ == "__main__":
+    unittest.main()
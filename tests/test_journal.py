@@ -0,0 +1,181 @@
+## @file test_journal.py
+#
+# @brief Tests of the automatic saving (journal.py): replay after a crash, torn last line, compaction into a snapshot,
+# @brief replacement of the data (RESTART journal) with and without its snapshot.
+#
+# @section libraries_test_journal Libraries/Modules
+# - json
+# - os
+# - tempfile
+# - unittest
+# - core
+# - fleet
+# - journal
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import json
+import os
+import tempfile
+import unittest
+import core
+from fleet import FleetStore, FILE_CHECK
+import journal
+
+
+## @brief text of the whole content of a store
+def dump(store):
+    return json.dumps(store.to_dict())
+
+
+## @brief fill a store with a few stations, bikes and rents
+def fill(store):
+    for index in range(5):
+        store.add_station(f"s{index}", f"Station {index}", index, -index)
+    for index in range(30):
+        store.add_bike(f"b{index}", store.next_bike_number(), 100, f"s{index % 5}")
+    for index in range(40):
+        store.rent_bike(f"b{index % 30}", f"s{index % 4}", 1.5)
+    store.pass_day()
+    store.move_bike("b3", "s0")
+    store.remove_bike("b4")
+    store.add_bikes([("c1", None, 60, "s1"), ("c2", None, 70, "s2")])
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temporary = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temporary.name, "autosave")
+
+    def tearDown(self):
+        self.temporary.cleanup()
+
+    ## @brief open the saved data in a new store
+    def reopen(self):
+        store = FleetStore()
+        saving = journal.Journal(self.directory)
+        saving.open(store)
+        return store, saving
+
+    def test_replay_after_crash(self):
+        store, saving = self.reopen()
+        fill(store)
+        saving.flush() # crash: the journal isn't closed
+        expected = dump(store)
+
+        restored, saving = self.reopen()
+        self.assertEqual(dump(restored), expected)
+        saving.close()
+
+    def test_torn_last_line(self):
+        store, saving = self.reopen()
+        fill(store)
+        saving.flush()
+        expected = dump(store)
+        with open(saving.path("journal", saving.generation), "ab") as file:
+            file.write(b'deadbeef ["pass_d') # crash while writing a line
+        size = os.path.getsize(saving.path("journal", saving.generation)) - len(b'deadbeef ["pass_d')
+
+        restored, saving = self.reopen()
+        self.assertEqual(dump(restored), expected)
+        self.assertEqual(os.path.getsize(saving.path("journal", saving.generation)), size) # the torn line is dropped
+        saving.close()
+
+    def test_compaction_continues_the_journal(self):
+        store, saving = self.reopen()
+        fill(store)
+        generation, copy = saving.start_compaction() # the next journal starts with CONTINUE
+        store.rent_bike("b1", "s2", 3) # written to the new journal while the snapshot is written
+        saving.write_snapshot(generation, copy)
+        saving.end_compaction()
+        store.pass_day()
+        saving.close()
+        expected = dump(store)
+
+        snapshots, journals = saving.generations()
+        self.assertEqual(snapshots, [generation])
+        self.assertEqual(journals, [generation])
+        restored, saving = self.reopen()
+        self.assertEqual(dump(restored), expected)
+        saving.close()
+
+    def test_replay_of_the_journals_before_the_snapshot_is_written(self):
+        store, saving = self.reopen()
+        fill(store)
+        saving.start_compaction() # the snapshot is never written (crash)
+        store.pass_day()
+        saving.flush()
+        expected = dump(store)
+
+        restored, saving = self.reopen() # the previous journal and the CONTINUE journal are replayed
+        self.assertEqual(dump(restored), expected)
+        saving.close()
+
+    def test_replaced_data_is_saved_on_close(self):
+        manager = core.FleetManager(directory=self.directory)
+        fill(manager.fleet)
+        imported = FleetStore()
+        imported.load({"file_check": FILE_CHECK})
+        imported.add_station("z", "Imported", 7, 7)
+        manager.import_data(imported) # the next journal starts with RESTART
+        self.assertTrue(manager.flush())
+        manager.journal.start_compaction() # the snapshot task is cancelled by the close
+        manager.add_bike(40, "Imported")
+        expected = dump(manager.fleet)
+        manager.close()
+
+        restored = core.FleetManager(directory=self.directory)
+        self.assertIsNone(restored.restore_error)
+        self.assertEqual(dump(restored.fleet), expected)
+        self.assertFalse(any(name.endswith(".part") for name in os.listdir(self.directory)))
+        restored.close()
+
+    def test_crash_after_import_restores_the_previous_data(self):
+        store, saving = self.reopen()
+        fill(store)
+        saving.flush()
+        before_import = dump(store)
+        imported = FleetStore()
+        imported.load({"file_check": FILE_CHECK})
+        store.replace(imported) # the next journal starts with RESTART
+        store.add_station("z", "Imported", 7, 7)
+        saving.flush() # crash before the snapshot of the imported data
+        unrestored_journal = saving.path("journal", saving.generation)
+
+        manager = core.FleetManager(directory=self.directory)
+        self.assertIsNone(manager.restore_error)
+        self.assertIsNotNone(manager.restore_warning)
+        self.assertEqual(dump(manager.fleet), before_import)
+        self.assertEqual(manager.journal.unrestored, [unrestored_journal + journal.UNRESTORED_SUFFIX])
+        self.assertTrue(os.path.exists(unrestored_journal + journal.UNRESTORED_SUFFIX)) # kept aside
+
+        # the restored data is still saved
+        manager.add_station("After", 9, 9)
+        manager.flush()
+        expected = dump(manager.fleet)
+        restored = core.FleetManager(directory=self.directory) # crash, then the application starts again
+        self.assertIsNone(restored.restore_error)
+        self.assertIsNone(restored.restore_warning)
+        self.assertEqual(dump(restored.fleet), expected)
+        self.assertTrue(os.path.exists(unrestored_journal + journal.UNRESTORED_SUFFIX))
+        restored.close()
+
+    def test_missing_journal_is_reported(self):
+        store, saving = self.reopen()
+        fill(store)
+        saving.start_compaction()
+        saving.start_compaction()
+        store.pass_day()
+        saving.flush()
+        os.remove(saving.path("journal", saving.generation - 1))
+        files = sorted(os.listdir(self.directory))
+
+        with self.assertRaises(ValueError):
+            self.reopen()
+        self.assertEqual(sorted(os.listdir(self.directory)), files) # nothing is deleted
+
+if __name__ == "__main__":
+    unittest.main()
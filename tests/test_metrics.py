@@ -0,0 +1,140 @@
+## @file test_metrics.py
+#
+# @brief Tests of the latency metrics (metrics.py): the buckets and the percentiles of the rolling histograms, the timed
+# @brief functions and blocks, the counters recorded from several threads, the JSON dump and the profile of an operation.
+#
+# @section libraries_test_metrics Libraries/Modules
+# - json
+# - os
+# - tempfile
+# - threading
+# - unittest
+# - unittest.mock
+# - metrics
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import metrics
+from metrics import LatencyHistogram, Metrics, timed
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().summary(), {"count": 0, "mean": 0.0, "max": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0,
+                                                        "buckets": [0] * len(metrics.BUCKETS)})
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for milliseconds in range(100, 0, -1): # 1 ms to 100 ms, in any order
+            histogram.add(milliseconds / 1000)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertAlmostEqual(summary["mean"], 0.0505)
+        self.assertEqual(summary["max"], 0.1)
+        self.assertEqual(summary["p50"], 0.051)
+        self.assertEqual(summary["p95"], 0.096)
+        self.assertEqual(summary["p99"], 0.1)
+
+    def test_buckets(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.0, 0.0001, 0.00011, 0.001, 0.05, 0.2, 1.0, 5.0, 60.0):
+            histogram.add(seconds)
+        # a duration equal to the bound of a bucket is counted in that bucket
+        self.assertEqual(histogram.buckets(), [2, 2, 0, 1, 0, 1, 1, 1, 1])
+
+    def test_rolling_window(self):
+        histogram = LatencyHistogram(window=10)
+        for seconds in range(1, 21):
+            histogram.add(seconds)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 20) # since the start
+        self.assertEqual(summary["mean"], 10.5)
+        self.assertEqual(summary["max"], 20)
+        self.assertEqual(summary["p50"], 16) # of the last 10 durations
+        self.assertEqual(sum(summary["buckets"]), 10)
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_timed_function_and_block(self):
+        @timed("function", self.metrics)
+        def function(value):
+            if value < 0:
+                raise ValueError("negative")
+            return value * 2
+
+        self.assertEqual(function(3), 6)
+        with self.assertRaises(ValueError): # the failed calls are timed too
+            function(-1)
+        with timed("block", self.metrics):
+            pass
+        operations = self.metrics.report()["operations"]
+        self.assertEqual(list(operations), ["block", "function"])
+        self.assertEqual(operations["function"]["count"], 2)
+        self.assertEqual(operations["block"]["count"], 1)
+        self.assertEqual(function.__name__, "function")
+
+    def test_disabled(self):
+        self.metrics.enabled = False
+        timed("function", self.metrics)(lambda: None)()
+        with timed("block", self.metrics):
+            pass
+        self.assertEqual(self.metrics.report()["operations"], {})
+
+    def test_counters_from_several_threads(self):
+        def count():
+            for step in range(1000):
+                self.metrics.count("rents")
+                self.metrics.count_change("bike", "update", None)
+        threads = [threading.Thread(target=count) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.metrics.report()["counters"], {"bike.update": 4000, "rents": 4000})
+
+        self.metrics.reset()
+        self.assertEqual(self.metrics.report(), {"operations": {}, "counters": {}})
+
+    def test_dump(self):
+        self.metrics.record("export", 0.02)
+        self.metrics.count("rents", 3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            self.metrics.dump(path)
+            with open(path) as file:
+                report = json.load(file)
+        self.assertEqual(report["buckets"][-1], None) # no upper bound
+        self.assertEqual(report["buckets"][:-1], list(metrics.BUCKETS[:-1]))
+        self.assertEqual(report["operations"]["export"]["p50"], 0.02)
+        self.assertEqual(report["counters"], {"rents": 3})
+
+    def test_profile_of_the_next_operation(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(metrics, "PROFILE_DIRECTORY", directory):
+            self.metrics.profile_next("export")
+            with timed("import", self.metrics): # another operation, not profiled
+                pass
+            self.assertIsNone(self.metrics.last_profile)
+            with timed("export", self.metrics):
+                sorted(range(1000))
+            name, path, text = self.metrics.last_profile
+            self.assertEqual(name, "export")
+            self.assertTrue(os.path.isfile(path))
+            self.assertIn("function calls", text)
+            self.assertIsNone(self.metrics.profile_name) # only the next operation is profiled
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+## @file test_route.py
+#
+# @brief Tests of the route solver (route.py and tsp.c): the exact mode against a brute force search on small sets of stations,
+# @brief the lower bounds, the cache that repairs the previous route, and the split between several vans.
+#
+# @section libraries_test_route Libraries/Modules
+# - itertools
+# - math
+# - random
+# - unittest
+# - unittest.mock
+# - route
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import itertools
+import math
+import random
+import unittest
+from unittest import mock
+import route
+
+
+## @brief cost of a tour starting from and returning to the warehouse
+def tour_cost(points):
+    path = [(0, 0)] + list(points) + [(0, 0)]
+    return sum(math.dist(path[index], path[index + 1]) for index in range(len(path) - 1))
+
+
+## @brief random stations with different coordinates
+def random_stations(count, seed):
+    generator = random.Random(seed)
+    stations = set()
+    while len(stations) < count:
+        stations.add((generator.randint(-30, 30), generator.randint(-30, 30)))
+    stations.discard((0, 0))
+    return sorted(stations)
+
+
+class RouteTest(unittest.TestCase):
+
+    def test_exact_matches_brute_force(self):
+        for count in range(1, 9):
+            for seed in range(3):
+                stations = random_stations(count, seed)
+                best = min(tour_cost(order) for order in itertools.permutations(stations))
+                for mode in (route.EXACT, route.AUTO):
+                    planned = route.plan_route(stations, mode)
+                    self.assertEqual(sorted(planned.order), list(range(len(stations))))
+                    self.assertAlmostEqual(planned.cost, tour_cost([stations[index] for index in planned.order]))
+                    self.assertAlmostEqual(planned.cost, best, msg=f"{count} stations, seed {seed}")
+                    self.assertTrue(planned.optimal)
+
+    def test_heuristic_is_a_tour_above_its_lower_bound(self):
+        for count in (5, 50, 500, route.BOUND_MAX_STATIONS + 100):
+            stations = random_stations(count, count) if count <= 1000 else [(index % 100 - 50, index // 100 + 1) for index in range(count)]
+            planned = route.plan_route(stations, route.HEURISTIC)
+            self.assertEqual(sorted(planned.order), list(range(len(stations))))
+            self.assertAlmostEqual(planned.cost, tour_cost([stations[index] for index in planned.order]), places=6)
+            self.assertGreater(planned.lower_bound, 0)
+            self.assertLessEqual(planned.lower_bound, planned.cost + 1e-9)
+
+    def test_exact_mode_falls_back_to_the_heuristic_on_large_sets(self):
+        stations = random_stations(route.EXACT_MODE_MAX_STATIONS + 20, 1)
+        planned = route.plan_route(stations, route.EXACT, time_limit=0.5)
+        self.assertEqual(planned.mode, route.HEURISTIC)
+        self.assertEqual(sorted(planned.order), list(range(len(stations))))
+
+    def test_van_routes_visit_every_station_once(self):
+        stations = random_stations(60, 7)
+        demands = [index % 4 for index in range(len(stations))]
+        routes = route.plan_van_routes(stations, demands, 4, 30)
+        visited = sorted(index for van_route in routes for index in van_route.order)
+        self.assertEqual(visited, list(range(len(stations))))
+        for van_route in routes:
+            self.assertLessEqual(sum(demands[index] for index in van_route.order), 30)
+
+    def test_van_capacity_is_checked(self):
+        with self.assertRaises(ValueError):
+            route.plan_van_routes([(1, 1), (2, 2)], [5, 5], 1, 6)
+
+
+class RouteCacheTest(unittest.TestCase):
+
+    ## @brief the planned route visits every station once, its cost is the one of its tour and above its lower bound
+    def check_route(self, stations, planned):
+        self.assertEqual(sorted(planned.order), list(range(len(stations))))
+        self.assertAlmostEqual(planned.cost, tour_cost([stations[index] for index in planned.order]), places=6)
+        self.assertLessEqual(planned.lower_bound, planned.cost + 1e-9)
+
+    def test_same_stations_reuse_the_route(self):
+        cache = route.RouteCache()
+        stations = random_stations(40, 3)
+        first = cache.plan(stations, route.HEURISTIC, time_limit=0.2)
+        shuffled = list(reversed(stations))
+        with mock.patch.object(route, "plan_route", side_effect=AssertionError("route computed again")):
+            second = cache.plan(shuffled, route.HEURISTIC)
+        self.check_route(shuffled, second)
+        self.assertEqual(second.cost, first.cost)
+        self.assertEqual([shuffled[index] for index in second.order], [stations[index] for index in first.order])
+
+    def test_few_changes_repair_the_route(self):
+        cache = route.RouteCache()
+        stations = random_stations(300, 4)
+        first = cache.plan(stations, route.HEURISTIC, time_limit=0.2)
+        changed = stations[5:] + [(point[0] + 100, point[1]) for point in stations[:5]] # 5 removed, 5 added
+        with mock.patch.object(route, "plan_route", side_effect=AssertionError("route computed again")):
+            repaired = cache.plan(changed, route.HEURISTIC, time_limit=0.2)
+        self.check_route(changed, repaired)
+        self.assertFalse(repaired.optimal)
+        self.assertEqual(repaired.mode, route.HEURISTIC)
+        self.assertEqual(repaired.tight_bound, first.tight_bound)
+
+        # the repaired lower bound is still below the cost of the best tour found from scratch
+        planned = route.plan_route(changed, route.HEURISTIC, time_limit=0.2)
+        self.assertLessEqual(repaired.lower_bound, planned.cost + 1e-9)
+
+    def test_many_changes_compute_the_route_again(self):
+        cache = route.RouteCache()
+        stations = random_stations(300, 5)
+        cache.plan(stations, route.HEURISTIC, time_limit=0.2)
+        changes = int(route.REPAIR_MAX_CHANGES * len(stations)) + 1
+        changed = stations[changes:] + [(point[0] + 100, point[1]) for point in stations[:changes]]
+        with mock.patch.object(route, "plan_route", wraps=route.plan_route) as plan_route:
+            self.check_route(changed, cache.plan(changed, route.HEURISTIC, time_limit=0.2))
+        plan_route.assert_called_once()
+
+    def test_small_sets_and_mode_changes_compute_the_route_again(self):
+        cache = route.RouteCache()
+        stations = random_stations(route.EXACT_MAX_STATIONS, 6)
+        cache.plan(stations, route.AUTO)
+        with mock.patch.object(route, "plan_route", wraps=route.plan_route) as plan_route:
+            changed = stations[1:] + [(100, 100)]
+            planned = cache.plan(changed, route.AUTO) # solved exactly rather than repaired
+            self.check_route(changed, planned)
+            self.assertEqual(planned.mode, route.EXACT)
+            self.check_route(changed, cache.plan(changed, route.HEURISTIC, time_limit=0.2))
+        self.assertEqual(plan_route.call_count, 2)
+
+    def test_clear_forgets_the_route(self):
+        cache = route.RouteCache()
+        stations = random_stations(30, 7)
+        cache.plan(stations, route.HEURISTIC, time_limit=0.2)
+        cache.clear()
+        with mock.patch.object(route, "plan_route", wraps=route.plan_route) as plan_route:
+            cache.plan(stations, route.HEURISTIC, time_limit=0.2)
+        plan_route.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
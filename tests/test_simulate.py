@@ -0,0 +1,79 @@
+## @file test_simulate.py
+#
+# @brief Tests of the rent simulation (simulate.py): the rents applied to a store through the engine match the simulation, a run is
+# @brief repeated by its seed, and the riders are refused by the stations without any rentable bike.
+#
+# @section libraries_test_simulate Libraries/Modules
+# - unittest
+# - core
+# - simulate
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import unittest
+import core
+import simulate
+from simulate import FleetData
+
+
+## @brief result of a run without its durations, which change from a run to another
+def counts(result):
+    return {key: value for key, value in result.items() if key not in ("seconds", "events_per_second")}
+
+
+class SimulateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = FleetData.generate(20, 300, seed=3)
+
+    def test_store_matches_the_simulation(self):
+        for seed in range(3):
+            result = simulate.simulate(self.data, trips_per_day=2000, days=3, seed=seed, store=True)
+            self.assertGreater(result["served"], 0)
+            self.assertTrue(result["consistent"], f"seed {seed}")
+
+    def test_counts(self):
+        result = simulate.simulate(self.data, trips_per_day=3000, days=2, seed=1)
+        self.assertIsNone(result["consistent"])
+        self.assertEqual(result["asked"], result["served"] + result["refused_empty"] + result["refused_battery"])
+        self.assertEqual(sum(day["served"] for day in result["days"]), result["served"])
+        self.assertEqual(len(result["days"]), 2)
+        self.assertLessEqual(result["days"][1]["average_battery"], result["days"][0]["average_battery"]) # never charged
+
+    def test_run_repeated_by_its_seed(self):
+        first = simulate.simulate(self.data, trips_per_day=1000, seed=7)
+        self.assertEqual(counts(simulate.simulate(self.data, trips_per_day=1000, seed=7)), counts(first))
+        self.assertNotEqual(counts(simulate.simulate(self.data, trips_per_day=1000, seed=8)), counts(first))
+
+        report = simulate.run(self.data, trips_per_day=1000, runs=2, workers=1, seed=7)
+        self.assertEqual([result["seed"] for result in report["runs"]], [7, 8])
+        self.assertEqual(counts(report["runs"][0]), counts(first))
+        statistics = report["statistics"]["refused_empty"]
+        self.assertLessEqual(statistics["min"], statistics["mean"])
+        self.assertLessEqual(statistics["mean"], statistics["max"])
+
+    def test_drained_fleet_serves_nobody(self):
+        data = FleetData.generate(5, 50, battery_level=core.MIN_RENT_BATTERY)
+        result = simulate.simulate(data, trips_per_day=500, seed=2, store=True)
+        self.assertEqual(result["served"], 0)
+        self.assertEqual(result["refused_empty"], result["asked"])
+        self.assertTrue(result["consistent"])
+
+    def test_fleet_of_a_store(self):
+        manager = self.data.manager()
+        try:
+            data = FleetData.from_store(manager.fleet)
+        finally:
+            manager.close()
+        self.assertEqual(data.stations, self.data.stations)
+        self.assertEqual(data.bikes, self.data.bikes)
+
+    def test_no_station(self):
+        with self.assertRaises(ValueError):
+            simulate.simulate(FleetData([], []), trips_per_day=100)
+
+
+if __name__ == "__main__":
+    unittest.main()
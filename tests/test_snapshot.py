@@ -0,0 +1,92 @@
+## @file test_snapshot.py
+#
+# @brief Round trips of the database files: binary snapshots (fleet_snapshot.py) and JSON files (fleet_io.py).
+#
+# @section libraries_test_snapshot Libraries/Modules
+# - json
+# - os
+# - tempfile
+# - unittest
+# - core
+# - fleet
+# - fleet_snapshot
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import json
+import os
+import tempfile
+import unittest
+import core
+from fleet import FleetStore, FILE_CHECK
+import fleet_snapshot
+
+## @brief Database in the format written by the original application (json.dump of its dict)
+DATABASE = {
+    "file_check": FILE_CHECK,
+    "bikes": [
+        {"id": "b1", "number": "1", "battery_level": 80, "station_id": "s1", "nb_days": 3, "nb_rents": 2},
+        {"id": "b2", "number": "2", "battery_level": 12.5, "station_id": "s2", "nb_days": 0, "nb_rents": 0},
+        {"id": "b3", "number": "3", "battery_level": 0, "station_id": "s1", "nb_days": 1, "nb_rents": 7}
+    ],
+    "stations": [
+        {"id": "s1", "name": "Gare", "x": 1, "y": 2, "docked_bikes": ["b3", "b1"], "nb_rents": 4, "nb_returns": 1},
+        {"id": "s2", "name": "Été", "x": -3.5, "y": 0, "docked_bikes": ["b2"], "nb_rents": 0, "nb_returns": 3},
+        {"id": "s3", "name": "Empty", "x": 10, "y": 10, "docked_bikes": [], "nb_rents": 5, "nb_returns": 5}
+    ],
+    "last_bike_number": 3
+}
+
+
+class FileRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = FleetStore()
+        self.store.load(json.loads(json.dumps(DATABASE)))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    ## @brief write the snapshot of the store to a file (snapshots are read through mmap)
+    def write_snapshot(self):
+        path = os.path.join(self.directory.name, "data.snap")
+        with open(path, "wb") as file:
+            for progress in fleet_snapshot.write_snapshot(file, self.store):
+                pass
+        return path
+
+    def test_snapshot_round_trip(self):
+        path = self.write_snapshot()
+        restored = FleetStore()
+        with open(path, "rb") as file:
+            self.assertTrue(fleet_snapshot.is_snapshot(file))
+            for progress in fleet_snapshot.read_snapshot(file, restored, FILE_CHECK):
+                pass
+        self.assertEqual(restored.to_dict(), DATABASE)
+        self.assertEqual(restored.available_bikes("s1", 2)[0]["id"], "b1")
+
+    def test_snapshot_of_another_database_is_refused(self):
+        path = self.write_snapshot()
+        with open(path, "rb") as file, self.assertRaises(ValueError):
+            for progress in fleet_snapshot.read_snapshot(file, FleetStore(), "another_database"):
+                pass
+
+    def test_json_round_trip_is_byte_identical(self):
+        source = os.path.join(self.directory.name, "data.json")
+        exported = os.path.join(self.directory.name, "exported.json")
+        with open(source, "w") as file:
+            json.dump(DATABASE, file)
+
+        manager = core.FleetManager(directory=None)
+        manager.import_data(core.read_file(source))
+        manager.export_file(exported)
+        manager.close()
+        with open(source, "rb") as first, open(exported, "rb") as second:
+            self.assertEqual(first.read(), second.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
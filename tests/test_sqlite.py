@@ -0,0 +1,115 @@
+## @file test_sqlite.py
+#
+# @brief Tests of the import and the export of a SQLite database by a connection of a worker thread (core.py, fleet_sqlite.py):
+# @brief the other connection keeps reading the previous data, the changes are refused meanwhile, a failed import changes nothing.
+#
+# @section libraries_test_sqlite Libraries/Modules
+# - json
+# - os
+# - tempfile
+# - threading
+# - unittest
+# - core
+# - fleet
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+import core
+from fleet import FleetStore, FILE_CHECK
+
+
+## @brief run a function on another thread, as the task scheduler does, and return its result (or raise its error)
+def run_on_worker(function):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = function()
+        except Exception as error:
+            outcome["error"] = error
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+class SQLiteWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = core.FleetManager(database=self.path("fleet.db"))
+        for index in range(10):
+            self.manager.add_station(f"Station {index}", index + 1, -index)
+        for index in range(300):
+            self.manager.add_bike(20 + index % 81, f"Station {index % 10}")
+        self.manager.rent_bike(self.manager.fleet.bikes()[5]["id"], "Station 3", 4)
+
+    def tearDown(self):
+        self.manager.close()
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    ## @brief write a database file holding a single station
+    def write_other_database(self):
+        other = FleetStore()
+        other.load({"file_check": FILE_CHECK, "last_bike_number": 7})
+        other.add_station("z", "Other", 5, 5)
+        core.write_file(self.path("other.json"), other)
+        return other.to_dict()
+
+    def test_export_on_worker(self):
+        expected = json.dumps(self.manager.fleet.to_dict())
+        run_on_worker(self.manager.start_export(self.path("data.json")))
+        with open(self.path("data.json")) as file:
+            self.assertEqual(file.read(), expected) # same text as json.dump
+
+        run_on_worker(self.manager.start_export(self.path("data.snap")))
+        self.assertEqual(json.dumps(core.read_file(self.path("data.snap")).to_dict()), expected)
+
+    def test_import_on_worker(self):
+        expected = self.write_other_database()
+        events = []
+        self.manager.fleet.subscribe(lambda kind, action, record: events.append((kind, action)))
+
+        read = self.manager.start_import(self.path("other.json"))
+        with self.assertRaises(core.FleetError): # the data can't be changed until the import is over
+            self.manager.add_station("Refused", 50, 50)
+        loaded = run_on_worker(read)
+        self.assertEqual(events, []) # the views aren't reloaded before import_data
+        self.manager.import_data(loaded)
+
+        self.assertFalse(self.manager.importing)
+        self.assertEqual(self.manager.fleet.to_dict(), expected)
+        self.assertEqual(len(events), 2)
+        self.manager.add_station("Accepted", 50, 50)
+
+    def test_failed_import_changes_nothing(self):
+        expected = self.manager.fleet.to_dict()
+        with open(self.path("torn.json"), "w") as file:
+            file.write('{"file_check": "' + FILE_CHECK + '", "stations": [], "bikes": [{"id": ')
+
+        read = self.manager.start_import(self.path("torn.json"))
+        with self.assertRaises(ValueError):
+            run_on_worker(read)
+        self.manager.cancel_import()
+
+        self.assertEqual(self.manager.fleet.to_dict(), expected)
+        indexes = self.manager.fleet.connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchone()[0]
+        self.assertEqual(indexes, 7) # the indexes dropped by the load are back
+        self.manager.add_station("Accepted", 50, 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
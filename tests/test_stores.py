@@ -0,0 +1,124 @@
+## @file test_stores.py
+#
+# @brief Differential tests of the stores: the same random mutations are applied to the in-memory FleetStore and to the
+# @brief SQLiteStore, then every query must give the same answer.
+#
+# @section libraries_test_stores Libraries/Modules
+# - os
+# - random
+# - tempfile
+# - unittest
+# - fleet
+# - fleet_sqlite
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import os
+import random
+import tempfile
+import unittest
+from fleet import FleetStore, FILE_CHECK
+from fleet_sqlite import SQLiteStore
+
+## @brief Number of random mutations applied to the stores
+NB_OPERATIONS = 1500
+
+
+class StoreEquivalenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.memory = FleetStore()
+        self.memory.load({"file_check": FILE_CHECK})
+        self.sqlite = SQLiteStore(os.path.join(self.directory.name, "fleet.db"))
+        self.sqlite.load({"file_check": FILE_CHECK})
+
+    def tearDown(self):
+        self.sqlite.close()
+        self.directory.cleanup()
+
+    ## @brief apply a mutation to both stores, which must both succeed or both raise the same kind of error
+    def apply(self, name, *args):
+        outcomes = []
+        for store in (self.memory, self.sqlite):
+            try:
+                getattr(store, name)(*args)
+                outcomes.append(None)
+            except (KeyError, ValueError, TypeError) as error:
+                outcomes.append(type(error))
+        self.assertEqual(outcomes[0], outcomes[1], f"{name}{args}")
+
+    ## @brief every query gives the same answer on both stores
+    def check_queries(self):
+        memory, sqlite = self.memory, self.sqlite
+        self.assertEqual(memory.bike_count(), sqlite.bike_count())
+        self.assertEqual(memory.station_count(), sqlite.station_count())
+        self.assertEqual(memory.total_rents(), sqlite.total_rents())
+        self.assertEqual(memory.total_returns(), sqlite.total_returns())
+        self.assertEqual(memory.last_bike_number, sqlite.last_bike_number)
+        self.assertAlmostEqual(memory.average_battery() or 0, sqlite.average_battery() or 0)
+        self.assertEqual([dict(bike) for bike in memory.bikes()], [dict(bike) for bike in sqlite.bikes()])
+        self.assertEqual([dict(station) for station in memory.stations()], [dict(station) for station in sqlite.stations()])
+
+        for station in memory.stations():
+            station_id = station["id"]
+            self.assertEqual(memory.docked_bike_ids(station_id), sqlite.docked_bike_ids(station_id))
+            self.assertEqual(memory.docked_count(station_id), sqlite.docked_count(station_id))
+            self.assertAlmostEqual(memory.average_battery(station_id) or 0, sqlite.average_battery(station_id) or 0)
+            self.assertEqual([bike["battery_level"] for bike in memory.available_bikes(station_id, 2)],
+                             [bike["battery_level"] for bike in sqlite.available_bikes(station_id, 2)])
+
+        for field in ("nb_days", "nb_rents"):
+            for reverse in (False, True):
+                self.assertEqual([bike[field] for bike in memory.sorted_bikes(field, reverse)], [bike[field] for bike in sqlite.sorted_bikes(field, reverse)])
+        for field in ("nb_rents", "nb_returns"):
+            for reverse in (False, True):
+                self.assertEqual([station[field] for station in memory.sorted_stations(field, reverse)], [station[field] for station in sqlite.sorted_stations(field, reverse)])
+
+    def test_random_mutations(self):
+        generator = random.Random(2022)
+        station_ids = [f"s{index}" for index in range(12)]
+        bike_ids = [f"b{index}" for index in range(80)]
+
+        self.apply("add_stations", [(station_id, "Station " + station_id, index, -index) for index, station_id in enumerate(station_ids[:6])])
+        for step in range(NB_OPERATIONS):
+            bike_id, station_id = generator.choice(bike_ids), generator.choice(station_ids)
+            operation = generator.randrange(10)
+            if operation == 0:
+                self.apply("add_station", station_id, "Station " + station_id, generator.randint(-50, 50), generator.randint(-50, 50))
+            elif operation == 1:
+                number = self.memory.next_bike_number()
+                self.sqlite.next_bike_number()
+                self.apply("add_bike", bike_id, number, generator.randint(0, 100), station_id)
+            elif operation == 2:
+                self.apply("add_bikes", [(generator.choice(bike_ids), None, generator.randint(0, 100), generator.choice(station_ids)) for index in range(3)])
+            elif operation == 3:
+                self.apply("move_bike", bike_id, station_id)
+            elif operation == 4:
+                self.apply("move_bikes", [(generator.choice(bike_ids), generator.choice(station_ids)) for index in range(3)])
+            elif operation == 5:
+                self.apply("remove_bike", bike_id)
+            elif operation == 6:
+                self.apply("remove_station", station_id)
+            elif operation in (7, 8):
+                self.apply("rent_bike", bike_id, station_id, generator.randint(0, 10))
+            else:
+                self.apply("pass_day")
+            if step % 100 == 0:
+                self.check_queries()
+        self.check_queries()
+
+    def test_batch_numbers(self):
+        self.apply("add_stations", [("s", "S", 1, 1)])
+        self.apply("add_bikes", [("b1", "2", 50, "s"), ("b2", "2", 50, "s")]) # repeated number
+        self.apply("add_bikes", [("b1", None, 50, "s"), ("b2", "7", 50, "s")])
+        self.apply("add_bikes", [("b3", "7", 50, "s")]) # number used by the store
+        self.check_queries()
+        self.assertEqual(self.memory.bike_count(), 2)
+        self.assertEqual(self.memory.next_bike_number(), "9")
+
+
+if __name__ == "__main__":
+    unittest.main()
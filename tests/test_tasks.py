@@ -0,0 +1,122 @@
+## @file test_tasks.py
+#
+# @brief Tests of the background tasks (tasks.py): callbacks of the finished, failed and cancelled tasks, and the compaction of the
+# @brief journal ended by a cancelled snapshot task.
+#
+# @section libraries_test_tasks Libraries/Modules
+# - os
+# - tempfile
+# - threading
+# - time
+# - unittest
+# - fleet
+# - journal
+# - tasks
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from fleet import FleetStore
+import journal
+from tasks import TaskScheduler, TaskCancelled
+
+
+class FakeRoot:
+
+    ## @brief stand-in of the tkinter window: the scheduled functions are run by run_pending
+    def __init__(self):
+        self.scheduled = {}
+        self.next_id = 0
+
+    def after(self, delay, function):
+        self.next_id += 1
+        self.scheduled[self.next_id] = function
+        return self.next_id
+
+    def after_cancel(self, identifier):
+        self.scheduled.pop(identifier, None)
+
+    def report_callback_exception(self, kind, error, traceback):
+        raise error
+
+    ## @brief run the scheduled functions until nothing is scheduled anymore
+    def run_pending(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.scheduled and time.monotonic() < deadline:
+            identifier = next(iter(self.scheduled))
+            self.scheduled.pop(identifier)()
+            time.sleep(0.001)
+
+
+class TaskSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = FakeRoot()
+        self.scheduler = TaskScheduler(self.root)
+        self.calls = []
+
+    def tearDown(self):
+        self.scheduler.shutdown(wait=True)
+
+    def submit(self, function):
+        return self.scheduler.submit("Test", function, on_done=lambda result: self.calls.append(("done", result)),
+                                     on_error=lambda error: self.calls.append(("error", type(error))),
+                                     on_cancel=lambda: self.calls.append(("cancel",)))
+
+    def test_finished_and_failed_tasks(self):
+        self.submit(lambda task: 42)
+        self.submit(lambda task: 1 / 0)
+        self.root.run_pending()
+        self.assertEqual(self.calls, [("done", 42), ("error", ZeroDivisionError)])
+        self.assertEqual(self.scheduler.pending(), [])
+
+    def test_cancelled_task_only_calls_on_cancel(self):
+        started = threading.Event()
+
+        def run(task):
+            started.set()
+            while True:
+                task.report(None)
+                time.sleep(0.001)
+
+        self.submit(run)
+        self.submit(lambda task: 42) # not started yet when cancelled
+        started.wait(5)
+        self.scheduler.cancel_all()
+        self.root.run_pending()
+        self.assertEqual(self.calls, [("cancel",), ("cancel",)])
+
+    def test_cancelled_snapshot_ends_the_compaction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            saving = journal.Journal(os.path.join(directory, "autosave"))
+            store = FleetStore()
+            saving.open(store)
+            store.add_station("s", "Station", 1, 1)
+            generation, copy = saving.start_compaction()
+            gate = threading.Event()
+
+            def write(task):
+                gate.wait(5)
+                saving.write_snapshot(generation, copy, task)
+
+            # the callbacks given by the application (main.py)
+            self.scheduler.submit("Saving a snapshot", write, on_done=lambda result: saving.end_compaction(),
+                                  on_error=saving.end_compaction, on_cancel=lambda: saving.end_compaction(TaskCancelled()))
+            self.scheduler.cancel_all()
+            gate.set()
+            self.root.run_pending()
+
+            self.assertFalse(saving.compacting)
+            self.assertTrue(saving.should_compact()) # the snapshot is written by the next compaction
+            self.assertEqual(saving.generations()[0], [])
+            saving.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+## @file test_widgets.py
+#
+# @brief Tests of the virtualized table (widgets.py): the widgets of the visible rows are recycled while scrolling, and the
+# @brief changed records only redraw the viewport.
+# @brief The tests need a display, they are skipped if tkinter can't open a window.
+#
+# @section libraries_test_widgets Libraries/Modules
+# - tkinter
+# - unittest
+# - widgets
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+import tkinter as tk
+import unittest
+from widgets import VirtualTable
+
+## @brief Number of rows of the tested tables
+VISIBLE_ROWS = 5
+
+
+class LazyRecords:
+
+    ## @brief lazy sequence of records, counting how many times it is read again
+    def __init__(self, records):
+        self.records = records
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def refresh(self):
+        self.refreshes += 1
+
+
+## @brief true if tkinter can open a window
+def has_display():
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        return False
+    return True
+
+
+@unittest.skipUnless(has_display(), "no display")
+class VirtualTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.clicked = []
+        self.table = VirtualTable(self.root, ["Id", "Name"], lambda record: (str(record["id"]), record["name"]),
+                                  actions=[("Remove", self.clicked.append)], visible_rows=VISIBLE_ROWS, key=lambda record: record["id"])
+        self.table.grid(row=0, column=0)
+        self.records = [{"id": index, "name": f"record {index}"} for index in range(100)]
+
+    def tearDown(self):
+        self.root.destroy()
+
+    ## @brief texts of the names shown by the rows of the viewport
+    def shown(self):
+        return [str(labels[1].cget("text")) for labels, buttons in self.table.rows]
+
+    ## @brief names of the records from a position, blank names after the last record
+    def expected(self, start):
+        return [self.records[index]["name"] if index < len(self.records) else "" for index in range(start, start + VISIBLE_ROWS)]
+
+    def test_only_the_visible_rows_have_widgets(self):
+        labels = len(self.table.body.winfo_children())
+        self.table.set_rows(self.records)
+        self.assertEqual(len(self.table.body.winfo_children()), labels)
+        self.assertEqual(len(self.table.rows), VISIBLE_ROWS)
+        self.assertEqual(self.shown(), self.expected(0))
+
+    def test_scrolling_recycles_the_rows(self):
+        self.table.set_rows(self.records)
+        widgets = [labels[1] for labels, buttons in self.table.rows]
+        self.table.scroll("scroll", 3, "units")
+        self.assertEqual(self.shown(), self.expected(3))
+        self.table.scroll("scroll", 1, "pages")
+        self.assertEqual(self.shown(), self.expected(3 + VISIBLE_ROWS))
+        self.table.scroll("moveto", "0.5")
+        self.assertEqual(self.shown(), self.expected(50))
+        self.assertEqual([labels[1] for labels, buttons in self.table.rows], widgets)
+
+    def test_scrolling_stops_at_the_ends(self):
+        self.table.set_rows(self.records)
+        self.table.scroll("scroll", -3, "units")
+        self.assertEqual(self.table.offset, 0)
+        self.table.scroll("moveto", "1.0")
+        self.assertEqual(self.table.offset, len(self.records) - VISIBLE_ROWS)
+        self.assertEqual(self.shown(), self.expected(len(self.records) - VISIBLE_ROWS))
+        first, last = self.table.scrollbar.get()
+        self.assertAlmostEqual(first, (len(self.records) - VISIBLE_ROWS) / len(self.records))
+        self.assertAlmostEqual(last, 1.0)
+
+    def test_fewer_records_than_rows(self):
+        self.table.set_rows(self.records)
+        self.table.scroll("moveto", "1.0")
+        self.records = self.records[:2]
+        self.table.set_rows(self.records)
+        self.assertEqual(self.table.offset, 0)
+        self.assertEqual(self.shown(), self.expected(0))
+        self.assertEqual([bool(buttons[0].winfo_manager()) for labels, buttons in self.table.rows], [True, True, False, False, False])
+
+    def test_buttons_act_on_the_shown_record(self):
+        self.table.set_rows(self.records)
+        self.table.scroll("scroll", 10, "units")
+        self.table.rows[2][1][0].invoke()
+        self.assertEqual(self.clicked, [self.records[12]])
+
+    def test_changed_record_redrawn_if_visible(self):
+        self.table.set_rows(self.records)
+        self.table.scroll("scroll", 10, "units")
+        self.records[11] = {"id": 11, "name": "renamed"} # another object with the same key
+        self.table.update_record(self.records[11])
+        self.assertEqual(self.shown()[1], "renamed")
+
+        self.records[50]["name"] = "hidden"
+        self.table.update_record(self.records[50])
+        self.assertEqual(self.shown(), self.expected(10))
+
+    def test_inserted_record_keeps_the_viewport(self):
+        self.table.set_rows(self.records)
+        self.table.scroll("scroll", 10, "units")
+        self.table.insert_record({"id": 100, "name": "above"}, 0)
+        self.assertEqual(self.table.offset, 11)
+        self.assertEqual(self.shown(), self.expected(11))
+        self.table.insert_record({"id": 101, "name": "inside"}, 13)
+        self.assertEqual(self.shown()[2], "inside")
+        self.table.insert_record({"id": 102, "name": "at the end"})
+        self.assertEqual(self.shown(), self.expected(11))
+        self.assertEqual(len(self.table.records), 103)
+
+    def test_removed_record_keeps_the_viewport(self):
+        self.table.set_rows(self.records)
+        self.table.scroll("scroll", 10, "units")
+        self.table.remove_record({"id": 2})
+        self.assertEqual(self.table.offset, 9)
+        self.assertEqual(self.shown(), self.expected(9))
+        self.table.remove_record({"id": 12})
+        self.assertEqual(self.shown(), self.expected(9))
+        self.table.remove_record({"id": 1000}) # not in the table
+        self.assertEqual(len(self.table.records), 98)
+
+        self.table.scroll("moveto", "1.0")
+        self.table.remove_record(self.records[-1]) # the viewport moves up to stay full
+        self.assertEqual(self.shown(), self.expected(len(self.records) - VISIBLE_ROWS))
+
+    def test_lazy_records_read_again(self):
+        records = LazyRecords(self.records)
+        self.table.set_rows(records)
+        self.table.scroll("moveto", "1.0")
+        del self.records[-10:] # changed by the store
+        self.table.update_record(self.records[0])
+        self.assertEqual(records.refreshes, 1)
+        self.assertEqual(self.table.offset, len(self.records) - VISIBLE_ROWS)
+        self.assertEqual(self.shown(), self.expected(len(self.records) - VISIBLE_ROWS))
+        for change in (self.table.insert_record, self.table.remove_record):
+            change(self.records[0])
+        self.table.update_records()
+        self.assertEqual(records.refreshes, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,20 @@
 /** \file tsp.c
 
  \brief Traveling Salesman Problem script in C.
- \brief Has to be compiled with the following command in order to use it: gcc -fPIC -shared -o tsp.o tsp.c
+ \brief Has to be compiled as a shared library named for the platform (route.py loads the one of the running platform, next to it):
+ \brief - Windows (MinGW): gcc -O2 -shared -o tsp.dll tsp.c
+ \brief - Linux: gcc -O2 -fPIC -shared -o libtsp.so tsp.c -lm
+ \brief - macOS: gcc -O2 -fPIC -shared -o libtsp.dylib tsp.c
+ \brief The functions keep no global state: the coordinates are read from the caller's buffer and the results are written in the caller's buffers, so they can be called from several threads at once.
+ \brief Builds a closest neighbor tour using a spatial grid, then improves it with 2-opt and Or-opt moves until no move is found or the time budget is spent.
+ \brief Every buffer is sized from the number of nodes, there is no limit on the number of stations.
+ \brief For small sets of stations, an exact branch and bound solver explores the tours starting with a given station, so that the python side can run one call per core.
 
  \section libraries_main Libraries
  - <stdio.h>
+ - <stdlib.h>
  - <math.h>
+ - <time.h>
 
  \author Vincent Gonnet
 
@@ -13,102 +22,820 @@
 */
 
 #include <stdio.h>
+#include <stdlib.h>
 #include <math.h>
+#include <time.h>
 
-int costMatrix[50][50]; ///< The cost matrix.
-int completed[50];      ///< Already visited nodes
-int nbNodes;            ///< Number of nodes
-int minCost;            ///< Minimum cost
-int result[50];         ///< Result array
-int resultIteration;    ///< Index of the node being added to the result array
+#define NB_CANDIDATES 8 ///< Number of closest neighbors considered by the improvement moves
+#define EPSILON 1e-9    ///< Minimum gain for a move to be applied
 
-/** \brief Function to calculate the closest node to the current node
- * \param indexNode The current node
+/** \brief Spatial grid used to find the closest nodes without a cost matrix */
+typedef struct
+{
+    int size;          ///< Number of cells per side
+    double minX;       ///< Smallest x coordinate
+    double minY;       ///< Smallest y coordinate
+    double cellWidth;  ///< Width of a cell
+    double cellHeight; ///< Height of a cell
+    int *cellStart;    ///< Index of the first item of each cell in items
+    int *cellCount;    ///< Number of items still present in each cell
+    int *items;        ///< Nodes sorted by cell
+    int *itemIndex;    ///< Index of each node in items
+    int *nodeCell;     ///< Cell of each node
+} Grid;
+
+/** \brief Data of a solving run */
+typedef struct
+{
+    int nbNodes;      ///< Number of nodes
+    const double *coords; ///< Coordinates of the nodes (x, y), owned by the caller
+    int *tour;        ///< Nodes by visit order
+    int *position;    ///< Position of each node in the tour
+    int *candidates;  ///< Closest neighbors of each node (NB_CANDIDATES per node, -1 if there are fewer nodes)
+    int *buffer;      ///< Temporary tour used by the Or-opt moves
+    int *queue;       ///< Nodes waiting to be improved (circular queue)
+    char *queued;     ///< Whether each node is in the queue
+    int head;         ///< Index of the next node to improve in the queue
+    int tail;         ///< Index where the next node is added to the queue
+    int waiting;      ///< Number of nodes in the queue
+    double deadline;  ///< Wall-clock time at which the improvement phase stops
+} Solver;
+
+/** \brief Wall-clock time in seconds (the CPU time given by clock() would add up the time of every thread) */
+static double now(void)
+{
+    struct timespec ts;
+    timespec_get(&ts, TIME_UTC);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+/** \brief Distance between two nodes
+ * \param solver The solver data
+ * \param a The first node
+ * \param b The second node
+ */
+static double distance(const Solver *solver, int a, int b)
+{
+    double dx = solver->coords[2 * a] - solver->coords[2 * b];
+    double dy = solver->coords[2 * a + 1] - solver->coords[2 * b + 1];
+    return sqrt(dx * dx + dy * dy);
+}
+
+/** \brief Cell coordinate of a value, clamped to the grid
+ * \param value The coordinate
+ * \param min The smallest coordinate of the grid
+ * \param cellSize The size of a cell
+ * \param size The number of cells per side
  */
-int closest(int indexNode)
+static int cellCoordinate(double value, double min, double cellSize, int size)
 {
-    int nextNode = 999;   // by default, there is no next node
-    int lowestCost = 999; // by default, there is no minimum, the value is very high so that it will be replaced by the first iteration
+    int cell = (int)((value - min) / cellSize);
+    if (cell < 0)
+        return 0;
+    if (cell >= size)
+        return size - 1;
+    return cell;
+}
 
-    for (int i = 0; i < nbNodes; i++)
+/** \brief Build the spatial grid, with about two nodes per cell
+ * \param grid The grid to build
+ * \param solver The solver data
+ */
+static int buildGrid(Grid *grid, const Solver *solver)
+{
+    int n = solver->nbNodes;
+    double maxX = solver->coords[2 * 0], maxY = solver->coords[2 * 0 + 1];
+
+    grid->minX = solver->coords[2 * 0];
+    grid->minY = solver->coords[2 * 0 + 1];
+    for (int i = 1; i < n; i++)
     {
-        if ((costMatrix[indexNode][i] != 0) && (completed[i] == 0)) // if the node is not already visited and if the cost is not 0 (there is a connection)
+        if (solver->coords[2 * i] < grid->minX) grid->minX = solver->coords[2 * i];
+        if (solver->coords[2 * i + 1] < grid->minY) grid->minY = solver->coords[2 * i + 1];
+        if (solver->coords[2 * i] > maxX) maxX = solver->coords[2 * i];
+        if (solver->coords[2 * i + 1] > maxY) maxY = solver->coords[2 * i + 1];
+    }
+
+    grid->size = (int)ceil(sqrt(n / 2.0));
+    if (grid->size < 1)
+        grid->size = 1;
+    grid->cellWidth = (maxX - grid->minX) / grid->size;
+    grid->cellHeight = (maxY - grid->minY) / grid->size;
+    if (grid->cellWidth <= 0) grid->cellWidth = 1;
+    if (grid->cellHeight <= 0) grid->cellHeight = 1;
+
+    int nbCells = grid->size * grid->size;
+    grid->cellStart = calloc(nbCells + 1, sizeof(int));
+    grid->cellCount = calloc(nbCells, sizeof(int));
+    grid->items = malloc(n * sizeof(int));
+    grid->itemIndex = malloc(n * sizeof(int));
+    grid->nodeCell = malloc(n * sizeof(int));
+    if (!grid->cellStart || !grid->cellCount || !grid->items || !grid->itemIndex || !grid->nodeCell)
+        return 0;
+
+    // counting sort of the nodes by cell
+    for (int i = 0; i < n; i++)
+    {
+        int cx = cellCoordinate(solver->coords[2 * i], grid->minX, grid->cellWidth, grid->size);
+        int cy = cellCoordinate(solver->coords[2 * i + 1], grid->minY, grid->cellHeight, grid->size);
+        grid->nodeCell[i] = cy * grid->size + cx;
+        grid->cellCount[grid->nodeCell[i]]++;
+    }
+    for (int c = 0; c < nbCells; c++)
+        grid->cellStart[c + 1] = grid->cellStart[c] + grid->cellCount[c];
+    for (int c = 0; c < nbCells; c++)
+        grid->cellCount[c] = 0;
+    for (int i = 0; i < n; i++)
+    {
+        int c = grid->nodeCell[i];
+        grid->itemIndex[i] = grid->cellStart[c] + grid->cellCount[c];
+        grid->items[grid->itemIndex[i]] = i;
+        grid->cellCount[c]++;
+    }
 
-            if (costMatrix[indexNode][i] < lowestCost) // if the cost is lower than the current minimum
+    return 1;
+}
+
+/** \brief Free the grid buffers
+ * \param grid The grid
+ */
+static void freeGrid(Grid *grid)
+{
+    free(grid->cellStart);
+    free(grid->cellCount);
+    free(grid->items);
+    free(grid->itemIndex);
+    free(grid->nodeCell);
+}
+
+/** \brief Remove a node from the grid (the node has been visited)
+ * \param grid The grid
+ * \param node The node to remove
+ */
+static void removeFromGrid(Grid *grid, int node)
+{
+    int c = grid->nodeCell[node];
+    int last = grid->cellStart[c] + grid->cellCount[c] - 1;
+    int index = grid->itemIndex[node];
+    int lastNode = grid->items[last];
+
+    // swap the node with the last node of the cell, then shrink the cell
+    grid->items[index] = lastNode;
+    grid->itemIndex[lastNode] = index;
+    grid->items[last] = node;
+    grid->itemIndex[node] = last;
+    grid->cellCount[c]--;
+}
+
+/** \brief Find the closest nodes still present in the grid, scanning rings of cells around the node
+ * \param grid The grid
+ * \param solver The solver data
+ * \param node The current node (never returned)
+ * \param k The number of nodes to find
+ * \param found Output array of the k closest nodes, sorted by distance (-1 if there are fewer nodes)
+ */
+static void closestNodes(const Grid *grid, const Solver *solver, int node, int k, int *found)
+{
+    double foundCost[NB_CANDIDATES];
+    int nbFound = 0;
+    int cx = grid->nodeCell[node] % grid->size;
+    int cy = grid->nodeCell[node] / grid->size;
+    double cellMin = grid->cellWidth < grid->cellHeight ? grid->cellWidth : grid->cellHeight;
+
+    for (int r = 0; r < grid->size; r++)
+    {
+        for (int y = cy - r; y <= cy + r; y++)
+        {
+            if (y < 0 || y >= grid->size)
+                continue;
+            int step = (y == cy - r || y == cy + r) ? 1 : 2 * r; // only the border of the ring
+            for (int x = cx - r; x <= cx + r; x += (step > 0 ? step : 1))
             {
-                lowestCost = costMatrix[indexNode][i]; // update the minimum
-                nextNode = i;                          // update the next node
+                if (x < 0 || x >= grid->size)
+                    continue;
+                int c = y * grid->size + x;
+                for (int i = grid->cellStart[c]; i < grid->cellStart[c] + grid->cellCount[c]; i++)
+                {
+                    int other = grid->items[i];
+                    if (other == node)
+                        continue;
+                    double cost = distance(solver, node, other);
+                    if (nbFound == k && cost >= foundCost[k - 1])
+                        continue;
+
+                    // insertion in the sorted list of the closest nodes
+                    int j = nbFound < k ? nbFound++ : k - 1;
+                    while (j > 0 && foundCost[j - 1] > cost)
+                    {
+                        foundCost[j] = foundCost[j - 1];
+                        found[j] = found[j - 1];
+                        j--;
+                    }
+                    foundCost[j] = cost;
+                    found[j] = other;
+                }
             }
+        }
+
+        // every node outside the scanned rings is at least r cells away
+        if (nbFound == k && foundCost[k - 1] <= r * cellMin)
+            break;
     }
 
-    if (lowestCost != 999)     // if there is a next node
-        minCost += lowestCost; // add the cost of the connection to the global cost
+    for (int i = nbFound; i < k; i++)
+        found[i] = -1;
+}
+
+/** \brief Build the closest neighbor tour starting from the warehouse (node 0)
+ * \param grid The grid, emptied by the function
+ * \param solver The solver data
+ */
+static void closestNeighborTour(Grid *grid, Solver *solver)
+{
+    int current = 0;
+    removeFromGrid(grid, current);
 
-    return nextNode; // return the next node
+    for (int i = 0; i < solver->nbNodes; i++)
+    {
+        solver->tour[i] = current;
+        solver->position[current] = i;
+        if (i == solver->nbNodes - 1)
+            break;
+
+        int next;
+        closestNodes(grid, solver, current, 1, &next);
+        removeFromGrid(grid, next);
+        current = next;
+    }
+}
+
+/** \brief Add a node to the improvement queue */
+static void push(Solver *solver, int node)
+{
+    if (solver->queued[node])
+        return;
+    solver->queued[node] = 1;
+    solver->queue[solver->tail] = node;
+    solver->tail = (solver->tail + 1) % solver->nbNodes;
+    solver->waiting++;
+}
+
+/** \brief Take the next node out of the improvement queue */
+static int pop(Solver *solver)
+{
+    int node = solver->queue[solver->head];
+    solver->head = (solver->head + 1) % solver->nbNodes;
+    solver->queued[node] = 0;
+    solver->waiting--;
+    return node;
+}
+
+/** \brief Node following a node in the tour */
+static int next(const Solver *solver, int node)
+{
+    return solver->tour[(solver->position[node] + 1) % solver->nbNodes];
 }
 
-/** \brief Recursive function that calculates the shortest path to visit all the nodes, as well as the minimum cost of the path
- * \param indexNode The current node
+/** \brief Node preceding a node in the tour */
+static int previous(const Solver *solver, int node)
+{
+    return solver->tour[(solver->position[node] + solver->nbNodes - 1) % solver->nbNodes];
+}
+
+/** \brief Reverse the part of the tour going from position i to position j (the shortest side of the cycle is reversed)
+ * \param solver The solver data
+ * \param i The first position
+ * \param j The last position
  */
-void recursiveSolver(int indexNode)
+static void reverse(Solver *solver, int i, int j)
 {
-    int nextNode; // index of the next node to visit
+    int n = solver->nbNodes;
+    int length = ((j - i + n) % n) + 1;
 
-    completed[indexNode] = 1; // mark the current node as visited
+    if (2 * length > n) // reversing the other side of the cycle gives the same tour
+    {
+        int newI = (j + 1) % n;
+        j = (i + n - 1) % n;
+        i = newI;
+        length = n - length;
+    }
 
-    result[resultIteration++] = indexNode + 1; // add the next node id to the result array
+    for (int k = 0; k < length / 2; k++)
+    {
+        int a = solver->tour[i], b = solver->tour[j];
+        solver->tour[i] = b;
+        solver->position[b] = i;
+        solver->tour[j] = a;
+        solver->position[a] = j;
+        i = (i + 1) % n;
+        j = (j + n - 1) % n;
+    }
+}
 
-    nextNode = closest(indexNode); // determine the next node to visit using the least function
+/** \brief Try the 2-opt moves around a node, applying the first improving one
+ * \param solver The solver data
+ * \param a The node
+ */
+static int twoOpt(Solver *solver, int a)
+{
+    for (int direction = 0; direction < 2; direction++)
+    {
+        int b = direction == 0 ? next(solver, a) : previous(solver, a);
+        double removed = distance(solver, a, b);
 
-    if (nextNode == 999) // if there is no next node, we have visited all the nodes, so we return to the warehouse and stop the function
+        for (int k = 0; k < NB_CANDIDATES; k++)
+        {
+            int c = solver->candidates[a * NB_CANDIDATES + k];
+            if (c < 0)
+                break;
+            double added = distance(solver, a, c);
+            if (added >= removed) // the candidates are sorted, no other one can improve the tour
+                break;
+
+            int d = direction == 0 ? next(solver, c) : previous(solver, c);
+            if (c == b || d == a)
+                continue;
+
+            double gain = removed + distance(solver, c, d) - added - distance(solver, b, d);
+            if (gain > EPSILON)
+            {
+                if (direction == 0) // a b ... c d  ->  a c ... b d
+                    reverse(solver, solver->position[b], solver->position[c]);
+                else // d c ... b a  ->  d b ... c a
+                    reverse(solver, solver->position[c], solver->position[b]);
+
+                push(solver, a);
+                push(solver, b);
+                push(solver, c);
+                push(solver, d);
+                return 1;
+            }
+        }
+    }
+    return 0;
+}
+
+/** \brief Try to move the segment of 1 to 3 nodes starting at a node between two other nodes, applying the first improving move
+ * \param solver The solver data
+ * \param first The first node of the segment
+ */
+static int orOpt(Solver *solver, int first)
+{
+    int n = solver->nbNodes;
+
+    for (int length = 1; length <= 3 && length <= n - 3; length++)
     {
-        nextNode = 0; // set the next node to the warehouse
+        int start = solver->position[first];
+        int last = solver->tour[(start + length - 1) % n];
+        int before = previous(solver, first);
+        int after = next(solver, last);
+        double removalGain = distance(solver, before, first) + distance(solver, last, after) - distance(solver, before, after);
+
+        if (removalGain <= EPSILON)
+            continue;
+
+        for (int end = 0; end < 2; end++)
+        {
+            int endNode = end == 0 ? first : last;
+            for (int k = 0; k < NB_CANDIDATES; k++)
+            {
+                int c = solver->candidates[endNode * NB_CANDIDATES + k];
+                if (c < 0)
+                    break;
+                if (distance(solver, endNode, c) >= removalGain)
+                    break;
 
-        minCost += costMatrix[indexNode][nextNode]; // add the cost of the path to the warehouse
+                // c must be outside of the segment, and the segment must not go back to its place
+                int offset = (solver->position[c] - start + n) % n;
+                if (offset < length || c == before)
+                    continue;
 
-        return; // stop the function
+                int cNext = next(solver, c);
+                double straight = distance(solver, c, first) + distance(solver, last, cNext);
+                double reversed = distance(solver, c, last) + distance(solver, first, cNext);
+                double insertion = (straight < reversed ? straight : reversed) - distance(solver, c, cNext);
+
+                if (removalGain - insertion > EPSILON)
+                {
+                    // rebuild the tour: the nodes from after to c, the segment, then the nodes from cNext to before
+                    int count = 0;
+                    for (int node = after;; node = next(solver, node))
+                    {
+                        solver->buffer[count++] = node;
+                        if (node == c)
+                            break;
+                    }
+                    for (int i = 0; i < length; i++)
+                        solver->buffer[count++] = straight < reversed ? solver->tour[(start + i) % n] : solver->tour[(start + length - 1 - i) % n];
+                    for (int node = cNext; node != first; node = next(solver, node))
+                        solver->buffer[count++] = node;
+
+                    for (int i = 0; i < n; i++)
+                    {
+                        solver->tour[i] = solver->buffer[i];
+                        solver->position[solver->buffer[i]] = i;
+                    }
+
+                    push(solver, before);
+                    push(solver, after);
+                    push(solver, first);
+                    push(solver, last);
+                    push(solver, c);
+                    push(solver, cNext);
+                    return 1;
+                }
+            }
+        }
     }
+    return 0;
+}
+
+/** \brief Improve the tour with 2-opt and Or-opt moves until no move is found or the time budget is spent
+ * \param solver The solver data
+ */
+static void improve(Solver *solver)
+{
+    long iterations = 0;
+
+    if (solver->nbNodes < 5)
+        return;
+
+    // every node has to be checked at least once
+    for (int i = 0; i < solver->nbNodes; i++)
+        push(solver, solver->tour[i]);
+
+    while (solver->waiting > 0)
+    {
+        int node = pop(solver);
+        while (twoOpt(solver, node) || orOpt(solver, node))
+        {
+            if ((++iterations & 63) == 0 && now() > solver->deadline)
+                return;
+        }
+        if ((++iterations & 63) == 0 && now() > solver->deadline)
+            return;
+    }
+}
+
+/** \brief Free the solver buffers
+ * \param solver The solver data
+ */
+static void freeSolver(Solver *solver)
+{
+    free(solver->tour);
+    free(solver->position);
+    free(solver->candidates);
+    free(solver->buffer);
+    free(solver->queue);
+    free(solver->queued);
+}
+
+/** \brief Build (or take) a tour and improve it, shared by tspSolve and tspImprove
+ * \param nbNodes The number of nodes
+ * \param coords[] The coordinates of the nodes (x, y), the first node being the warehouse
+ * \param seconds The time budget of the improvement phase, in seconds
+ * \param initial[] The tour to improve (every node once), or NULL to build the closest neighbor tour
+ * \param order[] Output array of nbNodes nodes, receives the visit order (node indexes, the warehouse first)
+ * \param cost Output, receives the cost of the tour (return to the warehouse included)
+ * \return The number of nodes written in order, -1 if the memory couldn't be allocated, -2 if the initial tour isn't valid
+ */
+static int runSolver(int nbNodes, const double coords[], double seconds, const int initial[], int order[], double *cost)
+{
+    Solver solver = {0};
+    Grid grid = {0};
+    int n = nbNodes;
+
+    *cost = 0;
+    if (n < 1)
+        return 0;
+
+    solver.nbNodes = n;
+    solver.coords = coords;
+    solver.deadline = now() + seconds;
+    solver.tour = malloc(n * sizeof(int));
+    solver.position = malloc(n * sizeof(int));
+    solver.candidates = malloc(n * NB_CANDIDATES * sizeof(int));
+    solver.buffer = malloc(n * sizeof(int));
+    solver.queue = malloc(n * sizeof(int));
+    solver.queued = calloc(n, sizeof(char));
+    if (!solver.tour || !solver.position || !solver.candidates || !solver.buffer || !solver.queue || !solver.queued)
+    {
+        freeSolver(&solver);
+        return -1;
+    }
+
+    if (initial) // check that the given tour visits every node once
+    {
+        for (int i = 0; i < n; i++)
+            solver.position[i] = -1;
+        for (int i = 0; i < n; i++)
+        {
+            if (initial[i] < 0 || initial[i] >= n || solver.position[initial[i]] != -1)
+            {
+                freeSolver(&solver);
+                return -2;
+            }
+            solver.tour[i] = initial[i];
+            solver.position[initial[i]] = i;
+        }
+    }
+
+    if (!buildGrid(&grid, &solver))
+    {
+        freeGrid(&grid);
+        freeSolver(&solver);
+        return -1;
+    }
+
+    // closest neighbors of every node, used by the improvement moves
+    for (int i = 0; i < n; i++)
+        closestNodes(&grid, &solver, i, NB_CANDIDATES, &solver.candidates[i * NB_CANDIDATES]);
+
+    if (!initial)
+        closestNeighborTour(&grid, &solver);
+    improve(&solver);
+
+    // the tour starts at the warehouse
+    int start = solver.position[0];
+    for (int i = 0; i < n; i++)
+    {
+        int node = solver.tour[(start + i) % n];
+        order[i] = node;
+        *cost += distance(&solver, node, solver.tour[(start + i + 1) % n]);
+    }
+
+    freeGrid(&grid);
+    freeSolver(&solver);
+    return n;
+}
+
+/** \brief Main function : Traveling Salesman Problem (closest neighbor improved by 2-opt and Or-opt), will be imported in python by ctypes
+ * \param nbNodes The number of nodes
+ * \param coords[] The coordinates of the nodes (x, y), the first node being the warehouse
+ * \param seconds The time budget of the improvement phase, in seconds
+ * \param order[] Output array of nbNodes nodes, receives the visit order (node indexes, the warehouse first)
+ * \param cost Output, receives the cost of the tour (return to the warehouse included)
+ * \return The number of nodes written in order, -1 if the memory couldn't be allocated
+ */
+int tspSolve(int nbNodes, const double coords[], double seconds, int order[], double *cost)
+{
+    return runSolver(nbNodes, coords, seconds, NULL, order, cost);
+}
+
+/** \brief Improve an existing tour with 2-opt and Or-opt moves (used to repair a cached tour after a few stations changed)
+ * \param nbNodes The number of nodes
+ * \param coords[] The coordinates of the nodes (x, y), the first node being the warehouse
+ * \param seconds The time budget of the improvement phase, in seconds
+ * \param order[] Input and output array of nbNodes nodes: the tour to improve, then the improved visit order (the warehouse first)
+ * \param cost Output, receives the cost of the tour (return to the warehouse included)
+ * \return The number of nodes written in order, -1 if the memory couldn't be allocated, -2 if the given tour isn't valid
+ */
+int tspImprove(int nbNodes, const double coords[], double seconds, int order[], double *cost)
+{
+    return runSolver(nbNodes, coords, seconds, order, order, cost);
+}
+
+/** \brief Data of an exact solving run */
+typedef struct
+{
+    int nbNodes;      ///< Number of nodes
+    double *cost;     ///< Dense cost matrix (only used for small sets of nodes)
+    int *path;        ///< Nodes of the current partial tour
+    char *visited;    ///< Whether each node is in the current partial tour
+    int *bestPath;    ///< Best tour found so far
+    double bestCost;  ///< Cost of the best tour found so far
+    int found;        ///< Whether a tour better than the initial upper bound has been found
+    double deadline;  ///< Wall-clock time at which the search stops
+    long explored;    ///< Number of explored partial tours
+    int timedOut;     ///< Whether the search has been stopped by the deadline
+    double *key;      ///< Buffer of the minimum spanning tree computation
+    int *remaining;   ///< Buffer of the minimum spanning tree computation
+} Exact;
+
+/** \brief Cost of a minimum spanning tree over the given nodes (Prim), lower bound of any path through them
+ * \param exact The exact solving data
+ * \param nodes The nodes
+ * \param count The number of nodes
+ */
+static double spanningTree(const Exact *exact, const int *nodes, int count)
+{
+    double *key = exact->key;
+    double total = 0;
+    size_t n = exact->nbNodes;
+
+    for (int i = 0; i < count; i++)
+        key[i] = INFINITY;
+    key[0] = 0;
+
+    int *remaining = exact->remaining;
+    for (int i = 0; i < count; i++)
+        remaining[i] = nodes[i];
+
+    for (int left = count; left > 0; left--)
+    {
+        // take the closest node to the tree
+        int best = 0;
+        for (int i = 1; i < left; i++)
+            if (key[i] < key[best])
+                best = i;
+        int node = remaining[best];
+        total += key[best];
+        remaining[best] = remaining[left - 1];
+        key[best] = key[left - 1];
 
-    recursiveSolver(nextNode); // call the function again with the next node
+        for (int i = 0; i < left - 1; i++)
+        {
+            double c = exact->cost[node * n + remaining[i]];
+            if (c < key[i])
+                key[i] = c;
+        }
+    }
+    return total;
 }
 
-/** \brief Main function : Traveling Salesman Problem (closest neighbor), will be imported in python by ctypes
- * \param lenght The length of the coordinates array
- * \param rawNodes[] The coordinates array
+/** \brief Depth-first branch and bound, extending the current partial tour
+ * \param exact The exact solving data
+ * \param depth The number of nodes in the partial tour
+ * \param pathCost The cost of the partial tour
  */
-int *tsp(int length, int rawNodes[])
+static void branch(Exact *exact, int depth, double pathCost)
 {
-    // reset variables (needed in case of multiple calls)
-    resultIteration = 0; // Index of the current node being added to the visit order.
-    minCost = 0;         // Minimum cost for the complete travel.
+    int n = exact->nbNodes;
+    size_t row = (size_t)exact->path[depth - 1] * n; // row of the current node in the cost matrix
+    int current = exact->path[depth - 1];
 
-    nbNodes = length / 2; // Brief Number of nodes.
+    exact->explored++;
+    if (now() > exact->deadline) // checked before every bound, which costs O(n^2)
+        exact->timedOut = 1;
+    if (exact->timedOut)
+        return;
 
-    int node[nbNodes][2];
+    if (depth == n) // complete tour, return to the warehouse
+    {
+        double total = pathCost + exact->cost[row];
+        if (total < exact->bestCost - EPSILON)
+        {
+            exact->bestCost = total;
+            exact->found = 1;
+            for (int i = 0; i < n; i++)
+                exact->bestPath[i] = exact->path[i];
+        }
+        return;
+    }
+
+    // lower bound: the rest of the tour links the current node, the unvisited nodes and the warehouse
+    int *bound = exact->path + n; // second half of the buffer
+    int count = 0;
+    bound[count++] = current;
+    bound[count++] = 0;
+    for (int i = 1; i < n; i++)
+        if (!exact->visited[i])
+            bound[count++] = i;
+    if (pathCost + spanningTree(exact, bound, count) >= exact->bestCost - EPSILON)
+        return;
 
-    // seeding the node array
-    for (int i = 0; i < (nbNodes); i++)
+    // visit the closest nodes first, they usually lead to the best tours
+    int *children = exact->path + 2 * (size_t)n + (size_t)depth * n;
+    int nbChildren = 0;
+    for (int i = 1; i < n; i++)
     {
-        node[i][0] = rawNodes[i * 2];
-        node[i][1] = rawNodes[(i * 2) + 1];
+        if (exact->visited[i])
+            continue;
+        int j = nbChildren++;
+        while (j > 0 && exact->cost[row + children[j - 1]] > exact->cost[row + i])
+        {
+            children[j] = children[j - 1];
+            j--;
+        }
+        children[j] = i;
     }
 
-    // nothing is completed yet
-    for (int i = 0; i < nbNodes; i++)
+    for (int k = 0; k < nbChildren; k++)
     {
-        completed[i] = 0;
+        int child = children[k];
+        double childCost = pathCost + exact->cost[row + child];
+        if (childCost >= exact->bestCost - EPSILON)
+            continue;
+        exact->visited[child] = 1;
+        exact->path[depth] = child;
+        branch(exact, depth + 1, childCost);
+        exact->visited[child] = 0;
+        if (exact->timedOut)
+            return;
     }
+}
 
-    // generating a cost matrix :
-    for (int i = 0; i < nbNodes; i++)
+/** \brief Exact solver (branch and bound) exploring the tours that go from the warehouse to a given first node. Reentrant, can be called from several threads at once.
+ * \param nbNodes The number of nodes
+ * \param coords[] The coordinates of the nodes (x, y), the first node being the warehouse
+ * \param firstNode The node visited right after the warehouse (node index, from 1)
+ * \param upperBound Cost of a known tour, only the better tours are searched
+ * \param seconds The time budget of the search, in seconds
+ * \param order[] Output array of nbNodes nodes, receives the visit order (node indexes, the warehouse first) if a better tour is found
+ * \param cost Output, receives the cost of the best tour found (the upper bound if no better tour is found)
+ * \return 1 if the search is complete (the result is optimal for this first node), 0 if the time budget has been spent, -1 if the memory couldn't be allocated
+ */
+int tspExact(int nbNodes, const double coords[], int firstNode, double upperBound, double seconds, int order[], double *cost)
+{
+    Exact exact = {0};
+    size_t n = nbNodes;
+
+    *cost = upperBound;
+    if (nbNodes < 2 || firstNode < 1 || firstNode >= nbNodes)
+        return 1;
+
+    exact.nbNodes = nbNodes;
+    exact.bestCost = upperBound;
+    exact.deadline = now() + seconds;
+    exact.cost = malloc(n * n * sizeof(double));
+    exact.path = malloc((2 * n + n * n) * sizeof(int)); // partial tour, bound nodes, children of each depth
+    exact.visited = calloc(n, sizeof(char));
+    exact.bestPath = malloc(n * sizeof(int));
+    exact.key = malloc(n * sizeof(double));
+    exact.remaining = malloc(n * sizeof(int));
+    if (!exact.cost || !exact.path || !exact.visited || !exact.bestPath || !exact.key || !exact.remaining)
     {
-        for (int j = 0; j < nbNodes; j++)
+        free(exact.cost); free(exact.path); free(exact.visited); free(exact.bestPath); free(exact.key); free(exact.remaining);
+        return -1;
+    }
+
+    // the sets are small, a dense cost matrix is the fastest option
+    for (size_t i = 0; i < n; i++)
+        for (size_t j = 0; j < n; j++)
         {
-            costMatrix[i][j] = sqrt(((node[j][0] - node[i][0]) * (node[j][0] - node[i][0])) + ((node[j][1] - node[i][1]) * (node[j][1] - node[i][1])));
+            double dx = coords[i * 2] - coords[j * 2];
+            double dy = coords[i * 2 + 1] - coords[j * 2 + 1];
+            exact.cost[i * n + j] = sqrt(dx * dx + dy * dy);
         }
+
+    exact.path[0] = 0;
+    exact.path[1] = firstNode;
+    exact.visited[0] = 1;
+    exact.visited[firstNode] = 1;
+    branch(&exact, 2, exact.cost[firstNode]);
+
+    *cost = exact.bestCost;
+    if (exact.found)
+        for (size_t i = 0; i < n; i++)
+            order[i] = exact.bestPath[i];
+
+    int complete = !exact.timedOut;
+    free(exact.cost); free(exact.path); free(exact.visited); free(exact.bestPath); free(exact.key); free(exact.remaining);
+    return complete;
+}
+
+/** \brief Lower bound of the cost of any tour: cost of a minimum spanning tree over every node (Prim, no cost matrix, quadratic time).
+ * \param nbNodes The number of nodes
+ * \param coords[] The coordinates of the nodes (x, y), the first node being the warehouse
+ * \param seconds The time budget of the computation, in seconds
+ * \return The lower bound, -1 if the memory couldn't be allocated, -2 if the time budget was spent first
+ */
+double tspLowerBound(int nbNodes, const double coords[], double seconds)
+{
+    int n = nbNodes;
+    double deadline = now() + seconds;
+    double total = 0;
+    double *key = malloc(n * sizeof(double));
+    char *inTree = calloc(n, sizeof(char));
+    if (!key || !inTree)
+    {
+        free(key);
+        free(inTree);
+        return -1;
     }
 
-    recursiveSolver(0); // calling the recursive function
+    for (int i = 0; i < n; i++)
+        key[i] = INFINITY;
+    if (n > 0)
+        key[0] = 0;
+
+    for (int added = 0; added < n; added++)
+    {
+        if ((added & 63) == 63 && now() > deadline) // each step costs O(n)
+        {
+            total = -2;
+            break;
+        }
+        int best = -1;
+        for (int i = 0; i < n; i++)
+            if (!inTree[i] && (best < 0 || key[i] < key[best]))
+                best = i;
+        inTree[best] = 1;
+        total += key[best];
+
+        for (int i = 0; i < n; i++)
+        {
+            if (inTree[i])
+                continue;
+            double dx = coords[best * 2] - coords[i * 2];
+            double dy = coords[best * 2 + 1] - coords[i * 2 + 1];
+            double c = sqrt(dx * dx + dy * dy);
+            if (c < key[i])
+                key[i] = c;
+        }
+    }
 
-    return result;
+    free(key);
+    free(inTree);
+    return total;
 }
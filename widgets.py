@@ -0,0 +1,296 @@
+## @file widgets.py
+#
+# @brief Reusable tkinter widgets for the application.
+# @brief Contains a virtualized table that only creates the widgets of the visible rows and recycles them while scrolling.
+# @brief The table can be patched record by record, redrawing only the rows that are visible.
+# @brief Also contains the status indicator of the background tasks, and the loading of the icons: an icon is resized once and
+# @brief cached on disk, then read by tkinter directly, so that pillow isn't imported at startup.
+#
+# @section libraries_widgets Libraries/Modules
+# - tkinter
+# - os
+# - pillow (PIL) (only to resize an icon that isn't cached)
+#
+# @author Vincent Gonnet
+#
+# @date 2022/06/10
+
+from tkinter import ttk
+import tkinter as tk
+import os
+
+## @brief Directory of the resized icons
+ICON_CACHE = "img/cache/"
+
+
+## @brief load an icon at a given size, resized once then read from the cache (resized again if the image is modified)
+# @param path Path of the image
+# @param size (width, height) of the icon
+# @param cache_directory Directory of the resized icons
+# @return The tkinter image
+def load_icon(path, size, cache_directory=ICON_CACHE):
+    name = os.path.splitext(os.path.basename(path))[0]
+    cached_path = os.path.join(cache_directory, f"{name}-{size[0]}x{size[1]}.png")
+    try:
+        if not os.path.exists(cached_path) or os.path.getmtime(cached_path) < os.path.getmtime(path):
+            from PIL import Image
+            image = Image.open(path).resize(size, Image.LANCZOS)
+            os.makedirs(cache_directory, exist_ok=True)
+            image.save(cached_path + ".part", "PNG")
+            os.replace(cached_path + ".part", cached_path) # the cached icon only exists once complete
+        return tk.PhotoImage(file=cached_path)
+    except (OSError, tk.TclError): # the cache can't be written (or read by an old tkinter), the icon is resized in memory
+        from PIL import Image, ImageTk
+        return ImageTk.PhotoImage(Image.open(path).resize(size, Image.LANCZOS))
+
+
+class VirtualTable(ttk.Frame):
+
+    ## @brief initialize the table
+    # @param parent The parent widget
+    # @param headers The columns' titles
+    # @param format_row Function giving the texts of the columns of a record
+    # @param actions List of (image or text, callback) couples, one button per row and per action, the callback receives the record
+    # @param visible_rows Number of rows materialized in the viewport
+    # @param widths Width (in characters) of each column, so that the table doesn't resize while scrolling
+    # @param format_colors Optional function giving the text colors of the columns of a record
+    # @param key Optional function giving the identifier of a record, records are compared by identity otherwise
+    def __init__(self, parent, headers, format_row, actions=(), visible_rows=11, widths=None, format_colors=None, key=None):
+        ttk.Frame.__init__(self, parent)
+        ## @brief Function giving the texts of the columns of a record
+        self.format_row = format_row
+        ## @brief Function giving the text colors of the columns of a record (None for the default color)
+        self.format_colors = format_colors
+        ## @brief List of (image, callback) couples, one button per row and per action
+        self.actions = list(actions)
+        ## @brief Number of rows materialized in the viewport
+        self.visible_rows = visible_rows
+        ## @brief Function giving the identifier of a record (None to compare the records by identity)
+        self.key = key
+        ## @brief Records displayed by the table: a list, or a lazy sequence supporting len(), indexing and refresh()
+        self.records = []
+        ## @brief Index of the first record shown in the viewport
+        self.offset = 0
+
+        self.body = tk.Frame(self) # frame that holds the header and the recycled rows
+        self.body.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.scroll)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        if widths is None:
+            widths = [len(header) + 2 for header in headers]
+
+        for column, header in enumerate(headers): # create the headers
+            ttk.Label(self.body, text=header, width=widths[column], anchor="center").grid(row=0, column=column)
+
+        ## @brief Recycled widgets, one list of labels and one list of buttons per visible row
+        self.rows = []
+        for index in range(1, visible_rows + 1):
+            labels = []
+            for column in range(len(headers)):
+                label = ttk.Label(self.body, text="", width=widths[column], anchor="center")
+                label.grid(row=index, column=column)
+                labels.append(label)
+            buttons = []
+            for action_index, (image, callback) in enumerate(self.actions):
+                if isinstance(image, str): # text button
+                    button = ttk.Button(self.body, text=image)
+                else: # image button
+                    button = ttk.Button(self.body, text="", image=image)
+                button.grid(row=index, column=len(headers) + action_index, padx=5)
+                button.grid_remove() # hidden until a record is shown on this row
+                buttons.append(button)
+            self.rows.append((labels, buttons))
+
+        for widget in [self, self.body] + self.body.winfo_children(): # scroll with the mouse wheel anywhere in the table
+            widget.bind("<MouseWheel>", self.on_mousewheel)
+            widget.bind("<Button-4>", lambda event: self.scroll("scroll", -1, "units"))
+            widget.bind("<Button-5>", lambda event: self.scroll("scroll", 1, "units"))
+
+    ## @brief change the records displayed by the table and redraw the viewport
+    def set_rows(self, records):
+        self.records = records
+        self.offset = max(0, min(self.offset, len(records) - self.visible_rows))
+        self.redraw()
+
+    ## @brief redraw the visible rows only
+    def redraw(self):
+        for index in range(len(self.rows)):
+            self.redraw_row(index)
+        self.update_scrollbar()
+
+    ## @brief redraw one of the visible rows
+    def redraw_row(self, index):
+        labels, buttons = self.rows[index]
+        position = self.offset + index
+        if position < len(self.records):
+            record = self.records[position]
+            colors = self.format_colors(record) if self.format_colors is not None else [""] * len(labels)
+            for label, text, color in zip(labels, self.format_row(record), colors):
+                label.configure(text=text, foreground=color)
+            for button, (image, callback) in zip(buttons, self.actions):
+                button.configure(command=lambda callback=callback, record=record: callback(record))
+                button.grid()
+        else: # no record for this row, blank it
+            for label in labels:
+                label.configure(text="")
+            for button in buttons:
+                button.grid_remove()
+
+    ## @brief update the scrollbar position
+    def update_scrollbar(self):
+        if len(self.records) > 0:
+            first = self.offset / len(self.records)
+            last = min(1.0, (self.offset + self.visible_rows) / len(self.records))
+        else:
+            first, last = 0.0, 1.0
+        self.scrollbar.set(first, last)
+
+    ## @brief true if two records are the same
+    def same_record(self, first, second):
+        if self.key is None:
+            return first is second
+        return self.key(first) == self.key(second)
+
+    ## @brief true if the records are a lazy sequence, read again when they change
+    def is_lazy(self):
+        return not isinstance(self.records, list)
+
+    ## @brief read the lazy records again and redraw the viewport
+    def reload(self):
+        self.records.refresh()
+        self.offset = max(0, min(self.offset, len(self.records) - self.visible_rows))
+        self.redraw()
+
+    ## @brief position of a record in the table (None if it isn't displayed, lazy records are only searched in the viewport)
+    def position_of(self, record):
+        for index in range(self.offset, min(self.offset + self.visible_rows, len(self.records))): # look in the viewport first
+            if self.same_record(self.records[index], record):
+                return index
+        if self.is_lazy():
+            return None
+        for index, other in enumerate(self.records):
+            if self.same_record(other, record):
+                return index
+        return None
+
+    ## @brief redraw a record if it is visible (the record has been modified)
+    def update_record(self, record):
+        if self.is_lazy(): # the displayed copy is outdated
+            self.reload()
+            return
+        for index in range(self.offset, min(self.offset + self.visible_rows, len(self.records))):
+            if self.same_record(self.records[index], record):
+                self.redraw_row(index - self.offset)
+                return
+
+    ## @brief redraw the visible records (every record has been modified)
+    def update_records(self):
+        if self.is_lazy():
+            self.reload()
+        else:
+            self.redraw()
+
+    ## @brief add a record at the end of the table, or at a given position
+    def insert_record(self, record, position=None):
+        if self.is_lazy(): # the query places the record
+            self.reload()
+            return
+        if position is None:
+            position = len(self.records)
+        self.records.insert(position, record)
+
+        if position < self.offset: # the record is above the viewport, keep showing the same rows
+            self.offset += 1
+            self.update_scrollbar()
+        elif position < self.offset + self.visible_rows: # the record is in the viewport
+            self.redraw()
+        else:
+            self.update_scrollbar()
+
+    ## @brief remove a record from the table
+    def remove_record(self, record):
+        if self.is_lazy():
+            self.reload()
+            return
+        position = self.position_of(record)
+        if position is None:
+            return
+        del self.records[position]
+
+        if position < self.offset: # the record was above the viewport, keep showing the same rows
+            self.offset -= 1
+            self.update_scrollbar()
+        else:
+            self.offset = max(0, min(self.offset, len(self.records) - self.visible_rows))
+            self.redraw()
+
+    ## @brief scrollbar command, moving the viewport to a fraction or by units/pages
+    def scroll(self, action, amount=None, unit=None):
+        if action == "moveto":
+            offset = int(float(amount) * len(self.records))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            offset = self.offset + int(amount) * step
+        else:
+            return
+
+        offset = max(0, min(offset, len(self.records) - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.redraw()
+
+    ## @brief scroll the table with the mouse wheel (Windows / macOS)
+    def on_mousewheel(self, event):
+        self.scroll("scroll", -1 if event.delta > 0 else 1, "units")
+
+
+class TaskStatusBar(ttk.Frame):
+
+    ## @brief initialize the status indicator of the background tasks
+    # @param parent The parent widget
+    # @param scheduler The TaskScheduler whose tasks are displayed
+    def __init__(self, parent, scheduler):
+        ttk.Frame.__init__(self, parent)
+        self.scheduler = scheduler
+        self.columnconfigure(0, weight=1)
+
+        ## @brief Name of the running task
+        self.label = ttk.Label(self, text="Ready", anchor="w")
+        self.label.grid(row=0, column=0, sticky="ew")
+        ## @brief Progress of the running task, from 0 to 1
+        self.bar = ttk.Progressbar(self, orient="horizontal", length=150, mode="determinate", maximum=1.0)
+        self.bar.grid(row=0, column=1, padx=5)
+        ## @brief Button cancelling the pending tasks
+        self.cancel_button = ttk.Button(self, text="Cancel", command=scheduler.cancel_all)
+        self.cancel_button.grid(row=0, column=2)
+
+        scheduler.subscribe(self.update_status)
+        self.bind("<Destroy>", lambda event: scheduler.unsubscribe(self.update_status) if event.widget is self else None)
+
+    ## @brief display the pending tasks
+    def update_status(self, tasks):
+        if not tasks:
+            self.label.configure(text="Ready")
+            self.bar.grid_remove()
+            self.cancel_button.grid_remove()
+            return
+
+        task = tasks[0] # the running task
+        text = task.name
+        if len(tasks) > 1:
+            text += " (+" + str(len(tasks) - 1) + " waiting)"
+        self.label.configure(text=text)
+        if task.progress is None: # unknown progress
+            if str(self.bar["mode"]) != "indeterminate":
+                self.bar.configure(mode="indeterminate")
+                self.bar.start(20)
+        else:
+            if str(self.bar["mode"]) != "determinate":
+                self.bar.stop()
+                self.bar.configure(mode="determinate")
+            self.bar["value"] = task.progress
+        self.bar.grid()
+        self.cancel_button.grid()